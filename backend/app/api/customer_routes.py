@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, status
-from typing import List
+from fastapi import APIRouter, Depends, Query, status
+from typing import List, Optional
 from app.services import customer_service
 from app.models import customer_models
-from ..dependencies import get_db,get_current_user
+from ..dependencies import get_db,get_pos_db,get_current_user
 from app.models.pos_models import CheckoutRequest
 from app.models import customer_models
 from app.dependencies import get_db
 from app.models.common_models import PaginatedResponse
+from app.core import fieldsets
 
 router = APIRouter(
     prefix="/customers",
@@ -23,11 +24,29 @@ async def create_new_customer(customer: customer_models.CustomerCreate, db = Dep
     return new_customer
 
 @router.get("/", response_model=List[customer_models.CustomerResponse]) # <-- ADD THIS ENDPOINT
-async def get_all_customers_route(db = Depends(get_db)):
+async def get_all_customers_route(fields: Optional[str] = None, db = Depends(get_db)):
     """
-    Retrieves a list of all customers, sorted by name.
+    Retrieves a list of all customers, sorted by name. `fields` (comma-separated,
+    e.g. "name,contact") returns only those fields of each customer.
     """
-    return await customer_service.get_all_customers(db)
+    selected = fieldsets.parse(fields, customer_models.CustomerResponse)
+    customers = await customer_service.get_all_customers(db, selected)
+    if selected is None:
+        return customers
+    return fieldsets.respond(customers, List[fieldsets.partial_model(customer_models.CustomerResponse, tuple(selected))])
+
+@router.get("/search", response_model=PaginatedResponse[customer_models.CustomerResponse])
+async def search_customers_route(
+    q: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=100)
+):
+    """
+    Finds customers by name (words starting with those of `q`, e.g. "sit ra" for
+    "Sita Ram") or by phone number (any part of it, e.g. the last 4 digits), sorted
+    by name. Without `q`, pages through all customers.
+    """
+    return await customer_service.search_customers(q, limit, (page - 1) * limit)
 
 @router.get("/{customer_id}/ledger", response_model=List[customer_models.CustomerTransactionResponse])
 async def get_customer_ledger_route(customer_id: str, db = Depends(get_db)):
@@ -40,7 +59,7 @@ async def get_customer_ledger_route(customer_id: str, db = Depends(get_db)):
 async def add_credit_to_customer_route(
     customer_id: str,
     credit_data: customer_models.AddCreditRequest, # <-- USE THE NEW MODEL
-    db = Depends(get_db)
+    db = Depends(get_pos_db)
 ):
     """
     Adds items to a customer's credit tab.
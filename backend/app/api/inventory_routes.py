@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from app.services import product_service , batch_service 
-from app.models import product_models , batch_models 
-from ..dependencies import get_db,get_current_user
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from typing import List, Optional
+from app.services import product_service , batch_service , reorder_service, report_service
+from app.models import product_models , batch_models, report_models
+from app.models.common_models import PaginatedResponse
+from ..dependencies import get_db,get_current_user,copy_to_local_mirrors
+from app.core import config, fieldsets
 
 router = APIRouter(
     prefix="/inventory",
@@ -17,8 +19,26 @@ async def create_new_product(product: product_models.ProductCreate, db = Depends
     return await product_service.create_product(new_product_data, db)
 
 @router.get("/products", response_model=List[product_models.ProductResponse])
-async def get_all_products_route(db = Depends(get_db)):
-    return await product_service.get_all_products(db)
+async def get_all_products_route(fields: Optional[str] = None, db = Depends(get_db)):
+    """
+    Retrieves all products, sorted by name. `fields` (comma-separated, e.g.
+    "product_name,current_total_stock") returns only those fields of each product.
+    """
+    selected = fieldsets.parse(fields, product_models.ProductResponse)
+    products = await product_service.get_all_products(db, selected)
+    if selected is None:
+        return products
+    return fieldsets.respond(products, List[fieldsets.partial_model(product_models.ProductResponse, tuple(selected))])
+
+@router.post("/products/import", response_model=product_models.ProductImportResponse)
+async def import_products_route(file: UploadFile = File(...), db = Depends(get_db)):
+    """
+    Creates products in bulk from a CSV file with a header row. Required columns:
+    product_name, product_code; optional: tax_percentage, global_selling_price.
+    Rows whose code or name already exists (in the catalog or earlier in the file)
+    are skipped. Returns the outcome of every row.
+    """
+    return await product_service.import_products(file.file, db)
 
 # --- ADD THE SEARCH ENDPOINT HERE ---
 # It must come BEFORE the /products/{product_id} endpoint
@@ -31,6 +51,15 @@ async def search_products_route(query: str, db = Depends(get_db)):
     """
     return await product_service.search_products(query, db)
 
+@router.get("/reorder-suggestions", response_model=product_models.ReorderSuggestionsResponse)
+async def get_reorder_suggestions_route(db = Depends(get_db)):
+    """
+    Products whose stock won't last until a new delivery could arrive, based on
+    recent sales velocity and supplier lead time, grouped by the supplier of each
+    product's latest batch. Precomputed by a background job.
+    """
+    return await reorder_service.get_reorder_suggestions(db)
+
 # --- The GET endpoint with a path parameter comes AFTER search ---
 
 @router.get("/products/{product_id}", response_model=product_models.ProductResponse)
@@ -54,11 +83,17 @@ async def update_product_route(
 
 
 @router.get("/products/{product_id}/batches", response_model=List[batch_models.BatchResponse])
-async def get_product_batches_route(product_id: str, db = Depends(get_db)):
+async def get_product_batches_route(product_id: str, fields: Optional[str] = None, db = Depends(get_db)):
     """
-    Retrieves a list of all active batches for a specific product.
+    Retrieves a list of all active batches for a specific product. `fields`
+    (comma-separated, e.g. "quantity_in_stock,selling_price") returns only those
+    fields of each batch.
     """
-    return await batch_service.get_active_batches_for_product(product_id, db)
+    selected = fieldsets.parse(fields, batch_models.BatchResponse)
+    batches = await batch_service.get_active_batches_for_product(product_id, db, selected)
+    if selected is None:
+        return batches
+    return fieldsets.respond(batches, List[fieldsets.partial_model(batch_models.BatchResponse, tuple(selected))])
 
 @router.put("/batches/{batch_id}", response_model=batch_models.BatchResponse)
 async def update_batch_sp_route(
@@ -69,4 +104,31 @@ async def update_batch_sp_route(
     """
     Updates the selling price of a single inventory batch.
     """
-    return await batch_service.update_batch_sp(batch_id, sp_data.selling_price, db)
\ No newline at end of file
+    updated_batch = await batch_service.update_batch_sp(batch_id, sp_data.selling_price, db)
+    copy_to_local_mirrors(config.APPWRITE_COLLECTION_BATCHES_ID, [updated_batch])
+    return updated_batch
+
+@router.post("/batches/reprice", response_model=batch_models.BatchRepriceResponse)
+async def reprice_batches_route(reprice: batch_models.BatchRepriceRequest, db = Depends(get_db)):
+    """
+    Sets the selling price of many batches at once: a list of batch IDs, or all
+    active batches of a product. The price is either a fixed `selling_price` or
+    `markup_percentage` on top of each batch's cost price. Returns each batch's outcome.
+    """
+    return await batch_service.reprice_batches(
+        reprice.model_dump(), db,
+        on_updated=lambda batches: copy_to_local_mirrors(config.APPWRITE_COLLECTION_BATCHES_ID, batches)
+    )
+
+@router.get("/batches/{batch_id}/sales", response_model=PaginatedResponse[report_models.SaleContainingItem])
+async def get_batch_sales_route(
+    batch_id: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=100),
+    db = Depends(get_db)
+):
+    """
+    The sales that contain a batch (e.g. to trace a recalled batch to its bills),
+    newest first, with the quantity sold in each. Served from the sales index.
+    """
+    return await report_service.get_sales_containing("batch", batch_id, limit, (page - 1) * limit, db)
\ No newline at end of file
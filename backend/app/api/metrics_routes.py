@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends
+from app.core import singleflight, retry, admission, report_cache, search_index, unique_index
+from app.core.scheduler import scheduler
+from ..dependencies import get_current_user, report_db_provider
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    dependencies=[Depends(get_current_user)]
+)
+
+@router.get("/data-access")
+async def get_data_access_metrics():
+    """
+    Returns counters from the data-access layer: reads saved by single-flight
+    coalescing, retries and hedged reads, admission-control queues and the
+    circuit breaker state, the report mirror's freshness, report cache hits and
+    the size of the unique key and search indexes.
+    """
+    return {
+        "single_flight": singleflight.reads.stats(),
+        "retries": retry.stats(),
+        "admission": admission.controller.stats(),
+        "circuit_breaker": admission.breaker.stats(),
+        "report_mirror": report_db_provider.status() if report_db_provider else None,
+        "report_cache": report_cache.cache.stats(),
+        "unique_indexes": unique_index.stats(),
+        "search_indexes": search_index.stats()
+    }
+
+@router.get("/jobs")
+async def get_job_metrics():
+    """
+    Returns each scheduled job's schedule, run count, failures, slots skipped
+    because another worker ran them, run times and next run.
+    """
+    return scheduler.stats()
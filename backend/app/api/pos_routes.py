@@ -1,11 +1,11 @@
 from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from app.services import pos_service, product_service
 from app.models import pos_models
-from ..dependencies import get_db,get_current_user
+from ..dependencies import get_pos_db,get_current_user,pos_db_provider,copy_to_local_mirrors
 from appwrite.id import ID
-from app.core import config
+from app.core import config, tracing, sales_facts, sales_index, report_cache, item_codec
 from app.core.utils import get_current_ist_time
-import json
 from typing import List
 router = APIRouter(
     prefix="/pos",
@@ -18,7 +18,7 @@ router = APIRouter(
 @router.post("/simulate-sale", response_model=pos_service.SaleSimulationResult)
 async def simulate_sale_route(
     simulation_request: pos_models.SimulateSaleRequest, # <-- This is the main change
-    db = Depends(get_db)
+    db = Depends(get_pos_db)
 ):
     """
     Simulates a sale for a given product and quantity to determine which
@@ -39,7 +39,7 @@ async def simulate_sale_route(
 
 # Endpoint for the final "Pay with..." action
 @router.post("/checkout", status_code=status.HTTP_201_CREATED)
-async def checkout_route(checkout_data: pos_models.CheckoutRequest, db = Depends(get_db)):
+async def checkout_route(checkout_data: pos_models.CheckoutRequest, db = Depends(get_pos_db)):
     """
     Finalizes a sale. This is a WRITE operation that:
     1. Executes FIFO stock deduction.
@@ -48,73 +48,95 @@ async def checkout_route(checkout_data: pos_models.CheckoutRequest, db = Depends
     """
     if not checkout_data.items:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot checkout an empty bill.")
+    tracing.set_attributes({"cart.size": len(checkout_data.items)})
 
     # --- Step 1: Execute stock deduction and get cost details ---
     # We'll enhance the execute function to return more details
     cogs_and_details = await pos_service.execute_fifo_deduction(checkout_data.items, db)
     total_cost_of_goods_sold = cogs_and_details["total_cogs"]
     
-    # --- Step 2: Build the rich items_sold array for historical record ---
-    items_sold_for_record: List[dict] = []
+    with tracing.start_span("checkout.serialization"):
+        # --- Step 2: Build the rich items_sold array for historical record ---
+        items_sold_for_record: List[dict] = []
     
-    # --- CORRECTED CALCULATION LOGIC (EXCLUSIVE TAX MODEL) ---
-    total_before_tax = 0
-    total_tax_amount = 0
+        # --- CORRECTED CALCULATION LOGIC (EXCLUSIVE TAX MODEL) ---
+        total_before_tax = 0
+        total_tax_amount = 0
 
-    for item_detail in cogs_and_details["details"]:
-        item_from_request = item_detail["item_from_request"]
-        batch_doc = item_detail["batch_doc"]
-        product_doc = item_detail["product_doc"]
+        for item_detail in cogs_and_details["details"]:
+            item_from_request = item_detail["item_from_request"]
+            batch_doc = item_detail["batch_doc"]
+            product_doc = item_detail["product_doc"]
 
-        original_sp = batch_doc.get('selling_price') or product_doc.get('global_selling_price', 0.0)
+            original_sp = batch_doc.get('selling_price') or product_doc.get('global_selling_price', 0.0)
         
-        # This is the subtotal for this specific line item
-        line_item_subtotal = item_from_request.quantity * item_from_request.actual_selling_price_per_unit
-        total_before_tax += line_item_subtotal
+            # This is the subtotal for this specific line item
+            line_item_subtotal = item_from_request.quantity * item_from_request.actual_selling_price_per_unit
+            total_before_tax += line_item_subtotal
         
-        # Calculate the tax on top of this subtotal
-        tax_rate = product_doc.get('tax_percentage', 0.0)
-        line_item_tax = line_item_subtotal * (tax_rate / 100)
-        total_tax_amount += line_item_tax
+            # Calculate the tax on top of this subtotal
+            tax_rate = product_doc.get('tax_percentage', 0.0)
+            line_item_tax = line_item_subtotal * (tax_rate / 100)
+            total_tax_amount += line_item_tax
 
-        item_record = pos_models.SalesOrderItem(
-            product_id=product_doc['$id'],
-            product_name=product_doc['product_name'],
-            product_code=product_doc['product_code'],
-            batch_id=batch_doc['$id'],
-            quantity=item_from_request.quantity,
-            cost_price_per_unit=batch_doc['cost_price'],
-            original_selling_price_per_unit=original_sp,
-            actual_selling_price_per_unit=item_from_request.actual_selling_price_per_unit,
-            tax_percentage_at_sale=tax_rate
-        )
-        items_sold_for_record.append(item_record.model_dump())
+            item_record = pos_models.SalesOrderItem(
+                product_id=product_doc['$id'],
+                product_name=product_doc['product_name'],
+                product_code=product_doc['product_code'],
+                batch_id=batch_doc['$id'],
+                quantity=item_from_request.quantity,
+                cost_price_per_unit=batch_doc['cost_price'],
+                original_selling_price_per_unit=original_sp,
+                actual_selling_price_per_unit=item_from_request.actual_selling_price_per_unit,
+                tax_percentage_at_sale=tax_rate
+            )
+            items_sold_for_record.append(item_record.model_dump())
 
-    # The grand total is the sum of the subtotal and the calculated tax
-    grand_total = total_before_tax + total_tax_amount
+        # The grand total is the sum of the subtotal and the calculated tax
+        grand_total = total_before_tax + total_tax_amount
 
-    # --- Step 3: Create the sales_order document (no change here needed) ---
-    unique_bill_id = ID.unique()
-    sales_order_payload = {
-        "bill_number": unique_bill_id,
-        "is_printed": checkout_data.print_bill,
-        "sale_date_time": get_current_ist_time().isoformat(),
-        "total_before_tax": round(total_before_tax, 2),
-        "total_tax_amount": round(total_tax_amount, 2),
-        "grand_total": round(grand_total, 2),
-        "payment_method": checkout_data.payment_method,
-        "items_sold": json.dumps({"items": items_sold_for_record})
-    }
+        # --- Step 3: Create the sales_order document (no change here needed) ---
+        unique_bill_id = ID.unique()
+        sales_order_payload = {
+            "bill_number": unique_bill_id,
+            "is_printed": checkout_data.print_bill,
+            "sale_date_time": get_current_ist_time().isoformat(),
+            "total_before_tax": round(total_before_tax, 2),
+            "total_tax_amount": round(total_tax_amount, 2),
+            "grand_total": round(grand_total, 2),
+            "payment_method": checkout_data.payment_method,
+            "items_sold": item_codec.encode_items(items_sold_for_record)
+        }
 
-    new_sale = db.create_document(
-        database_id=config.APPWRITE_DATABASE_ID,
-        collection_id=config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
-        document_id=unique_bill_id,
-        data=sales_order_payload
-    )
+    with tracing.start_span("checkout.create_sales_order"):
+        # Off the event loop so the retry policy covers it; the ID is fixed, so a retry can't duplicate the sale
+        new_sale = await run_in_threadpool(
+            db.create_document,
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
+            document_id=unique_bill_id,
+            data=sales_order_payload
+        )
+    # Both take file locks (the fact store's and SQLite's), so they run off the event loop
+    await run_in_threadpool(sales_facts.record_sale, new_sale['$id'], sales_order_payload["sale_date_time"], cogs_and_details["details"])
+    await run_in_threadpool(sales_index.record_sale, new_sale['$id'], sales_order_payload["sale_date_time"], items_sold_for_record)
+    await run_in_threadpool(copy_to_local_mirrors, config.APPWRITE_COLLECTION_SALES_ORDERS_ID, [new_sale])
+    await run_in_threadpool(copy_to_local_mirrors, config.APPWRITE_COLLECTION_BATCHES_ID, cogs_and_details["updated_batches"])
+    report_cache.invalidate(sales_order_payload["sale_date_time"])
 
     return {
         "status": "success",
         "message": "Checkout successful.",
         "sale_id": new_sale['$id']
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/replication-status")
+async def replication_status_route():
+    """
+    Health of the offline-first POS store: changes still waiting to reach Appwrite,
+    how long the oldest has waited, last successful push/pull and recorded conflicts.
+    """
+    if pos_db_provider is None:
+        return {"enabled": False}
+    return {"enabled": True, **pos_db_provider.status()}
@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, status , HTTPException
+from fastapi import APIRouter, Depends, Query, status , HTTPException
 from app.models import purchase_models
 from ..dependencies import get_db,get_current_user
 from app.core.utils import get_current_ist_time
 from app.services import purchase_service
 from datetime import date, datetime, time
 from typing import List, Optional
+from app.models.common_models import CursorPage
 
 router = APIRouter(
     prefix="/purchases",
@@ -69,6 +70,36 @@ async def get_purchase_history_route(
     return await purchase_service.get_purchase_history(supplier_id, db)
 
 
+@router.get("/history", response_model=CursorPage[purchase_models.PurchaseHistoryItem])
+async def get_purchase_history_page_route(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    supplier_id: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    summary: bool = True,
+    db = Depends(get_db)
+):
+    """
+    Retrieves purchase orders a page at a time, newest first, optionally filtered by
+    supplier and purchase date range. Pass the returned `next_cursor` as `cursor` for
+    the next page. Line items are left out unless `summary=false`; use
+    GET /purchases/{purchase_id} for one order's items.
+    """
+    return await purchase_service.get_purchase_history_page(
+        db, limit, cursor=cursor, supplier_id=supplier_id,
+        start_date=datetime.combine(start_date, time.min).isoformat() if start_date else None,
+        end_date=datetime.combine(end_date, time.max).isoformat() if end_date else None,
+        summary=summary
+    )
+
+@router.get("/{purchase_id}", response_model=purchase_models.PurchaseResponse)
+async def get_purchase_order_route(purchase_id: str, db = Depends(get_db)):
+    """
+    Retrieves a single purchase order with its line items.
+    """
+    return await purchase_service.get_purchase_order(purchase_id, db)
+
 @router.put("/{purchase_id}/pay", response_model=purchase_models.PurchaseResponse)
 async def mark_as_paid_route(purchase_id: str, db = Depends(get_db)):
     """
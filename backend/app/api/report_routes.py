@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, Query
 from app.services import report_service
 from app.models import report_models
-from ..dependencies import get_db,get_current_user
+from ..dependencies import get_report_db,get_current_user
 from datetime import date , datetime, time# We'll use this for default dates
+from app.core import config, fieldsets
 from app.core.utils import get_current_ist_time
-from typing import List
+from typing import List, Literal, Optional
 from app.models.common_models import PaginatedResponse
 
 router = APIRouter(
@@ -14,11 +15,11 @@ router = APIRouter(
     
 )
 
-@router.get("/financial-summary", response_model=report_models.FinancialSummaryResponse)
+@router.get("/financial-summary", response_model=report_models.FinancialSummaryResponse, response_model_exclude_none=True)
 async def get_financial_summary_route(
     start_date: date = Query(default_factory=date.today),
     end_date: date = Query(default_factory=date.today),
-    db = Depends(get_db)
+    db = Depends(get_report_db)
 ):
     
 
@@ -37,14 +38,33 @@ async def get_financial_summary_route(
     start_date_str = start_datetime.isoformat()
     end_date_str = end_datetime.isoformat()
 
-    result = await report_service.get_financial_summary(start_date_str, end_date_str, db)
+    result = await report_service.get_financial_summary(start_date_str, end_date_str, db, with_timings=config.DEBUG)
 
     return result
 
+@router.get("/daily-summaries", response_model=List[report_models.DailySummaryResponse])
+async def get_daily_summaries_route(
+    start_date: date = Query(default_factory=date.today),
+    end_date: date = Query(default_factory=date.today)
+):
+    """
+    End-of-day financial summaries stored by the scheduler, one per day that has
+    one, between two dates. Cheap enough to chart long ranges.
+    """
+    return await report_service.get_daily_summaries(start_date, end_date)
+
+@router.get("/inventory-valuation", response_model=report_models.InventoryValuationResponse)
+async def get_inventory_valuation_route(db = Depends(get_report_db)):
+    """
+    Cost value of the stock on hand, in total and per product, as last computed by
+    the scheduler (see `computed_at`).
+    """
+    return await report_service.get_inventory_valuation(db)
+
 @router.post("/operating-costs", response_model=report_models.OperatingCostResponse, status_code=201)
 async def create_operating_cost_route(
     cost_data: report_models.OperatingCostCreate,
-    db = Depends(get_db)
+    db = Depends(get_report_db)
 ):
     """
     Records a new operating cost/expense.
@@ -69,7 +89,7 @@ async def create_operating_cost_route(
 async def get_operating_costs_route(
     start_date: date = Query(default_factory=date.today),
     end_date: date = Query(default_factory=date.today),
-    db = Depends(get_db)
+    db = Depends(get_report_db)
 ):
     
     """
@@ -91,23 +111,92 @@ async def get_operating_costs_route(
 
 
 
+@router.get("/sales-facts", response_model=report_models.SalesAggregateResponse)
+async def get_sales_aggregates_route(
+    start_date: date = Query(default_factory=date.today),
+    end_date: date = Query(default_factory=date.today),
+    group_by: Optional[Literal["product", "batch", "day"]] = None
+):
+    """
+    Totals of quantity, revenue, cost, tax, discount and profit over all sale lines
+    in a date range, optionally grouped by product, batch or day.
+    Served from the columnar sales fact store.
+    """
+    start_date_str = datetime.combine(start_date, time.min).isoformat()
+    end_date_str = datetime.combine(end_date, time.max).isoformat()
+    return await report_service.get_sales_aggregates(start_date_str, end_date_str, group_by)
+
+
+@router.get("/products", response_model=List[report_models.ProductPerformanceItem])
+async def get_product_performance_route(
+    start_date: date = Query(default_factory=date.today),
+    end_date: date = Query(default_factory=date.today),
+    sort_by: Literal[report_service.PRODUCT_SORT_FIELDS] = "revenue",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(20, ge=1, le=500),
+    db = Depends(get_report_db)
+):
+    """
+    Product performance over a date range: units sold, revenue, COGS, gross margin,
+    discount given and units sold per day. Sorted by `sort_by`; returns the top `limit`.
+    """
+    start_date_str = datetime.combine(start_date, time.min).isoformat()
+    end_date_str = datetime.combine(end_date, time.max).isoformat()
+    days_in_range = (end_date - start_date).days + 1
+    return await report_service.get_product_performance(
+        start_date_str, end_date_str, days_in_range, sort_by, order == "desc", limit, db
+    )
+
+
+@router.get("/sales/series", response_model=report_models.SalesSeriesResponse)
+async def get_sales_series_route(
+    start_date: date = Query(default_factory=date.today),
+    end_date: date = Query(default_factory=date.today),
+    bucket: Literal["hour", "day", "week", "month"] = "day"
+):
+    """
+    Sales, tax, COGS and number of bills per hour, day, week or month (in IST)
+    between two dates, for charts. Every bucket in the range is returned.
+    """
+    return await report_service.get_sales_series(start_date, end_date, bucket)
+
+
 @router.get("/sales", response_model=PaginatedResponse[report_models.SaleHistoryItem])
 async def get_sales_history_route(
-    db = Depends(get_db),
+    db = Depends(get_report_db),
     # Add a query parameter for the page number, default to 1
-    page: int = 1 
+    page: int = 1,
+    fields: Optional[str] = None
 ):
     """
     Retrieves a paginated summary of all past sales, sorted by most recent first.
-    Each page contains up to 100 records.
+    Each page contains up to 100 records. `fields` (comma-separated, e.g.
+    "sale_date_time,grand_total") returns only those fields of each sale.
     """
     # Page 1 should have an offset of 0, Page 2 an offset of 100, etc.
     limit = 100
     offset = (page - 1) * limit
-    return await report_service.get_sales_history(db, limit=limit, offset=offset)
+    selected = fieldsets.parse(fields, report_models.SaleHistoryItem)
+    sales = await report_service.get_sales_history(db, limit=limit, offset=offset, fields=selected)
+    if selected is None:
+        return sales
+    return fieldsets.respond(sales, PaginatedResponse[fieldsets.partial_model(report_models.SaleHistoryItem, tuple(selected))])
+
+@router.get("/sales/by-product/{product_id}", response_model=PaginatedResponse[report_models.SaleContainingItem])
+async def get_sales_by_product_route(
+    product_id: str,
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=100),
+    db = Depends(get_report_db)
+):
+    """
+    The sales that contain a product, newest first, with the quantity of it sold
+    in each. Served from the sales index.
+    """
+    return await report_service.get_sales_containing("product", product_id, limit, (page - 1) * limit, db)
 
 @router.get("/sales/{sale_id}", response_model=report_models.SaleDetailResponse)
-async def get_sale_details_route(sale_id: str, db = Depends(get_db)):
+async def get_sale_details_route(sale_id: str, db = Depends(get_report_db)):
     """
     Retrieves the full details of a single sales order.
     """
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, status
-from typing import List
+from fastapi import APIRouter, Depends, Query, status
+from typing import List, Optional
 from app.services import supplier_service
 from app.models import supplier_models
 from ..dependencies import get_db,get_current_user
+from app.models.common_models import PaginatedResponse
 
 router = APIRouter(
     prefix="/suppliers",
@@ -24,4 +25,16 @@ async def get_all_suppliers_route(db = Depends(get_db)):
     """
     Retrieves a list of all suppliers.
     """
-    return await supplier_service.get_all_suppliers(db)
\ No newline at end of file
+    return await supplier_service.get_all_suppliers(db)
+
+@router.get("/search", response_model=PaginatedResponse[supplier_models.SupplierResponse])
+async def search_suppliers_route(
+    q: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=100)
+):
+    """
+    Finds suppliers by name (words starting with those of `q`) or by phone number
+    (any part of it), sorted by name. Without `q`, pages through all suppliers.
+    """
+    return await supplier_service.search_suppliers(q, limit, (page - 1) * limit)
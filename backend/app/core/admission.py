@@ -0,0 +1,323 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+from appwrite.exception import AppwriteException
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from app.core import config
+from app.core.datastore import ServiceProxy, on_event_loop
+
+# Lanes in priority order: checkout traffic is admitted before everything else,
+# and report traffic only when nothing more important is waiting.
+LANE_CHECKOUT = "checkout"
+LANE_DEFAULT = "default"
+LANE_REPORTS = "reports"
+LANES = (LANE_CHECKOUT, LANE_DEFAULT, LANE_REPORTS)
+
+current_lane: ContextVar[str] = ContextVar("admission_lane", default=LANE_DEFAULT)
+# Set while handling a request that holds an admission slot
+request_admitted: ContextVar[bool] = ContextVar("admission_request_admitted", default=False)
+
+# Metrics stay reachable when the server is saturated
+UNADMITTED_PATH_PREFIXES = ("/metrics",)
+
+
+def lane_for_path(path: str) -> str:
+    if path.startswith("/pos") or (path.startswith("/customers/") and path.endswith("/add-credit")):
+        return LANE_CHECKOUT
+    if path.startswith("/reports"):
+        return LANE_REPORTS
+    return LANE_DEFAULT
+
+
+def service_unavailable(detail: str, retry_after: float = 1) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=detail,
+        headers={"Retry-After": str(max(1, int(retry_after)))}
+    )
+
+
+class _Waiter:
+    """A queued caller, woken through an asyncio future (requests) or a threading event (worker threads)."""
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.admitted = False
+        self._loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+
+    def wake(self):
+        self.admitted = True
+        if self.future is not None:
+            self._loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """
+    A global concurrency limiter with a bounded, prioritised wait queue per lane.
+
+    At most `max_concurrency` callers are admitted at once. Waiting callers are admitted
+    lane by lane in priority order, and FIFO within a lane. A caller is shed with a
+    503 when its lane's queue is full or when it has waited longer than the timeout.
+
+    Requests wait with `acquire_async` so the event loop keeps running while they are
+    queued; `acquire` is for worker threads (scheduled jobs, threadpool calls).
+    """
+
+    def __init__(self, max_concurrency: int, queue_limits: dict, lane_limits: dict, wait_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.queue_limits = queue_limits
+        self.lane_limits = lane_limits
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._in_flight = {lane: 0 for lane in LANES}
+        self._waiting = {lane: deque() for lane in LANES}
+        self._shed = {lane: 0 for lane in LANES}
+
+    def _has_room(self, lane: str) -> bool:
+        return (sum(self._in_flight.values()) < self.max_concurrency
+                and self._in_flight[lane] < self.lane_limits.get(lane, self.max_concurrency))
+
+    def _dispatch(self):
+        """Admits waiters in priority order; a lane that can't move holds up the lanes below it."""
+        for lane in LANES:
+            queue = self._waiting[lane]
+            while queue and self._has_room(lane):
+                self._in_flight[lane] += 1
+                queue.popleft().wake()
+            if queue:
+                return
+
+    def _shed_call(self, lane: str) -> HTTPException:
+        self._shed[lane] += 1
+        return service_unavailable("Server is busy. Please try again shortly.")
+
+    def _enqueue(self, lane: str, waiter: _Waiter, wait: bool = True) -> bool:
+        """Admits the caller straight away (True) or queues its waiter (False)."""
+        with self._lock:
+            ahead = any(self._waiting[other_lane] for other_lane in LANES[:LANES.index(lane) + 1])
+            if not ahead and self._has_room(lane):
+                self._in_flight[lane] += 1
+                return True
+            if not wait or len(self._waiting[lane]) >= self.queue_limits[lane]:
+                raise self._shed_call(lane)
+            self._waiting[lane].append(waiter)
+            return False
+
+    def _settle(self, lane: str, waiter: _Waiter) -> bool:
+        """After a wait ends: True if the waiter was admitted, otherwise takes it out of the queue."""
+        with self._lock:
+            if waiter.admitted:
+                return True
+            self._waiting[lane].remove(waiter)
+            # Our waiter may have been holding up the callers behind it
+            self._dispatch()
+            return False
+
+    def acquire(self, lane: str, wait: bool = True):
+        """
+        Blocks the calling thread until admitted. Never call it with `wait` on the event
+        loop thread: without it, a caller that can't be admitted right away is shed.
+        """
+        waiter = _Waiter()
+        if self._enqueue(lane, waiter, wait):
+            return
+        waiter.event.wait(self.wait_timeout)
+        if not self._settle(lane, waiter):
+            with self._lock:
+                raise self._shed_call(lane)
+
+    async def acquire_async(self, lane: str):
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._enqueue(lane, waiter):
+            return
+        try:
+            await asyncio.wait_for(waiter.future, self.wait_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued
+            if self._settle(lane, waiter):
+                self.release(lane)
+            raise
+        if not self._settle(lane, waiter):
+            with self._lock:
+                raise self._shed_call(lane)
+
+    def release(self, lane: str):
+        with self._lock:
+            self._in_flight[lane] -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": dict(self._in_flight),
+                "waiting": {lane: len(queue) for lane, queue in self._waiting.items()},
+                "shed": dict(self._shed),
+            }
+
+
+class CircuitBreaker:
+    """
+    Opens when the backend error rate over a rolling window crosses a threshold.
+
+    While open, calls fail fast with a 503. After `open_seconds` a single probe call
+    is let through (half-open); its outcome closes the breaker or re-opens it.
+    """
+
+    def __init__(self, window_seconds: float, min_calls: int, error_rate_threshold: float, open_seconds: float):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (timestamp, failed)
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+
+    def before_call(self):
+        with self._lock:
+            if self._state == "closed":
+                return
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._state = "half_open"
+            if self._state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self._rejected += 1
+        raise service_unavailable(
+            "The database backend is temporarily unavailable. Please try again shortly.",
+            retry_after=self.open_seconds
+        )
+
+    def record(self, failed: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self._state == "half_open":
+                self._probe_in_flight = False
+                if failed:
+                    self._open(now)
+                else:
+                    self._state = "closed"
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append((now, failed))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+
+            failures = sum(1 for _, was_failure in self._outcomes if was_failure)
+            if (self._state == "closed" and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.error_rate_threshold):
+                self._open(now)
+
+    def _open(self, now: float):
+        self._state = "open"
+        self._opened_at = now
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self._state, "rejected": self._rejected}
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Network errors, timeouts and 5xx count against the breaker; 4xx responses do not."""
+    if isinstance(error, HTTPException):
+        return False
+    if isinstance(error, AppwriteException):
+        return not error.code or error.code >= 500
+    return True
+
+
+controller = AdmissionController(
+    max_concurrency=config.ADMISSION_MAX_CONCURRENCY,
+    queue_limits={
+        LANE_CHECKOUT: config.ADMISSION_QUEUE_CHECKOUT,
+        LANE_DEFAULT: config.ADMISSION_QUEUE_DEFAULT,
+        LANE_REPORTS: config.ADMISSION_QUEUE_REPORTS,
+    },
+    lane_limits={LANE_REPORTS: config.ADMISSION_REPORTS_MAX_CONCURRENCY},
+    wait_timeout=config.ADMISSION_WAIT_TIMEOUT_SECONDS,
+)
+breaker = CircuitBreaker(
+    window_seconds=config.CIRCUIT_BREAKER_WINDOW_SECONDS,
+    min_calls=config.CIRCUIT_BREAKER_MIN_CALLS,
+    error_rate_threshold=config.CIRCUIT_BREAKER_ERROR_RATE,
+    open_seconds=config.CIRCUIT_BREAKER_OPEN_SECONDS,
+)
+
+
+class AdmissionProxy(ServiceProxy):
+    """
+    Puts every call to the wrapped Appwrite service behind the breaker, and behind the
+    limiter unless it's made while handling an already-admitted request.
+    """
+
+    def _call(self, operation, method, args, kwargs):
+        if request_admitted.get():
+            return self._guarded(method, args, kwargs)
+        lane = current_lane.get()
+        # Waiting for a slot here would stall the event loop, and every request with it
+        controller.acquire(lane, wait=not on_event_loop())
+        try:
+            return self._guarded(method, args, kwargs)
+        finally:
+            controller.release(lane)
+
+    @staticmethod
+    def _guarded(method, args, kwargs):
+        breaker.before_call()
+        try:
+            result = method(*args, **kwargs)
+        except BaseException as e:
+            breaker.record(failed=is_backend_failure(e))
+            raise
+        breaker.record(failed=False)
+        return result
+
+
+def instrument(service):
+    """Returns the service wrapped in an AdmissionProxy when admission control is enabled."""
+    return AdmissionProxy(service) if config.ADMISSION_CONTROL_ENABLED else service
+
+
+async def admit_requests(request: Request, call_next):
+    """
+    HTTP middleware that tags the request with its admission lane and waits (without
+    blocking the event loop) for an admission slot, held until the response is ready.
+    The backend calls made while handling the request run under that slot.
+    """
+    lane = lane_for_path(request.url.path)
+    token = current_lane.set(lane)
+    try:
+        if not config.ADMISSION_CONTROL_ENABLED or request.url.path.startswith(UNADMITTED_PATH_PREFIXES):
+            return await call_next(request)
+        try:
+            await controller.acquire_async(lane)
+        except HTTPException as e:
+            # Raised outside the routers, so it isn't turned into a response for us
+            return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+        admitted = request_admitted.set(True)
+        try:
+            return await call_next(request)
+        finally:
+            request_admitted.reset(admitted)
+            controller.release(lane)
+    finally:
+        current_lane.reset(token)
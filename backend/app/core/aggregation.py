@@ -0,0 +1,46 @@
+"""
+CPU-bound report work units. They run in the report process pool (see
+app/core/cpu_pool.py), so this module must stay cheap to import: no Appwrite
+client, no fact store.
+"""
+import logging
+from typing import Dict, List, Tuple
+
+from app.core import item_codec
+
+logger = logging.getLogger(__name__)
+
+# (sale ID, grand_total, total_tax_amount, stored items_sold)
+SaleRow = Tuple[str, float, float, str]
+
+
+def summarize_sales(rows: List[SaleRow]) -> dict:
+    """
+    Sums sales and tax over a chunk of sales and totals the sold quantity per
+    batch, so that COGS can be priced with one batch lookup for all chunks.
+    """
+    total_sales = 0.0
+    total_tax = 0.0
+    quantity_by_batch: Dict[str, float] = {}
+    for sale_id, grand_total, tax, items_sold in rows:
+        total_sales += grand_total
+        total_tax += tax
+        try:
+            lines = item_codec.decode_columns(items_sold, ("batch_id", "quantity"))
+        except ValueError as e:
+            logger.warning("Could not parse items_sold for sale '%s': %s", sale_id, e)
+            continue
+        for batch_id, quantity in lines:
+            if batch_id is not None:
+                quantity_by_batch[batch_id] = quantity_by_batch.get(batch_id, 0) + (quantity or 0)
+    return {"total_sales": total_sales, "total_tax_collected": total_tax, "quantity_by_batch": quantity_by_batch}
+
+
+def merge_sales_summaries(summaries: List[dict]) -> dict:
+    merged = {"total_sales": 0.0, "total_tax_collected": 0.0, "quantity_by_batch": {}}
+    for summary in summaries:
+        merged["total_sales"] += summary["total_sales"]
+        merged["total_tax_collected"] += summary["total_tax_collected"]
+        for batch_id, quantity in summary["quantity_by_batch"].items():
+            merged["quantity_by_batch"][batch_id] = merged["quantity_by_batch"].get(batch_id, 0) + quantity
+    return merged
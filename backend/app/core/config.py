@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,4 +19,183 @@ APPWRITE_COLLECTION_CUSTOMER_TRANSACTIONS_ID = os.getenv("APPWRITE_COLLECTION_CU
 APPWRITE_COLLECTION_OPERATING_COSTS_ID = os.getenv("APPWRITE_COLLECTION_OPERATING_COSTS_ID")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "a_very_secret_key_for_development")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 1500
\ No newline at end of file
+ACCESS_TOKEN_EXPIRE_MINUTES = 1500
+
+# --- Debug ---
+# Adds diagnostics to some responses, like the financial summary's per-query timings.
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+# --- Profiling ---
+# Profiling is opt-in. When enabled, a request carrying the header
+# "X-Profile: <PROFILING_TOKEN>" is profiled and its profile written to disk.
+# A profile only has the samples taken while that request's own code was running
+# on the event loop, so concurrent requests don't show up in it.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_OUTPUT_DIR = os.getenv("PROFILING_OUTPUT_DIR", "profiles")
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "5"))
+# With profiling enabled, every request is sampled and the profile of any request
+# slower than this is kept and logged. 0 disables the slow-request log.
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "0"))
+
+# --- Tracing ---
+# Spans are written as JSON lines, either to stdout ("console") or to a file ("file").
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "console")
+TRACING_OUTPUT_FILE = os.getenv("TRACING_OUTPUT_FILE", "traces.jsonl")
+
+# --- Data access ---
+# Collapse concurrent identical document reads into a single Appwrite call.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# Admission control: a global limit on requests (and background Appwrite calls) in
+# flight with a bounded wait queue per lane (checkout > default > reports), and a
+# circuit breaker that fails fast with a 503 when the backend error rate spikes.
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16"))
+ADMISSION_REPORTS_MAX_CONCURRENCY = int(os.getenv("ADMISSION_REPORTS_MAX_CONCURRENCY", "4"))
+ADMISSION_QUEUE_CHECKOUT = int(os.getenv("ADMISSION_QUEUE_CHECKOUT", "64"))
+ADMISSION_QUEUE_DEFAULT = int(os.getenv("ADMISSION_QUEUE_DEFAULT", "32"))
+ADMISSION_QUEUE_REPORTS = int(os.getenv("ADMISSION_QUEUE_REPORTS", "8"))
+ADMISSION_WAIT_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_WAIT_TIMEOUT_SECONDS", "5"))
+CIRCUIT_BREAKER_WINDOW_SECONDS = float(os.getenv("CIRCUIT_BREAKER_WINDOW_SECONDS", "30"))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.getenv("CIRCUIT_BREAKER_MIN_CALLS", "20"))
+CIRCUIT_BREAKER_ERROR_RATE = float(os.getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.5"))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "15"))
+
+# Retries for idempotent Databases calls (jittered exponential backoff) made off the
+# event loop, and optional hedged reads: a second identical read is sent once the
+# first has taken longer than the collection's recent p95 latency.
+RETRY_ENABLED = os.getenv("RETRY_ENABLED", "true").lower() == "true"
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_MS = float(os.getenv("RETRY_BASE_DELAY_MS", "50"))
+RETRY_MAX_DELAY_MS = float(os.getenv("RETRY_MAX_DELAY_MS", "1000"))
+HEDGED_READS_ENABLED = os.getenv("HEDGED_READS_ENABLED", "false").lower() == "true"
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "8"))
+# Per-collection overrides as JSON keyed by collection ID, e.g.
+# {"<products collection id>": {"max_attempts": 5, "hedge": true}}
+RETRY_POLICY_OVERRIDES = json.loads(os.getenv("RETRY_POLICY_OVERRIDES", "{}"))
+
+# --- Storage backend ---
+# "appwrite" (default) keeps documents in the Appwrite project. "sqlite" keeps them in
+# a local SQLite file instead, for single-store deployments; authentication still uses
+# Appwrite's Users and Account services.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "appwrite")
+SQLITE_DATABASE_PATH = os.getenv("SQLITE_DATABASE_PATH", "shop.db")
+
+# --- Offline POS ---
+# When enabled, POS checkout and credit sales work against a local SQLite store
+# (products, batches and customers are mirrored locally) and their writes are
+# replicated to Appwrite in the background, so the till keeps selling through
+# Appwrite or network outages.
+OFFLINE_POS_ENABLED = os.getenv("OFFLINE_POS_ENABLED", "false").lower() == "true"
+OFFLINE_STORE_PATH = os.getenv("OFFLINE_STORE_PATH", "offline_pos.db")
+# POS reads are served from the mirror, so this is how stale a till's view of stock
+# changed elsewhere can get. Each pull is incremental, normally one small request.
+REPLICATION_PULL_INTERVAL_SECONDS = float(os.getenv("REPLICATION_PULL_INTERVAL_SECONDS", "10"))
+REPLICATION_RETRY_SECONDS = float(os.getenv("REPLICATION_RETRY_SECONDS", "5"))
+
+# --- Report mirror ---
+# When enabled, reports read sales orders, batches, purchase orders and operating
+# costs from a local SQLite copy refreshed every REPORT_MIRROR_REFRESH_SECONDS,
+# instead of querying Appwrite on every request. Reports can lag by that interval.
+REPORT_MIRROR_ENABLED = os.getenv("REPORT_MIRROR_ENABLED", "false").lower() == "true"
+REPORT_MIRROR_PATH = os.getenv("REPORT_MIRROR_PATH", "report_mirror.db")
+REPORT_MIRROR_REFRESH_SECONDS = float(os.getenv("REPORT_MIRROR_REFRESH_SECONDS", "15"))
+# Deletions can't be seen by the incremental refresh, so the mirror's IDs are
+# checked against Appwrite on this (slower) schedule.
+REPORT_MIRROR_RECONCILE_SECONDS = float(os.getenv("REPORT_MIRROR_RECONCILE_SECONDS", "3600"))
+
+# --- Line item encoding ---
+# How items_sold/items_received are written: "compact" (packed, see
+# app/core/item_codec.py) or "json". Both are always readable; use "json" while
+# older app versions that only read JSON still share the database.
+ITEM_ENCODING = os.getenv("ITEM_ENCODING", "compact").lower()
+
+# --- Query chunking ---
+# Appwrite accepts at most 100 values in one equal/contains filter. Longer ID lists
+# are split into chunks of QUERY_CHUNK_SIZE, QUERY_CHUNK_CONCURRENCY queried at a time.
+QUERY_CHUNK_SIZE = int(os.getenv("QUERY_CHUNK_SIZE", "100"))
+QUERY_CHUNK_CONCURRENCY = int(os.getenv("QUERY_CHUNK_CONCURRENCY", "4"))
+
+# --- Product import ---
+# CSV imports are read PRODUCT_IMPORT_BATCH_SIZE rows at a time, and each batch's
+# products are created PRODUCT_IMPORT_CONCURRENCY at a time.
+PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv("PRODUCT_IMPORT_BATCH_SIZE", "500"))
+PRODUCT_IMPORT_CONCURRENCY = int(os.getenv("PRODUCT_IMPORT_CONCURRENCY", "8"))
+
+# --- Unique key indexes ---
+# Product codes/names, customer contacts and supplier names are checked for
+# uniqueness against in-process indexes (app/core/unique_index.py), reloaded every
+# UNIQUE_INDEX_RELOAD_SECONDS; a free value costs no Appwrite query. A taken value
+# whose owner came from the last reload is re-read from Appwrite, in case another
+# worker renamed it since; with a single worker, UNIQUE_INDEX_VERIFY_HITS=false
+# skips that read.
+UNIQUE_INDEX_ENABLED = os.getenv("UNIQUE_INDEX_ENABLED", "true").lower() == "true"
+UNIQUE_INDEX_VERIFY_HITS = os.getenv("UNIQUE_INDEX_VERIFY_HITS", "true").lower() == "true"
+UNIQUE_INDEX_RELOAD_SECONDS = float(os.getenv("UNIQUE_INDEX_RELOAD_SECONDS", "600"))
+
+# --- Directory search ---
+# Customer and supplier search is served from in-process indexes
+# (app/core/search_index.py), reloaded every SEARCH_INDEX_RELOAD_SECONDS.
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+SEARCH_INDEX_RELOAD_SECONDS = float(os.getenv("SEARCH_INDEX_RELOAD_SECONDS", "300"))
+
+# --- Batch repricing ---
+# Bulk repricing updates at most BATCH_REPRICE_CONCURRENCY batches at a time.
+BATCH_REPRICE_CONCURRENCY = int(os.getenv("BATCH_REPRICE_CONCURRENCY", "8"))
+
+# --- Report cache ---
+# Financial summaries are served from an in-process cache: fresh for
+# REPORT_CACHE_FRESH_SECONDS, then served stale (while recomputed in the background)
+# up to REPORT_CACHE_MAX_STALE_SECONDS. Sales, purchases and operating costs recorded
+# by this worker invalidate the affected entries right away.
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "true").lower() == "true"
+REPORT_CACHE_FRESH_SECONDS = float(os.getenv("REPORT_CACHE_FRESH_SECONDS", "30"))
+REPORT_CACHE_MAX_STALE_SECONDS = float(os.getenv("REPORT_CACHE_MAX_STALE_SECONDS", "300"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "256"))
+# Independent queries of one report run concurrently, at most this many at a time
+REPORT_QUERY_CONCURRENCY = int(os.getenv("REPORT_QUERY_CONCURRENCY", "4"))
+# CPU-heavy report work (parsing items_sold) runs in a pool of this many processes,
+# REPORT_PROCESS_CHUNK_SIZE sales per task. Reports smaller than one chunk, or all
+# reports with 0 workers, are processed in the serving process instead.
+REPORT_PROCESS_WORKERS = int(os.getenv("REPORT_PROCESS_WORKERS", "2"))
+REPORT_PROCESS_CHUNK_SIZE = int(os.getenv("REPORT_PROCESS_CHUNK_SIZE", "2000"))
+
+# --- Sales fact store ---
+# Sale lines are also appended to a columnar, memory-mapped store in this directory
+# for fast aggregate reports. Delete the directory to rebuild it from sales_orders.
+SALES_FACTS_ENABLED = os.getenv("SALES_FACTS_ENABLED", "true").lower() == "true"
+SALES_FACTS_DIR = os.getenv("SALES_FACTS_DIR", "sales_facts")
+
+# --- Sales index ---
+# Maps product and batch IDs to the sales that contain them (recalls, price
+# disputes), in a SQLite file kept up to date at checkout. Delete the file to
+# rebuild it from sales_orders.
+SALES_INDEX_ENABLED = os.getenv("SALES_INDEX_ENABLED", "true").lower() == "true"
+SALES_INDEX_PATH = os.getenv("SALES_INDEX_PATH", "sales_index.db")
+
+# --- Reorder suggestions ---
+# Products are suggested for reordering when their stock covers less than the
+# supplier's lead time plus REORDER_SAFETY_DAYS of sales, at the average rate of the
+# last REORDER_VELOCITY_WINDOW_DAYS. The suggested quantity tops stock up to
+# lead time + REORDER_COVER_DAYS of sales.
+REORDER_VELOCITY_WINDOW_DAYS = int(os.getenv("REORDER_VELOCITY_WINDOW_DAYS", "28"))
+REORDER_DEFAULT_LEAD_TIME_DAYS = float(os.getenv("REORDER_DEFAULT_LEAD_TIME_DAYS", "7"))
+# Per-supplier lead times as JSON keyed by supplier ID, e.g. {"<supplier id>": 3}
+REORDER_LEAD_TIME_OVERRIDES = json.loads(os.getenv("REORDER_LEAD_TIME_OVERRIDES", "{}"))
+REORDER_SAFETY_DAYS = float(os.getenv("REORDER_SAFETY_DAYS", "3"))
+REORDER_COVER_DAYS = float(os.getenv("REORDER_COVER_DAYS", "14"))
+REORDER_REFRESH_SECONDS = float(os.getenv("REORDER_REFRESH_SECONDS", "300"))
+
+# --- Scheduler ---
+# Background jobs (replication, mirror refreshes, precomputed reports) run on an
+# asyncio scheduler started with the app. Locks and last-run slots are kept in
+# SCHEDULER_STATE_DIR so each single-instance job runs once per slot across workers.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_STATE_DIR = os.getenv("SCHEDULER_STATE_DIR", "scheduler_state")
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "5"))
+END_OF_DAY_SUMMARY_CRON = os.getenv("END_OF_DAY_SUMMARY_CRON", "55 23 * * *")
+INVENTORY_VALUATION_INTERVAL_SECONDS = float(os.getenv("INVENTORY_VALUATION_INTERVAL_SECONDS", "900"))
+SALES_ROLLUP_INTERVAL_SECONDS = float(os.getenv("SALES_ROLLUP_INTERVAL_SECONDS", "60"))
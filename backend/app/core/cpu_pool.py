@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from app.core import config
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server process has threads (threadpool, SQLite, scheduler)
+            _pool = ProcessPoolExecutor(
+                max_workers=config.REPORT_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+async def run_chunked(func: Callable[[list], object], items: list, chunk_size: int = None) -> List[object]:
+    """
+    Applies `func` to `items` in chunks of `chunk_size` and returns the per-chunk
+    results in order. `func` must be a module-level function (it's pickled by name).
+
+    Chunks run in the report process pool, in parallel across cores, so CPU-heavy
+    work doesn't hold the GIL of the serving process. Small inputs (a single chunk),
+    or REPORT_PROCESS_WORKERS=0, run in the threadpool instead, where there's no
+    pickling overhead.
+    """
+    chunk_size = chunk_size or config.REPORT_PROCESS_CHUNK_SIZE
+    if not items:
+        return []
+    if config.REPORT_PROCESS_WORKERS <= 0 or len(items) <= chunk_size:
+        return [await run_in_threadpool(func, items)]
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    return await asyncio.gather(*(
+        loop.run_in_executor(pool, func, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)
+    ))
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
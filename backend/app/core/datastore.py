@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Optional
+
+
+def on_event_loop() -> bool:
+    """Whether we're on a thread running an asyncio event loop, where blocking stalls every request."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ServiceProxy:
+    """
+    Base class for wrappers around the Appwrite Databases, Users and Account services.
+
+    Attribute access is delegated to the wrapped service and every method call is
+    routed through `_call`, which subclasses override to add behaviour around the
+    real call. A proxy looks exactly like the service it wraps, so they can be stacked.
+    """
+
+    def __init__(self, inner: Any, service_name: Optional[str] = None):
+        self._inner = inner
+        self.service_name = service_name or getattr(inner, "service_name", type(inner).__name__.lower())
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._inner, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            return self._call(name, attribute, args, kwargs)
+
+        return call
+
+    def _call(self, operation: str, method, args: tuple, kwargs: dict):
+        return method(*args, **kwargs)
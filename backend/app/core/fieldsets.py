@@ -0,0 +1,72 @@
+"""
+Sparse fieldsets for list endpoints: `?fields=product_name,current_total_stock`
+returns only those attributes (and $id) of each document.
+
+The attributes are selected in Appwrite with Query.select, so the rest are never
+transferred, and the response is serialized through a copy of the endpoint's
+response model with just those fields.
+"""
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+ID = "$id"
+
+
+def _attributes(model: Type[BaseModel]) -> dict:
+    """Document attribute (the field's alias, e.g. "$id", or its name) -> field name."""
+    return {info.alias or name: name for name, info in model.model_fields.items()}
+
+
+def parse(fields: Optional[str], model: Type[BaseModel]) -> Optional[List[str]]:
+    """
+    The attributes asked for in a comma-separated `fields` parameter, checked against
+    `model`, always with $id first. None (everything) when `fields` is empty.
+    Raises a 400 for attributes the model doesn't have.
+    """
+    requested = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    if not requested:
+        return None
+    attributes = _attributes(model)
+    names = {name: attribute for attribute, name in attributes.items()}  # so "id" works as well as "$id"
+    selected, unknown = [ID], []
+    for field in requested:
+        attribute = field if field in attributes else names.get(field)
+        if attribute is None:
+            unknown.append(field)
+        elif attribute not in selected:
+            selected.append(attribute)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(attributes)}"
+        )
+    return selected
+
+
+@lru_cache(maxsize=128)
+def partial_model(model: Type[BaseModel], attributes: Tuple[str, ...]) -> Type[BaseModel]:
+    """A copy of `model` with only the fields for `attributes` (same types, aliases and defaults)."""
+    wanted = {_attributes(model)[attribute] for attribute in attributes}
+    return create_model(
+        f"{model.__name__}Fields",
+        __config__=ConfigDict(populate_by_name=True),
+        **{name: (info.annotation, info) for name, info in model.model_fields.items() if name in wanted}
+    )
+
+
+@lru_cache(maxsize=128)
+def _adapter(response_type: Any) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+def respond(content: Any, response_type: Any) -> Response:
+    """
+    Serializes `content` as `response_type` (built with partial_model(), e.g.
+    List[partial_model(...)]) straight to JSON, bypassing the route's full response model.
+    """
+    adapter = _adapter(response_type)
+    return Response(content=adapter.dump_json(adapter.validate_python(content), by_alias=True),
+                    media_type="application/json")
@@ -0,0 +1,257 @@
+"""
+Encoding of the line items stored in sales_orders.items_sold and
+purchase_orders.items_received.
+
+Items used to be stored as json.dumps({"items": [...]}). The compact format
+("i1:" + base64) packs them with struct instead, little-endian:
+
+    H n + B size, then n IDs of `size` bytes   hex strings such as Appwrite IDs, at half size
+    H n + I length, then UTF-8 text            the n other strings, joined by NUL
+    B shape count, then per shape              the keys and value types of an item:
+        H length + B field count + a type byte per field + the keys, joined by NUL
+    per shape: H item count + the items' values, packed back to back
+    if there's more than one shape: B shape index per item, to restore the order
+
+String values are stored as indexes into the strings (IDs first, then text), so
+IDs and names repeated across lines are stored once. Lines of one cart almost
+always share a shape, so each shape's items are unpacked with a single call, and
+carts written by the same code share shapes, whose decoders are cached.
+
+decode_items() reads both formats, so rows written before the switch keep
+working. Items the compact format can't hold (lists, dicts, NUL characters,
+more than 255 shapes) are written as JSON. This module is imported by the
+report process pool; keep it light.
+"""
+import base64
+import json
+import struct
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.core import config
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+PREFIX = "i1:"
+
+_HEX_HEADER = struct.Struct("<HB")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_TEXT_HEADER = struct.Struct("<HI")
+# type tag -> struct code; T/F/N are constants and take no space
+_VALUE_CODES = {b"S": "H", b"i": "i", b"q": "q", b"d": "d", b"T": "", b"F": "", b"N": ""}
+_CONSTANTS = {b"T": True, b"F": False, b"N": None}
+_ID_LENGTH = 20  # characters in an Appwrite ID
+
+
+def _value_tag(value: Any) -> bytes:
+    if value is None:
+        return b"N"
+    if isinstance(value, bool):
+        return b"T" if value else b"F"
+    if isinstance(value, int):
+        return b"i" if -2**31 <= value < 2**31 else b"q"
+    if isinstance(value, float):
+        return b"d"
+    if isinstance(value, str):
+        return b"S"
+    raise TypeError(f"Can't pack {type(value).__name__} values")
+
+
+def _is_hex_id(value: str) -> bool:
+    # Must round-trip exactly through bytes.fromhex(...).hex()
+    if len(value) != _ID_LENGTH:
+        return False
+    try:
+        return bytes.fromhex(value).hex() == value
+    except ValueError:
+        return False
+
+
+def _pack(items: List[dict]) -> bytes:
+    # Strings: hex IDs first, then text, indexed in that order
+    all_strings = dict.fromkeys(value for item in items for value in item.values() if isinstance(value, str))
+    hex_ids = [value for value in all_strings if _is_hex_id(value)]
+    texts = [value for value in all_strings if not _is_hex_id(value)]
+    if any("\0" in text for text in texts) or any("\0" in key for item in items for key in item):
+        raise ValueError("NUL in a string")
+    index = {value: i for i, value in enumerate(hex_ids + texts)}
+    if len(index) > 0xFFFF or len(items) > 0xFFFF:
+        raise ValueError("Too many items to pack")
+
+    shapes: Dict[Tuple[Tuple[str, bytes], ...], list] = {}
+    order = []
+    for item in items:
+        shape = tuple((key, _value_tag(value)) for key, value in item.items())
+        values = [index[value] if tag == b"S" else value
+                  for (_, tag), value in zip(shape, item.values()) if _VALUE_CODES[tag]]
+        group = shapes.setdefault(shape, [])
+        group.append(values)
+        order.append(list(shapes).index(shape))
+    if len(shapes) > 0xFF:
+        raise ValueError("Too many item shapes")
+
+    out = [_HEX_HEADER.pack(len(hex_ids), _ID_LENGTH // 2), b"".join(bytes.fromhex(value) for value in hex_ids)]
+    text = "\0".join(texts).encode("utf-8")
+    out += [_TEXT_HEADER.pack(len(texts), len(text)), text, _U8.pack(len(shapes))]
+    for shape in shapes:
+        descriptor = (_U8.pack(len(shape)) + b"".join(tag for _, tag in shape)
+                      + "\0".join(key for key, _ in shape).encode("utf-8"))
+        out.append(_U16.pack(len(descriptor)) + descriptor)
+    for shape, group in shapes.items():
+        fmt = "".join(_VALUE_CODES[tag] for _, tag in shape)
+        out.append(_U16.pack(len(group)) + struct.pack("<" + fmt * len(group), *(v for values in group for v in values)))
+    if len(shapes) > 1:
+        out.append(bytes(order))
+    return b"".join(out)
+
+
+@lru_cache(maxsize=256)
+def _shape_decoder(descriptor: bytes):
+    """(packed keys, positions of string values, constant fields, item struct format) for a shape."""
+    field_count = descriptor[0]
+    keys = descriptor[1 + field_count:].decode("utf-8").split("\0") if field_count else []
+    tags = [descriptor[i:i + 1] for i in range(1, 1 + field_count)]
+    if len(keys) != field_count or any(tag not in _VALUE_CODES for tag in tags):
+        raise ValueError("Corrupt item shape")
+    packed = [(key, tag) for key, tag in zip(keys, tags) if _VALUE_CODES[tag]]
+    return (
+        tuple(key for key, _ in packed),
+        tuple(i for i, (_, tag) in enumerate(packed) if tag == b"S"),
+        {key: _CONSTANTS[tag] for key, tag in zip(keys, tags) if tag in _CONSTANTS},
+        "".join(_VALUE_CODES[tag] for _, tag in packed),
+    )
+
+
+def _unpack_group(data: bytes, offset: int, item_format: str) -> Tuple[int, int, list]:
+    """Reads one shape's items: (offset after them, item count, their values back to back)."""
+    (count,) = _U16.unpack_from(data, offset)
+    offset += 2
+    group_format = "<" + item_format * count
+    return offset + struct.calcsize(group_format), count, list(struct.unpack_from(group_format, data, offset))
+
+
+def _read(data: bytes) -> Tuple[List[str], list, bytes]:
+    """The strings, each shape's (decoder, item count, values) and the item order of packed items."""
+    hex_count, hex_size = _HEX_HEADER.unpack_from(data, 0)
+    offset = _HEX_HEADER.size
+    hex_text = data[offset:offset + hex_count * hex_size].hex()
+    offset += hex_count * hex_size
+    width = hex_size * 2
+    strings = [hex_text[i:i + width] for i in range(0, len(hex_text), width)]
+    text_count, text_length = _TEXT_HEADER.unpack_from(data, offset)
+    offset += _TEXT_HEADER.size
+    if text_count:
+        strings += data[offset:offset + text_length].decode("utf-8").split("\0")
+    offset += text_length
+
+    (shape_count,) = _U8.unpack_from(data, offset)
+    offset += 1
+    shapes = []
+    for _ in range(shape_count):
+        (length,) = _U16.unpack_from(data, offset)
+        offset += 2
+        shapes.append(_shape_decoder(data[offset:offset + length]))
+        offset += length
+
+    groups = []
+    for decoder in shapes:
+        offset, count, values = _unpack_group(data, offset, decoder[3])
+        groups.append((decoder, count, values))
+
+    order = data[offset:]
+    if shape_count > 1 and len(order) != sum(count for _, count, _ in groups):
+        raise ValueError("Item order doesn't match the item count")
+    if shape_count <= 1 and order:
+        raise ValueError("Trailing bytes after the packed items")
+    return strings, groups, order
+
+
+def _in_order(rows_by_shape: List[list], order: bytes) -> list:
+    if len(rows_by_shape) <= 1:
+        return rows_by_shape[0] if rows_by_shape else []
+    iterators = [iter(rows) for rows in rows_by_shape]
+    return [next(iterators[shape_index]) for shape_index in order]
+
+
+def _unpack(data: bytes) -> List[dict]:
+    strings, groups, order = _read(data)
+    rows_by_shape = []
+    for (keys, string_positions, constants, _), count, values in groups:
+        width = len(keys)
+        # Swap string indexes for the strings, a column at a time
+        for position in string_positions:
+            values[position::width] = [strings[i] for i in values[position::width]]
+        group = [dict(zip(keys, row)) for row in zip(*[iter(values)] * width)] if width else [{} for _ in range(count)]
+        if constants:
+            for item in group:
+                item.update(constants)
+        rows_by_shape.append(group)
+    return _in_order(rows_by_shape, order)
+
+
+def _unpack_columns(data: bytes, columns: Sequence[str]) -> List[tuple]:
+    strings, groups, order = _read(data)
+    rows_by_shape = []
+    for (keys, string_positions, constants, _), count, values in groups:
+        width = len(keys)
+        selected = []
+        for column in columns:
+            if column in keys:
+                position = keys.index(column)
+                column_values = values[position::width]
+                if position in string_positions:
+                    column_values = [strings[i] for i in column_values]
+                selected.append(column_values)
+            else:
+                selected.append([constants.get(column)] * count)
+        rows_by_shape.append(list(zip(*selected)) if selected else [()] * count)
+    return _in_order(rows_by_shape, order)
+
+
+def encode_items(items: List[dict]) -> str:
+    """Encodes line items for storage, compactly unless ITEM_ENCODING is "json"."""
+    if config.ITEM_ENCODING == "compact":
+        try:
+            return PREFIX + base64.b64encode(_pack(items)).decode("ascii")
+        except (TypeError, ValueError):
+            pass  # unusual values: fall back to JSON, which decode_items reads too
+    return json.dumps({"items": items})
+
+
+def decode_items(value: Any) -> List[dict]:
+    """
+    The line items of a stored items_sold/items_received value, in either format.
+    Empty values give []. Raises ValueError if the value can't be read.
+    """
+    if not value:
+        return []
+    if isinstance(value, list):  # already decoded
+        return value
+    if value.startswith(PREFIX):
+        try:
+            return _unpack(base64.b64decode(value[len(PREFIX):], validate=True))
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt packed items: {e}") from e
+    try:
+        return _loads(value).get("items", [])
+    except AttributeError as e:  # valid JSON, but not an object
+        raise ValueError("Items JSON is not an object") from e
+
+
+def decode_columns(value: Any, columns: Sequence[str]) -> List[tuple]:
+    """
+    Just some fields of each stored line item, as tuples in `columns` order (None
+    where an item lacks the field). Much cheaper than decode_items() on compact
+    values, as no dicts are built and only the wanted strings are looked up.
+    """
+    if isinstance(value, str) and value.startswith(PREFIX):
+        try:
+            return _unpack_columns(base64.b64decode(value[len(PREFIX):], validate=True), columns)
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError(f"Corrupt packed items: {e}") from e
+    return [tuple(item.get(column) for column in columns) for item in decode_items(value)]
@@ -0,0 +1,70 @@
+from typing import Callable, Optional
+
+from appwrite.query import Query
+from app.core.sqlite_backend import SQLiteDatabases
+
+PAGE_SIZE = 100
+
+
+def pull_changes(
+    remote,
+    local: SQLiteDatabases,
+    database_id: str,
+    collection_id: str,
+    skip: Optional[Callable[[str], bool]] = None
+) -> int:
+    """
+    Copies documents changed since the last pull of `collection_id` from `remote` into
+    `local`, and advances the collection's $updatedAt watermark. Documents for which
+    `skip(document_id)` is true are left alone (e.g. because they have unpushed local
+    changes). Returns the number of documents copied.
+
+    Deletions are not detected here; see remove_deleted.
+    """
+    watermark = local.get_watermark(collection_id)
+    copied = 0
+    cursor = None
+    while True:
+        queries = [Query.order_asc("$updatedAt"), Query.limit(PAGE_SIZE)]
+        if watermark:
+            # Re-read the watermark instant itself: several documents can share a timestamp
+            queries.append(Query.greater_than_equal("$updatedAt", watermark))
+        if cursor:
+            queries.append(Query.cursor_after(cursor))
+
+        page = remote.list_documents(database_id=database_id, collection_id=collection_id, queries=queries)
+        documents = page["documents"]
+        for document in documents:
+            if skip is None or not skip(document["$id"]):
+                local.upsert_document(collection_id, document)
+                copied += 1
+        if documents:
+            local.set_watermark(collection_id, documents[-1]["$updatedAt"])
+            cursor = documents[-1]["$id"]
+        if len(documents) < PAGE_SIZE:
+            return copied
+
+
+def remove_deleted(remote, local: SQLiteDatabases, database_id: str, collection_id: str) -> int:
+    """
+    Deletes local copies of documents that no longer exist in `remote`, which
+    pull_changes cannot see. Walks the remote collection's IDs only.
+    Returns the number of documents removed.
+    """
+    remote_ids = set()
+    cursor = None
+    while True:
+        queries = [Query.select(["$id"]), Query.limit(PAGE_SIZE)]
+        if cursor:
+            queries.append(Query.cursor_after(cursor))
+        documents = remote.list_documents(database_id=database_id, collection_id=collection_id, queries=queries)["documents"]
+        remote_ids.update(document["$id"] for document in documents)
+        if len(documents) < PAGE_SIZE:
+            break
+        cursor = documents[-1]["$id"]
+
+    removed = 0
+    for document_id in local.document_ids(collection_id) - remote_ids:
+        local.delete_document(database_id, collection_id, document_id)
+        removed += 1
+    return removed
@@ -0,0 +1,333 @@
+import json
+import logging
+import time
+from typing import List, Optional
+
+from appwrite.exception import AppwriteException
+from fastapi import HTTPException
+from app.core import config
+from app.core.admission import is_backend_failure
+from app.core.mirror import pull_changes
+from app.core.sqlite_backend import SQLiteDatabases, now_iso
+
+logger = logging.getLogger(__name__)
+
+# Counters that the tills and the back office both change (stock levels, credit
+# balances). When the remote value moved while a change was queued, the change is
+# re-applied as a delta on top of the remote value instead of overwriting it.
+COUNTER_FIELDS = ("current_total_stock", "quantity_in_stock", "outstanding_balance")
+
+
+def mirrored_collections() -> List[str]:
+    """Collections the POS reads from its local mirror."""
+    return [
+        config.APPWRITE_COLLECTION_PRODUCTS_ID,
+        config.APPWRITE_COLLECTION_BATCHES_ID,
+        config.APPWRITE_COLLECTION_CUSTOMERS_ID,
+    ]
+
+
+def is_unreachable(error: BaseException) -> bool:
+    if isinstance(error, HTTPException):
+        return error.status_code == 503
+    return is_backend_failure(error)
+
+
+class OfflineStore(SQLiteDatabases):
+    """The local document store, plus the outbound replication queue and a conflict log."""
+
+    def _create_schema(self):
+        super()._create_schema()
+        connection = self._connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                operation TEXT NOT NULL,
+                database_id TEXT NOT NULL,
+                collection_id TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                data TEXT,
+                base TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_document ON outbox (collection_id, document_id)"
+        )
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS replication_conflicts (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                detected_at TEXT NOT NULL,
+                collection_id TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                detail TEXT NOT NULL
+            )
+        """)
+
+    def enqueue(self, operation: str, database_id: str, collection_id: str, document_id: str,
+                data: Optional[dict] = None, base: Optional[dict] = None):
+        self._connection().execute(
+            "INSERT INTO outbox (created_at, operation, database_id, collection_id, document_id, data, base) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), operation, database_id, collection_id, document_id,
+             json.dumps(data) if data is not None else None, json.dumps(base) if base else None)
+        )
+
+    def next_pending(self) -> Optional[dict]:
+        row = self._connection().execute(
+            "SELECT seq, operation, database_id, collection_id, document_id, data, base FROM outbox ORDER BY seq LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        seq, operation, database_id, collection_id, document_id, data, base = row
+        return {
+            "seq": seq, "operation": operation, "database_id": database_id, "collection_id": collection_id,
+            "document_id": document_id, "data": json.loads(data) if data else None, "base": json.loads(base) if base else {}
+        }
+
+    def remove_pending(self, seq: int):
+        self._connection().execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+
+    def mark_attempt_failed(self, seq: int, error: str):
+        self._connection().execute(
+            "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE seq = ?", (error, seq)
+        )
+
+    def has_pending(self, collection_id: str, document_id: str) -> bool:
+        return self._connection().execute(
+            "SELECT 1 FROM outbox WHERE collection_id = ? AND document_id = ? LIMIT 1", (collection_id, document_id)
+        ).fetchone() is not None
+
+    def record_conflict(self, collection_id: str, document_id: str, detail: dict):
+        self._connection().execute(
+            "INSERT INTO replication_conflicts (detected_at, collection_id, document_id, detail) VALUES (?, ?, ?, ?)",
+            (now_iso(), collection_id, document_id, json.dumps(detail))
+        )
+
+    def outbox_stats(self) -> dict:
+        connection = self._connection()
+        pending, oldest = connection.execute("SELECT COUNT(*), MIN(created_at) FROM outbox").fetchone()
+        conflicts = connection.execute("SELECT COUNT(*) FROM replication_conflicts").fetchone()[0]
+        return {
+            "pending_changes": pending,
+            "replication_lag_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "conflicts": conflicts,
+        }
+
+
+class OfflineFirstDatabases:
+    """
+    A Databases implementation for the POS that keeps working when Appwrite is unreachable.
+
+    - Products, batches and customers are read from a local mirror, refreshed from
+      Appwrite by the pos_mirror_sync job.
+    - Other collections are read from Appwrite, falling back to the local store.
+    - Every write is applied to the local store and queued in the outbox in one
+      transaction. The pos_outbox_sync job pushes the outbox to Appwrite in order.
+    """
+
+    service_name = "offline_pos"
+
+    def __init__(self, remote, store: OfflineStore):
+        self.remote = remote
+        self.store = store
+        self.online = True
+        self._mirror_ready = False
+
+    @property
+    def mirror_ready(self) -> bool:
+        # Set once the first full pull has completed, by whichever worker ran it
+        if not self._mirror_ready:
+            self._mirror_ready = self.store.get_watermark("mirror_ready") is not None
+        return self._mirror_ready
+
+    def __getattr__(self, name: str):
+        # Anything the POS doesn't use (e.g. list_collections) goes straight to Appwrite
+        return getattr(self.remote, name)
+
+    # --- Reads ---
+
+    def get_document(self, database_id: str, collection_id: str, document_id: str, queries: List[str] = None) -> dict:
+        if collection_id in mirrored_collections():
+            try:
+                return self.store.get_document(database_id, collection_id, document_id, queries)
+            except AppwriteException as e:
+                if e.code != 404 or not self.online:
+                    raise
+            # Not mirrored yet (e.g. created since the last pull): fetch it and keep a copy
+            document = self.remote.get_document(database_id=database_id, collection_id=collection_id, document_id=document_id)
+            self.store.upsert_document(collection_id, document)
+            return self.store.get_document(database_id, collection_id, document_id, queries)
+
+        return self._remote_or_local("get_document", database_id=database_id, collection_id=collection_id,
+                                     document_id=document_id, queries=queries)
+
+    def list_documents(self, database_id: str, collection_id: str, queries: List[str] = None) -> dict:
+        if collection_id in mirrored_collections() and self.mirror_ready:
+            # Changes made elsewhere (e.g. a delivery just received) arrive with the next
+            # pos_mirror_sync run, every REPLICATION_PULL_INTERVAL_SECONDS; pulling here would
+            # put a remote call back on the checkout path.
+            return self.store.list_documents(database_id, collection_id, queries)
+        return self._remote_or_local("list_documents", database_id=database_id, collection_id=collection_id, queries=queries)
+
+    def _remote_or_local(self, operation: str, **kwargs):
+        if self.online:
+            try:
+                return getattr(self.remote, operation)(**kwargs)
+            except Exception as e:
+                if not is_unreachable(e):
+                    raise
+                self.online = False
+                logger.warning("Appwrite unreachable, serving POS reads locally: %s", e)
+        return getattr(self.store, operation)(**kwargs)
+
+    # --- Writes ---
+
+    def create_document(self, database_id: str, collection_id: str, document_id: str, data: dict, permissions: List[str] = None) -> dict:
+        with self.store._transaction():
+            document = self.store.create_document(database_id, collection_id, document_id, data)
+            self.store.enqueue("create", database_id, collection_id, document["$id"], data=data)
+        return document
+
+    def update_document(self, database_id: str, collection_id: str, document_id: str, data: dict = None, permissions: List[str] = None) -> dict:
+        data = data or {}
+        with self.store._transaction():
+            before = self.store.get_document(database_id, collection_id, document_id)
+            base = {field: before.get(field) for field in COUNTER_FIELDS if field in data}
+            document = self.store.update_document(database_id, collection_id, document_id, data)
+            self.store.enqueue("update", database_id, collection_id, document_id, data=data, base=base)
+        return document
+
+    def delete_document(self, database_id: str, collection_id: str, document_id: str) -> dict:
+        with self.store._transaction():
+            self.store.delete_document(database_id, collection_id, document_id)
+            self.store.enqueue("delete", database_id, collection_id, document_id)
+        return {}
+
+    # --- Replication ---
+
+    def push_pending(self) -> int:
+        """Pushes queued changes to Appwrite in order. Stops at the first unreachable error."""
+        pushed = 0
+        while True:
+            change = self.store.next_pending()
+            if change is None:
+                return pushed
+            try:
+                self._push(change)
+            except Exception as e:
+                if is_unreachable(e):
+                    self.store.mark_attempt_failed(change["seq"], str(e))
+                    raise
+                # Appwrite rejected the change outright; retrying it would block the queue forever
+                logger.error("Dropping change %s rejected by Appwrite: %s", change, e)
+                self.store.record_conflict(change["collection_id"], change["document_id"],
+                                           {"rejected_change": change, "error": str(e)})
+            self.store.remove_pending(change["seq"])
+            pushed += 1
+            self.store.set_watermark("last_push_at", now_iso())
+
+    def _push(self, change: dict):
+        kwargs = {
+            "database_id": change["database_id"],
+            "collection_id": change["collection_id"],
+            "document_id": change["document_id"],
+        }
+        if change["operation"] == "create":
+            try:
+                remote_document = self.remote.create_document(**kwargs, data=change["data"])
+            except AppwriteException as e:
+                if e.code != 409:
+                    raise
+                # Already pushed before a crash or lost response
+                return
+        elif change["operation"] == "delete":
+            try:
+                self.remote.delete_document(**kwargs)
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+            return
+        else:
+            data = dict(change["data"])
+            if change["base"]:
+                remote_before = self.remote.get_document(**kwargs)
+                for field, base_value in change["base"].items():
+                    remote_value = remote_before.get(field)
+                    if remote_value == base_value:
+                        continue
+                    # Someone else changed the counter meanwhile: apply our change as a delta
+                    merged_value = remote_value + (data[field] - base_value)
+                    self.store.record_conflict(change["collection_id"], change["document_id"], {
+                        "field": field, "base_value": base_value, "local_value": data[field],
+                        "remote_value": remote_value, "resolved_value": merged_value,
+                    })
+                    logger.warning("Replication conflict on %s/%s.%s: base=%s local=%s remote=%s -> %s",
+                                   change["collection_id"], change["document_id"], field,
+                                   base_value, data[field], remote_value, merged_value)
+                    data[field] = merged_value
+            remote_document = self.remote.update_document(**kwargs, data=data)
+
+        if change["collection_id"] in mirrored_collections() and not self._has_later_changes(change):
+            self.store.upsert_document(change["collection_id"], remote_document)
+
+    def _has_later_changes(self, change: dict) -> bool:
+        # The change being pushed is still in the outbox, so look for a second entry
+        return self.store._connection().execute(
+            "SELECT 1 FROM outbox WHERE collection_id = ? AND document_id = ? AND seq > ? LIMIT 1",
+            (change["collection_id"], change["document_id"], change["seq"])
+        ).fetchone() is not None
+
+    def copy_documents(self, collection_id: str, documents: List[dict]):
+        """Updates the mirror with documents just written to Appwrite by another path (e.g. repricing)."""
+        if collection_id not in mirrored_collections():
+            return
+        for document in documents:
+            if not self.store.has_pending(collection_id, document["$id"]):
+                self.store.upsert_document(collection_id, document)
+
+    def pull_mirror(self):
+        """Refreshes the local mirror from Appwrite, leaving documents with unpushed changes alone."""
+        for collection_id in mirrored_collections():
+            self._pull(collection_id)
+        if not self.mirror_ready:
+            self.store.set_watermark("mirror_ready", now_iso())
+
+    def _pull(self, collection_id: str):
+        pull_changes(
+            self.remote, self.store, config.APPWRITE_DATABASE_ID, collection_id,
+            skip=lambda document_id: self.store.has_pending(collection_id, document_id)
+        )
+        self.store.set_watermark("last_pull_at", now_iso())
+
+    def sync_outbox(self):
+        """Scheduled job: pushes queued changes, tracking whether Appwrite is reachable."""
+        self._sync(self.push_pending)
+
+    def sync_mirror(self):
+        """Scheduled job: refreshes the local mirror, tracking whether Appwrite is reachable."""
+        self._sync(self.pull_mirror)
+
+    def _sync(self, step):
+        try:
+            step()
+        except Exception as e:
+            if not is_unreachable(e):
+                raise
+            if self.online:
+                logger.warning("Appwrite unreachable, POS changes are queued locally: %s", e)
+            self.online = False
+            return
+        self.online = True
+
+    def status(self) -> dict:
+        return {
+            "online": self.online,
+            "mirror_ready": self.mirror_ready,
+            "last_push_at": self.store.get_watermark("last_push_at"),
+            "last_pull_at": self.store.get_watermark("last_pull_at"),
+            **self.store.outbox_stats(),
+        }
+
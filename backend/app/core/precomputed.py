@@ -0,0 +1,31 @@
+import json
+import os
+from typing import Any, Optional
+
+from app.core import config
+from app.core.utils import get_current_ist_time
+
+# Results of scheduled jobs, shared by all workers through the filesystem
+RESULTS_DIR = os.path.join(config.SCHEDULER_STATE_DIR, "results")
+
+
+def _path(name: str) -> str:
+    return os.path.join(RESULTS_DIR, f"{name}.json")
+
+
+def save(name: str, value: Any):
+    """Stores a job result atomically, stamped with the time it was computed."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    tmp_path = _path(name) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"computed_at": get_current_ist_time().isoformat(), "value": value}, f)
+    os.replace(tmp_path, _path(name))
+
+
+def load(name: str) -> Optional[dict]:
+    """Returns {"computed_at", "value"} for a stored result, or None if it hasn't been computed."""
+    try:
+        with open(_path(name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
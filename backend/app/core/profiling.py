@@ -0,0 +1,161 @@
+import asyncio
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+
+class StackSampler:
+    """
+    Periodically samples the call stack of one thread from a background thread.
+
+    The services call Appwrite synchronously from the event loop thread, so sampling
+    that thread shows where a request spends its time. With `loop` given, a sample is
+    only kept when one of the tasks in `tasks` (the profiled request's, see
+    _track_request_tasks) is running, so concurrent requests don't mix into the
+    profile; time the request spends awaiting isn't sampled then. The samples are
+    aggregated as "folded" stacks (one "frame;frame;frame count" line per unique
+    stack), which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.loop = loop
+        self.tasks: weakref.WeakSet = weakref.WeakSet()
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def _running_task(self) -> Optional[asyncio.Task]:
+        return asyncio.current_task(self.loop) if self.loop is not None else None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            task = self._running_task()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            if self.loop is not None and (task not in self.tasks or self._running_task() is not task):
+                # Another request's task, the loop itself, or a task switch mid-sample
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # Folded stacks are written root first.
+            self.stacks[";".join(reversed(frames))] += 1
+
+    def to_folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# The sampler of the request a task is working for, copied into the tasks it creates
+_profiled_request: ContextVar[Optional[StackSampler]] = ContextVar("profiled_request", default=None)
+
+
+def _track_request_tasks(loop: asyncio.AbstractEventLoop):
+    """
+    Installs (once) a task factory that adds each task created on behalf of a
+    profiled request to that request's sampler. The middlewares and the endpoint
+    each run in tasks of their own, so the request is a set of tasks.
+    """
+    previous = loop.get_task_factory()
+    if getattr(previous, "tracks_profiled_requests", False):
+        return
+
+    def factory(loop, coro, **kwargs):
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        sampler = _profiled_request.get()
+        if sampler is not None:
+            sampler.tasks.add(task)
+        return task
+
+    factory.tracks_profiled_requests = True
+    loop.set_task_factory(factory)
+
+
+def is_profile_requested(header_value: Optional[str]) -> bool:
+    """Checks the X-Profile header against the configured token."""
+    if not config.PROFILING_TOKEN or not header_value:
+        return False
+    return hmac.compare_digest(header_value, config.PROFILING_TOKEN)
+
+
+def write_profile(sampler: StackSampler, request: Request, elapsed_ms: float) -> str:
+    """Writes the folded stacks of a request to PROFILING_OUTPUT_DIR and returns the file name."""
+    os.makedirs(config.PROFILING_OUTPUT_DIR, exist_ok=True)
+    path_slug = re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_") or "root"
+    file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{path_slug}-{int(elapsed_ms)}ms.folded"
+    with open(os.path.join(config.PROFILING_OUTPUT_DIR, file_name), "w") as profile_file:
+        profile_file.write(sampler.to_folded())
+    return file_name
+
+
+async def profile_requests(request: Request, call_next):
+    """
+    HTTP middleware for on-demand and slow-request profiling.
+
+    Does nothing unless PROFILING_ENABLED is set. A request is sampled when it carries
+    a valid X-Profile header, or when a slow-request threshold is configured. Profiles
+    of requested or slow requests are written to PROFILING_OUTPUT_DIR.
+    """
+    if not config.PROFILING_ENABLED:
+        return await call_next(request)
+
+    requested = is_profile_requested(request.headers.get(PROFILE_HEADER))
+    capture_slow = config.SLOW_REQUEST_THRESHOLD_MS > 0
+    if not requested and not capture_slow:
+        return await call_next(request)
+
+    loop = asyncio.get_running_loop()
+    _track_request_tasks(loop)
+    sampler = StackSampler(threading.get_ident(), config.PROFILING_SAMPLE_INTERVAL_MS / 1000, loop)
+    sampler.tasks.add(asyncio.current_task())
+    token = _profiled_request.set(sampler)
+    sampler.start()
+    started = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        sampler.stop()
+        _profiled_request.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        is_slow = capture_slow and elapsed_ms >= config.SLOW_REQUEST_THRESHOLD_MS
+
+        if requested or is_slow:
+            # File I/O, so it's kept off the event loop like the other requests' work
+            file_name = await run_in_threadpool(write_profile, sampler, request, elapsed_ms)
+            if is_slow:
+                logger.warning(
+                    "Slow request: %s %s took %.1f ms (profile: %s)",
+                    request.method, request.url.path, elapsed_ms, file_name
+                )
+            if requested and response is not None:
+                response.headers[PROFILE_FILE_HEADER] = file_name
@@ -0,0 +1,77 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Sequence
+
+from appwrite.query import Query
+from app.core import config
+
+# Appwrite's largest page
+PAGE_SIZE = 100
+
+_FILTERS = {"equal": Query.equal, "contains": Query.contains}
+
+_chunk_pool = ThreadPoolExecutor(max_workers=config.QUERY_CHUNK_CONCURRENCY, thread_name_prefix="query-chunk")
+
+
+def list_all(db, collection_id: str, queries: Sequence[str] = ()) -> List[dict]:
+    """All documents matching `queries`, read page by page with a cursor."""
+    documents = []
+    cursor = None
+    while True:
+        page_queries = [*queries, Query.limit(PAGE_SIZE)]
+        if cursor:
+            page_queries.append(Query.cursor_after(cursor))
+        page = db.list_documents(
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=collection_id,
+            queries=page_queries
+        )["documents"]
+        documents.extend(page)
+        if len(page) < PAGE_SIZE:
+            return documents
+        cursor = page[-1]["$id"]
+
+
+def list_by_values(
+    db,
+    collection_id: str,
+    attribute: str,
+    values: Iterable,
+    queries: Sequence[str] = (),
+    method: str = "equal"
+) -> List[dict]:
+    """
+    All documents whose `attribute` matches any of `values` (Query.equal or
+    Query.contains), plus any extra `queries`.
+
+    Appwrite accepts at most QUERY_CHUNK_SIZE values per query, so the values are
+    split into chunks that are queried concurrently (QUERY_CHUNK_CONCURRENCY at a
+    time) and paginated. Documents matched by several chunks are returned once.
+    """
+    values = list(dict.fromkeys(values))
+    if not values:
+        return []
+    build_filter = _FILTERS[method]
+    chunks = [values[i:i + config.QUERY_CHUNK_SIZE] for i in range(0, len(values), config.QUERY_CHUNK_SIZE)]
+
+    def read_chunk(chunk: list) -> List[dict]:
+        return list_all(db, collection_id, [build_filter(attribute, chunk), *queries])
+
+    if len(chunks) == 1:
+        results = [read_chunk(chunks[0])]
+    else:
+        # Each chunk runs with a copy of the caller's context, so tracing spans and
+        # the admission lane carry over to the pool threads
+        futures = [_chunk_pool.submit(contextvars.copy_context().run, read_chunk, chunk) for chunk in chunks]
+        results = [future.result() for future in futures]
+
+    merged: Dict[str, dict] = {}
+    for documents in results:
+        for document in documents:
+            merged.setdefault(document["$id"], document)
+    return list(merged.values())
+
+
+def get_by_ids(db, collection_id: str, ids: Iterable[str], queries: Sequence[str] = ()) -> Dict[str, dict]:
+    """document ID -> document for the given IDs. IDs that don't exist are left out."""
+    return {document["$id"]: document for document in list_by_values(db, collection_id, "$id", ids, queries)}
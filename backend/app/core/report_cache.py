@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core import config
+from app.core.sales_facts import to_timestamp
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, Optional[str], Optional[str]]
+
+
+def _date_range(start: Optional[str], end: Optional[str]) -> Optional[Tuple[int, int]]:
+    """The range as timestamps, or None for results that aren't date-bound."""
+    return (to_timestamp(start), to_timestamp(end)) if start and end else None
+
+
+def _affected(date_range: Optional[Tuple[int, int]], moment: Optional[int]) -> bool:
+    return date_range is None or (moment is not None and date_range[0] <= moment <= date_range[1])
+
+
+class _Entry:
+    def __init__(self, value: Any, date_range: Optional[Tuple[int, int]]):
+        self.value = value
+        self.date_range = date_range
+        self.computed_at = time.monotonic()
+
+
+class _Refresh:
+    """An in-flight computation of one key."""
+
+    def __init__(self, date_range: Optional[Tuple[int, int]]):
+        self.date_range = date_range
+        self.invalidated = False
+        self.task: Optional[asyncio.Task] = None
+
+
+class ReportCache:
+    """
+    A stale-while-revalidate cache for report results, keyed by report name and
+    date range.
+
+    - A result younger than `fresh_seconds` is served as is.
+    - A result up to `max_stale_seconds` old is also served immediately, while a
+      background task recomputes it.
+    - Anything older, or missing, is computed on the request path. Concurrent
+      requests for the same key share one computation.
+
+    Writes invalidate selectively (see invalidate()). A result computed while an
+    invalidation hit its key is not stored, so it can't resurrect outdated data.
+    Only cached results (at most `max_entries`) and in-flight computations are
+    tracked, so memory and invalidation cost don't grow with the keys ever requested.
+    The cache is per process: with several workers, another worker's writes are only
+    picked up once its entries go stale.
+    """
+
+    def __init__(self, fresh_seconds: float, max_stale_seconds: float, max_entries: int):
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, _Refresh] = {}
+        self.hits = self.stale_hits = self.misses = self.invalidations = 0
+
+    async def get(self, report: str, start: Optional[str], end: Optional[str],
+                  compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached result of `report` for [start, end], computing it with
+        `compute` when needed. Pass start=end=None for results that reflect current
+        state rather than a date range.
+        """
+        key = (report, start, end)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.computed_at
+            if age < self.fresh_seconds:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.max_stale_seconds:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._start_refresh(key, entry.date_range, compute)
+                return entry.value
+            del self._entries[key]
+
+        self.misses += 1
+        return await self._start_refresh(key, _date_range(start, end), compute)
+
+    def _start_refresh(self, key: CacheKey, date_range: Optional[Tuple[int, int]],
+                       compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        refresh = self._inflight.get(key)
+        if refresh is None:
+            refresh = _Refresh(date_range)
+            refresh.task = asyncio.ensure_future(self._refresh(key, refresh, compute))
+            self._inflight[key] = refresh
+            # Consume a background refresh's error so it isn't reported as unhandled
+            refresh.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return refresh.task
+
+    async def _refresh(self, key: CacheKey, refresh: _Refresh, compute: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await compute()
+        except Exception:
+            logger.warning("Computing report %s failed", key, exc_info=True)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        if not refresh.invalidated:
+            self._entries[key] = _Entry(value, refresh.date_range)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, at: Optional[str] = None):
+        """
+        Drops results affected by a write. Results that reflect current state are
+        always dropped. With `at` (the write's business date, e.g. a sale's
+        sale_date_time), date-bound results whose range contains it are dropped too.
+        Expired results are dropped on the way.
+        """
+        moment = to_timestamp(at) if at else None
+        expired_before = time.monotonic() - self.max_stale_seconds
+        for key, entry in list(self._entries.items()):
+            if _affected(entry.date_range, moment):
+                del self._entries[key]
+                self.invalidations += 1
+            elif entry.computed_at <= expired_before:
+                del self._entries[key]
+        for refresh in self._inflight.values():
+            if _affected(refresh.date_range, moment):
+                refresh.invalidated = True
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+cache = ReportCache(
+    fresh_seconds=config.REPORT_CACHE_FRESH_SECONDS if config.REPORT_CACHE_ENABLED else 0,
+    max_stale_seconds=config.REPORT_CACHE_MAX_STALE_SECONDS if config.REPORT_CACHE_ENABLED else 0,
+    max_entries=config.REPORT_CACHE_MAX_ENTRIES,
+)
+
+
+def invalidate(at: Optional[str] = None):
+    """Write hook: call after recording a sale, purchase, payment or operating cost."""
+    cache.invalidate(at)
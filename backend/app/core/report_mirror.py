@@ -0,0 +1,125 @@
+from typing import List
+
+from appwrite.exception import AppwriteException
+from app.core import config
+from app.core.mirror import pull_changes, remove_deleted
+from app.core.sqlite_backend import SQLiteDatabases, now_iso
+
+# Attributes the report queries filter and sort on
+INDEXED_ATTRIBUTES = ("sale_date_time", "quantity_in_stock", "expense_date", "payment_status", "product_id")
+
+
+def mirrored_collections() -> List[str]:
+    """Collections the reports read from the mirror."""
+    return [
+        config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
+        config.APPWRITE_COLLECTION_BATCHES_ID,
+        config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID,
+        config.APPWRITE_COLLECTION_OPERATING_COSTS_ID,
+    ]
+
+
+class ReportMirror:
+    """
+    A read-side copy of the collections the reports aggregate over, kept in a local
+    SQLite file and refreshed incrementally by $updatedAt watermark.
+
+    It implements the Databases interface for report_service: reads of mirrored
+    collections are answered locally once the first refresh has completed, so report
+    queries cost no Appwrite requests. Writes (e.g. new operating costs) go to Appwrite
+    and are copied into the mirror straight away. Anything else goes to Appwrite.
+    """
+
+    def __init__(self, remote, store: SQLiteDatabases):
+        self.remote = remote
+        self.store = store
+        self._ready = False
+        self.documents_copied = 0
+        self.documents_removed = 0
+
+    @property
+    def ready(self) -> bool:
+        # Set once the first full refresh has completed, by whichever worker ran it
+        if not self._ready:
+            self._ready = self.store.get_watermark("mirror_ready") is not None
+        return self._ready
+
+    def __getattr__(self, name: str):
+        return getattr(self.remote, name)
+
+    # --- Reads ---
+
+    def get_document(self, database_id: str, collection_id: str, document_id: str, queries: List[str] = None) -> dict:
+        if self.ready and collection_id in mirrored_collections():
+            try:
+                return self.store.get_document(database_id, collection_id, document_id, queries)
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+            # Possibly created since the last refresh (e.g. a sale viewed right after checkout)
+        return self.remote.get_document(database_id=database_id, collection_id=collection_id,
+                                        document_id=document_id, queries=queries)
+
+    def list_documents(self, database_id: str, collection_id: str, queries: List[str] = None) -> dict:
+        if self.ready and collection_id in mirrored_collections():
+            return self.store.list_documents(database_id, collection_id, queries)
+        return self.remote.list_documents(database_id=database_id, collection_id=collection_id, queries=queries)
+
+    # --- Writes ---
+
+    def create_document(self, database_id: str, collection_id: str, document_id: str, data: dict, permissions: List[str] = None) -> dict:
+        document = self.remote.create_document(database_id=database_id, collection_id=collection_id,
+                                               document_id=document_id, data=data)
+        self._copy(collection_id, document)
+        return document
+
+    def update_document(self, database_id: str, collection_id: str, document_id: str, data: dict = None, permissions: List[str] = None) -> dict:
+        document = self.remote.update_document(database_id=database_id, collection_id=collection_id,
+                                               document_id=document_id, data=data)
+        self._copy(collection_id, document)
+        return document
+
+    def delete_document(self, database_id: str, collection_id: str, document_id: str) -> dict:
+        result = self.remote.delete_document(database_id=database_id, collection_id=collection_id, document_id=document_id)
+        if collection_id in mirrored_collections():
+            try:
+                self.store.delete_document(database_id, collection_id, document_id)
+            except AppwriteException as e:
+                if e.code != 404:
+                    raise
+        return result
+
+    def copy_documents(self, collection_id: str, documents: List[dict]):
+        """Updates the mirror with documents just written to Appwrite by another path (e.g. repricing)."""
+        for document in documents:
+            self._copy(collection_id, document)
+
+    def _copy(self, collection_id: str, document: dict):
+        if collection_id in mirrored_collections():
+            self.store.upsert_document(collection_id, document)
+
+    # --- Maintenance ---
+
+    def refresh(self):
+        """Copies everything changed in the mirrored collections since the last refresh."""
+        for collection_id in mirrored_collections():
+            self.documents_copied += pull_changes(self.remote, self.store, config.APPWRITE_DATABASE_ID, collection_id)
+        if not self.ready:
+            self.store.set_watermark("mirror_ready", now_iso())
+        self.store.set_watermark("last_refresh_at", now_iso())
+
+    def reconcile(self):
+        """Drops mirrored documents that were deleted in Appwrite by other writers."""
+        for collection_id in mirrored_collections():
+            self.documents_removed += remove_deleted(self.remote, self.store, config.APPWRITE_DATABASE_ID, collection_id)
+        self.store.set_watermark("last_reconcile_at", now_iso())
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "last_refresh_at": self.store.get_watermark("last_refresh_at"),
+            "last_reconcile_at": self.store.get_watermark("last_reconcile_at"),
+            "documents_copied": self.documents_copied,
+            "documents_removed": self.documents_removed,
+        }
+
@@ -0,0 +1,181 @@
+import contextvars
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+from appwrite.exception import AppwriteException
+from app.core import config
+from app.core.datastore import ServiceProxy, on_event_loop
+
+READ_OPERATIONS = {"get_document", "list_documents"}
+# Writes are only retried because every caller pre-generates the document ID
+# (ID.unique()) and update payloads carry absolute values, not increments.
+IDEMPOTENT_WRITE_OPERATIONS = {"create_document", "update_document", "delete_document"}
+
+# Latency samples needed before a p95 is trusted for hedging
+MIN_LATENCY_SAMPLES = 20
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int, base_delay_ms: float, max_delay_ms: float, hedge: bool):
+        self.max_attempts = max_attempts
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.hedge = hedge
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given (1-based) failed attempt."""
+        ceiling = min(self.max_delay_ms, self.base_delay_ms * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling) / 1000
+
+
+default_policy = RetryPolicy(
+    max_attempts=config.RETRY_MAX_ATTEMPTS,
+    base_delay_ms=config.RETRY_BASE_DELAY_MS,
+    max_delay_ms=config.RETRY_MAX_DELAY_MS,
+    hedge=config.HEDGED_READS_ENABLED,
+)
+
+
+def policy_for(collection_id: Optional[str]) -> RetryPolicy:
+    """Returns the default policy, with any overrides configured for the collection applied."""
+    overrides = config.RETRY_POLICY_OVERRIDES.get(collection_id)
+    if not overrides:
+        return default_policy
+    return RetryPolicy(
+        max_attempts=overrides.get("max_attempts", default_policy.max_attempts),
+        base_delay_ms=overrides.get("base_delay_ms", default_policy.base_delay_ms),
+        max_delay_ms=overrides.get("max_delay_ms", default_policy.max_delay_ms),
+        hedge=overrides.get("hedge", default_policy.hedge),
+    )
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Only transient Appwrite failures are retried: network errors, 429 and 5xx."""
+    if not isinstance(error, AppwriteException):
+        return False
+    return not error.code or error.code == 429 or error.code >= 500
+
+
+class LatencyTracker:
+    """Keeps recent call latencies per collection to derive the hedging delay."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def p95(self, key: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples[key])
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+
+latencies = LatencyTracker()
+_hedge_executor = ThreadPoolExecutor(max_workers=config.HEDGE_MAX_WORKERS, thread_name_prefix="hedged-read")
+_stats_lock = threading.Lock()
+_stats = defaultdict(lambda: {"retries": 0, "not_retried_on_loop": 0, "hedges_sent": 0, "hedges_won": 0})
+
+
+def _count(collection_id: Optional[str], counter: str):
+    with _stats_lock:
+        _stats[collection_id][counter] += 1
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return {collection: dict(counts) for collection, counts in _stats.items()}
+
+
+class RetryProxy(ServiceProxy):
+    """
+    Retries transient failures of idempotent Databases calls with jittered
+    exponential backoff, and optionally hedges slow reads.
+
+    Only calls made off the event loop (threadpool work, scheduled jobs) are retried:
+    backing off on the loop would stall every other request, so a call made there
+    gets a single attempt and its failure goes back to the client.
+    """
+
+    def _call(self, operation, method, args, kwargs):
+        if args or operation not in READ_OPERATIONS | IDEMPOTENT_WRITE_OPERATIONS:
+            return method(*args, **kwargs)
+
+        collection_id = kwargs.get("collection_id")
+        policy = policy_for(collection_id)
+        attempt = 1
+        while True:
+            try:
+                if operation in READ_OPERATIONS and policy.hedge:
+                    return self._hedged(method, kwargs, collection_id)
+                return self._timed(method, kwargs, collection_id)
+            except AppwriteException as e:
+                if attempt > 1:
+                    # An earlier attempt may have been applied even though its response was lost
+                    if operation == "create_document" and e.code == 409:
+                        return self._inner.get_document(
+                            database_id=kwargs["database_id"],
+                            collection_id=collection_id,
+                            document_id=kwargs["document_id"]
+                        )
+                    if operation == "delete_document" and e.code == 404:
+                        return {}
+                if attempt >= policy.max_attempts or not is_retryable(e):
+                    raise
+                if on_event_loop():
+                    _count(collection_id, "not_retried_on_loop")
+                    raise
+                _count(collection_id, "retries")
+                time.sleep(policy.backoff_seconds(attempt))
+                attempt += 1
+
+    def _timed(self, method, kwargs, collection_id):
+        started = time.perf_counter()
+        result = method(**kwargs)
+        latencies.record(collection_id, time.perf_counter() - started)
+        return result
+
+    def _hedged(self, method, kwargs, collection_id):
+        """
+        Sends the read, and if it hasn't answered within the collection's p95 latency,
+        sends a second identical read. The first successful response wins.
+        """
+        delay = latencies.p95(collection_id)
+        if delay is None:
+            return self._timed(method, kwargs, collection_id)
+
+        def submit():
+            # Each attempt runs in its own copy of the caller's context (lane, trace span)
+            return _hedge_executor.submit(contextvars.copy_context().run, self._timed, method, kwargs, collection_id)
+
+        primary = submit()
+        done, _ = wait([primary], timeout=max(delay, config.HEDGE_MIN_DELAY_MS / 1000))
+        if done:
+            return primary.result()
+
+        _count(collection_id, "hedges_sent")
+        hedge = submit()
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        _count(collection_id, "hedges_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+
+def instrument(db):
+    """Returns the Databases service wrapped in a RetryProxy when RETRY_ENABLED is set."""
+    return RetryProxy(db) if config.RETRY_ENABLED else db
@@ -0,0 +1,518 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from appwrite.query import Query
+from app.core import config, item_codec, queries
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialised within this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MIN_CAPACITY = 65536
+PAGE_SIZE = 100
+
+# One memory-mapped file per column. IDs are dictionary-encoded into int32 codes.
+COLUMNS = {
+    "sold_at": np.int64,              # Unix seconds (UTC)
+    "sale": np.int32,
+    "product": np.int32,
+    "batch": np.int32,
+    "quantity": np.int32,
+    "unit_cost": np.float64,
+    "unit_price": np.float64,
+    "original_unit_price": np.float64,
+    "tax_percentage": np.float64,
+}
+DICTIONARIES = ("sale", "product", "batch")
+GROUP_BY_OPTIONS = ("product", "batch", "day")
+SERIES_BUCKETS = ("hour", "day", "week", "month")
+ROLLUP_MEASURES = ("sales", "tax", "cogs", "bills")
+
+# Sale days are reported in shop time (IST)
+SHOP_UTC_OFFSET_SECONDS = 5 * 3600 + 30 * 60
+SHOP_TIMEZONE = timezone(timedelta(seconds=SHOP_UTC_OFFSET_SECONDS))
+
+
+def to_timestamp(value: str) -> int:
+    """Unix seconds for an ISO datetime string. Naive values are taken as UTC, like Appwrite does."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def line_from_detail(detail: dict) -> dict:
+    """A fact line from one entry of execute_fifo_deduction()'s details."""
+    item = detail["item_from_request"]
+    batch_doc = detail["batch_doc"]
+    product_doc = detail["product_doc"]
+    return {
+        "product_id": product_doc["$id"],
+        "batch_id": batch_doc["$id"],
+        "quantity": item.quantity,
+        "unit_cost": batch_doc["cost_price"],
+        "unit_price": item.actual_selling_price_per_unit,
+        "original_unit_price": batch_doc.get("selling_price") or product_doc.get("global_selling_price", 0.0),
+        "tax_percentage": product_doc.get("tax_percentage", 0.0),
+    }
+
+
+class _Dictionary:
+    """An append-only string <-> int32 code mapping, persisted one value per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self._offset = 0
+
+    def reload(self):
+        """Reads values appended (by any process) since the last reload."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        self._offset += len(chunk)
+        for value in chunk.decode("utf-8").splitlines():
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+
+    def code_for(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            with open(self.path, "ab") as f:
+                line = (value + "\n").encode("utf-8")
+                f.write(line)
+            self._offset += len(line)
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class SalesFactStore:
+    """
+    A columnar table of sale lines, stored as NumPy arrays in memory-mapped files.
+
+    Sales are appended as they are recorded. Queries slice the arrays up to the
+    committed row count and aggregate with vectorized operations, so they never
+    touch Appwrite or parse items_sold JSON. The row count in meta.json is written
+    last (atomically), so readers never see a half-appended sale.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._dictionaries = {name: _Dictionary(os.path.join(directory, f"{name}_ids.txt")) for name in DICTIONARIES}
+        self._arrays: Dict[str, np.memmap] = {}
+        self._capacity = 0
+        self.rows = 0
+        # Hourly (shop time) totals, kept up to date incrementally for series()
+        self._rollup_rows = 0
+        self._rollup_hours = np.zeros(0, dtype=np.int64)
+        self._rollup = {name: np.zeros(0) for name in ROLLUP_MEASURES}
+        with self._lock:
+            self._refresh()
+
+    # --- Storage ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialises appends across worker processes sharing the directory."""
+        with open(self._path(".lock"), "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Picks up rows committed by other processes since we last looked."""
+        meta_path = self._path("meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["version"] != FORMAT_VERSION:
+                raise RuntimeError(f"Unsupported sales fact store version {meta['version']} in {self.directory}")
+            self.rows = meta["rows"]
+        for dictionary in self._dictionaries.values():
+            dictionary.reload()
+        self._map(max(self._capacity, self._file_capacity(), MIN_CAPACITY))
+
+    def _file_capacity(self) -> int:
+        path = self._path("sold_at.bin")
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // np.dtype(COLUMNS["sold_at"]).itemsize
+
+    def _map(self, capacity: int):
+        if capacity == self._capacity and self._arrays:
+            return
+        for array in self._arrays.values():
+            array.flush()
+        self._arrays = {}
+        for name, dtype in COLUMNS.items():
+            path = self._path(f"{name}.bin")
+            with open(path, "ab") as f:
+                size = capacity * np.dtype(dtype).itemsize
+                if f.tell() < size:
+                    f.truncate(size)
+            self._arrays[name] = np.memmap(path, dtype=dtype, mode="r+", shape=(capacity,))
+        self._capacity = capacity
+
+    @property
+    def backfilled(self) -> bool:
+        """Whether the existing sales have been loaded (by any process)."""
+        return os.path.exists(self._path("backfilled"))
+
+    def mark_backfilled(self):
+        with open(self._path("backfilled"), "w") as f:
+            f.write(datetime.now(timezone.utc).isoformat())
+
+    def _write_meta(self, rows: int):
+        tmp_path = self._path("meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"version": FORMAT_VERSION, "rows": rows}, f)
+        os.replace(tmp_path, self._path("meta.json"))
+
+    # --- Writes ---
+
+    def _is_recorded(self, sale_id: str) -> bool:
+        """
+        Whether the sale has committed rows. Having a code isn't enough: the code is
+        assigned before the rows are written, so a crash in between leaves one behind
+        (which append_sale then reuses).
+        """
+        code = self._dictionaries["sale"].codes.get(sale_id)
+        if code is None:
+            return False
+        return bool(np.any(self._arrays["sale"][:self.rows] == code))
+
+    def append_sale(self, sale_id: str, sold_at: str, lines: List[dict]) -> bool:
+        """Appends the lines of one sale. Returns False if the sale was already recorded."""
+        if not lines:
+            return False
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._is_recorded(sale_id):
+                return False
+
+            start, end = self.rows, self.rows + len(lines)
+            if end > self._capacity:
+                capacity = self._capacity
+                while capacity < end:
+                    capacity *= 2
+                self._map(capacity)
+
+            columns = {
+                "sold_at": to_timestamp(sold_at),
+                "sale": self._dictionaries["sale"].code_for(sale_id),
+                "product": [self._dictionaries["product"].code_for(line["product_id"]) for line in lines],
+                "batch": [self._dictionaries["batch"].code_for(line["batch_id"]) for line in lines],
+            }
+            for name in ("quantity", "unit_cost", "unit_price", "original_unit_price", "tax_percentage"):
+                columns[name] = [line[name] for line in lines]
+            # No msync per append: other processes see the shared pages right away, and
+            # the page cache survives a crash of this process. compact() msyncs periodically.
+            for name, values in columns.items():
+                self._arrays[name][start:end] = values
+
+            self._write_meta(end)
+            self.rows = end
+            return True
+
+    # --- Queries ---
+
+    def scan(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """The columns for lines sold within [start, end], as in-memory arrays."""
+        with self._lock:
+            self._refresh()
+            rows = self.rows
+            sold_at = np.asarray(self._arrays["sold_at"][:rows])
+            mask = np.ones(rows, dtype=bool)
+            if start:
+                mask &= sold_at >= to_timestamp(start)
+            if end:
+                mask &= sold_at <= to_timestamp(end)
+            return {name: np.asarray(array[:rows])[mask] for name, array in self._arrays.items()}
+
+    def read_rows(self, start: int) -> Tuple[Dict[str, np.ndarray], int]:
+        """Copies of the columns for the lines appended from row `start` on, and the new row count."""
+        with self._lock:
+            self._refresh()
+            rows = self.rows
+            return {name: np.array(array[start:rows]) for name, array in self._arrays.items()}, rows
+
+    def decode(self, dictionary: str, codes: np.ndarray) -> List[str]:
+        values = self._dictionaries[dictionary].values
+        return [values[code] for code in codes]
+
+    def aggregate(self, start: Optional[str] = None, end: Optional[str] = None, group_by: Optional[str] = None) -> List[dict]:
+        """
+        Sums quantity, revenue, cost, tax, discount and profit over the lines sold in
+        [start, end], either as one total or per product, batch or (shop-time) day.
+        """
+        if group_by is not None and group_by not in GROUP_BY_OPTIONS:
+            raise ValueError(f"group_by must be one of {GROUP_BY_OPTIONS}")
+        columns = self.scan(start, end)
+
+        quantity = columns["quantity"].astype(np.float64)
+        revenue = quantity * columns["unit_price"]
+        measures = {
+            "quantity": quantity,
+            "revenue": revenue,
+            "cost": quantity * columns["unit_cost"],
+            "tax": revenue * columns["tax_percentage"] / 100,
+            "discount": quantity * (columns["original_unit_price"] - columns["unit_price"]),
+        }
+
+        if group_by is None:
+            keys, inverse = np.zeros(1, dtype=np.int64), np.zeros(len(quantity), dtype=np.int64)
+        elif group_by == "day":
+            days = (columns["sold_at"] + SHOP_UTC_OFFSET_SECONDS) // 86400
+            keys, inverse = np.unique(days, return_inverse=True)
+        else:
+            keys, inverse = np.unique(columns[group_by], return_inverse=True)
+
+        sums = {name: np.bincount(inverse, weights=values, minlength=len(keys)) for name, values in measures.items()}
+        line_counts = np.bincount(inverse, minlength=len(keys))
+
+        if group_by == "day":
+            epoch = datetime(1970, 1, 1)
+            labels = [(epoch + timedelta(days=int(day))).date().isoformat() for day in keys]
+        elif group_by is not None:
+            labels = self.decode(group_by, keys)
+        else:
+            labels = [None]
+
+        results = []
+        for i, label in enumerate(labels):
+            row = {"key": label, "lines": int(line_counts[i])}
+            for name, values in sums.items():
+                row[name] = round(float(values[i]), 2)
+            row["quantity"] = int(sums["quantity"][i])
+            row["profit"] = round(float(sums["revenue"][i] - sums["cost"][i]), 2)
+            results.append(row)
+        return results
+
+
+    def _update_rollup(self):
+        """Folds lines appended since the last call into the hourly rollup."""
+        start, end = self._rollup_rows, self.rows
+        if start == end:
+            return
+        # Include the line before, to tell whether the first new line starts a new bill
+        # (a sale's lines are always stored next to each other)
+        sale = np.asarray(self._arrays["sale"][max(start - 1, 0):end])
+        starts_bill = sale[1:] != sale[:-1]
+        if start == 0:
+            starts_bill = np.concatenate([[True], starts_bill])
+
+        quantity = np.asarray(self._arrays["quantity"][start:end]).astype(np.float64)
+        revenue = quantity * self._arrays["unit_price"][start:end]
+        tax = revenue * self._arrays["tax_percentage"][start:end] / 100
+        new = {
+            "sales": revenue + tax,
+            "tax": tax,
+            "cogs": quantity * self._arrays["unit_cost"][start:end],
+            "bills": starts_bill.astype(np.float64),
+        }
+        hours = (np.asarray(self._arrays["sold_at"][start:end]) + SHOP_UTC_OFFSET_SECONDS) // 3600
+
+        all_hours = np.concatenate([self._rollup_hours, hours])
+        keys, inverse = np.unique(all_hours, return_inverse=True)
+        for name in ROLLUP_MEASURES:
+            values = np.concatenate([self._rollup[name], new[name]])
+            self._rollup[name] = np.bincount(inverse, weights=values, minlength=len(keys))
+        self._rollup_hours = keys
+        self._rollup_rows = end
+
+    def compact(self):
+        """Brings the hourly rollup up to date and msyncs the column files."""
+        with self._lock:
+            self._refresh()
+            self._update_rollup()
+            for array in self._arrays.values():
+                array.flush()
+
+    def series(self, start_date: date, end_date: date, bucket: str) -> List[dict]:
+        """
+        Sales (incl. tax), tax, COGS and bill count per hour, day, week (from Monday)
+        or month in shop time, for every bucket between start_date and end_date
+        inclusive, including empty ones. Computed from the hourly rollup.
+        """
+        if bucket not in SERIES_BUCKETS:
+            raise ValueError(f"bucket must be one of {SERIES_BUCKETS}")
+        with self._lock:
+            self._refresh()
+            self._update_rollup()
+            hours, rollup = self._rollup_hours, dict(self._rollup)
+
+        first_hour = (start_date - EPOCH_DATE).days * 24
+        last_hour = (end_date - EPOCH_DATE).days * 24 + 23
+        lo, hi = np.searchsorted(hours, [first_hour, last_hour + 1])
+
+        keys = _bucket_keys(np.arange(first_hour, last_hour + 1), bucket)
+        buckets = np.unique(keys)
+        positions = np.searchsorted(buckets, _bucket_keys(hours[lo:hi], bucket))
+        sums = {
+            name: np.bincount(positions, weights=values[lo:hi], minlength=len(buckets))
+            for name, values in rollup.items()
+        }
+
+        return [
+            {
+                "bucket_start": _bucket_label(int(key), bucket),
+                "sales": round(float(sums["sales"][i]), 2),
+                "tax": round(float(sums["tax"][i]), 2),
+                "cogs": round(float(sums["cogs"][i]), 2),
+                "bills": int(sums["bills"][i]),
+            }
+            for i, key in enumerate(buckets)
+        ]
+
+
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def _bucket_keys(hours: np.ndarray, bucket: str) -> np.ndarray:
+    """Maps shop-time hour numbers (since the epoch) to sortable bucket numbers."""
+    if bucket == "hour":
+        return hours
+    days = hours // 24
+    if bucket == "day":
+        return days
+    if bucket == "week":
+        # 1970-01-05 (day 4) was a Monday
+        return days - (days - 4) % 7
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _bucket_label(key: int, bucket: str) -> str:
+    if bucket == "hour":
+        return (datetime(1970, 1, 1) + timedelta(hours=key)).replace(tzinfo=SHOP_TIMEZONE).isoformat()
+    if bucket == "month":
+        return str(np.datetime64(key, "M"))
+    return (EPOCH_DATE + timedelta(days=key)).isoformat()
+
+def backfill(store: SalesFactStore, db) -> int:
+    """
+    Loads every existing sales order into the store, oldest first. Lines recorded
+    without cost or tax (older credit sales) get them from their batch and product.
+    Returns the number of sales appended.
+    """
+    appended = 0
+    cursor = None
+    while True:
+        page_queries = [Query.order_asc("sale_date_time"), Query.limit(PAGE_SIZE)]
+        if cursor:
+            page_queries.append(Query.cursor_after(cursor))
+        sales = db.list_documents(
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
+            queries=page_queries
+        )["documents"]
+
+        parsed = {}
+        batch_ids, product_ids = set(), set()
+        for sale in sales:
+            try:
+                items = item_codec.decode_items(sale.get("items_sold"))
+            except ValueError:
+                logger.warning("Skipping sale %s with unreadable items_sold", sale["$id"])
+                continue
+            parsed[sale["$id"]] = items
+            for item in items:
+                if "cost_price_per_unit" not in item:
+                    batch_ids.add(item["batch_id"])
+                if "tax_percentage_at_sale" not in item:
+                    product_ids.add(item["product_id"])
+        batches = queries.get_by_ids(db, config.APPWRITE_COLLECTION_BATCHES_ID, batch_ids)
+        products = queries.get_by_ids(db, config.APPWRITE_COLLECTION_PRODUCTS_ID, product_ids)
+
+        for sale in sales:
+            items = parsed.get(sale["$id"])
+            if not items:
+                continue
+            lines = []
+            for item in items:
+                batch = batches.get(item["batch_id"], {})
+                product = products.get(item["product_id"], {})
+                price = item.get("actual_selling_price_per_unit", 0.0)
+                lines.append({
+                    "product_id": item["product_id"],
+                    "batch_id": item["batch_id"],
+                    "quantity": item.get("quantity", 0),
+                    "unit_cost": item.get("cost_price_per_unit", batch.get("cost_price", 0.0)),
+                    "unit_price": price,
+                    "original_unit_price": item.get("original_selling_price_per_unit",
+                                                    batch.get("selling_price") or product.get("global_selling_price", price)),
+                    "tax_percentage": item.get("tax_percentage_at_sale", product.get("tax_percentage", 0.0)),
+                })
+            if store.append_sale(sale["$id"], sale["sale_date_time"], lines):
+                appended += 1
+
+        if len(sales) < PAGE_SIZE:
+            return appended
+        cursor = sales[-1]["$id"]
+
+
+# Opened by open_store() at startup (main.py's lifespan), so importing the app doesn't create files
+store: Optional[SalesFactStore] = None
+
+
+def open_store():
+    """Opens the store in SALES_FACTS_DIR, creating it if needed, when SALES_FACTS_ENABLED."""
+    global store
+    if config.SALES_FACTS_ENABLED and store is None:
+        store = SalesFactStore(config.SALES_FACTS_DIR)
+
+
+def record_sale(sale_id: str, sold_at: str, details: List[dict]):
+    """
+    Appends a just-recorded sale (execute_fifo_deduction()'s details) to the fact
+    store. The sale itself is already saved, so a failure here is only logged.
+    """
+    if store is None:
+        return
+    try:
+        store.append_sale(sale_id, sold_at, [line_from_detail(detail) for detail in details])
+    except Exception:
+        logger.exception("Could not append sale %s to the sales fact store", sale_id)
+
+
+
+def backfill_if_needed(db):
+    """
+    Startup job: loads the existing sales until a backfill has completed. Checkouts
+    may have been recorded before it ran, so the store being non-empty doesn't mean
+    the history is there; those sales are skipped as already recorded.
+    """
+    if store is None or store.backfilled:
+        return
+    logger.info("Sales fact store has not been backfilled, loading existing sales...")
+    logger.info("Loaded %d sales into the sales fact store", backfill(store, db))
+    store.mark_backfilled()
+
+
+def compact_rollup():
+    """Periodic job: folds new lines into the hourly rollup and writes the columns back to disk."""
+    if store is not None:
+        store.compact()
@@ -0,0 +1,167 @@
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from appwrite.query import Query
+from app.core import config, item_codec
+from app.core.sales_facts import to_timestamp
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+PRODUCT, BATCH = "product", "batch"
+
+
+class SalesIndex:
+    """
+    An inverted index from product and batch IDs to the sales that contain them,
+    newest first, in a SQLite file (WAL mode, so every worker can write to it).
+
+    One row per (product or batch, sale) with the quantity sold, clustered by key
+    and sale time, so a page of "sales of X" is a single index range read.
+    Re-indexing a sale replaces its rows, so recording it twice is harmless.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS sale_keys (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                sold_ts INTEGER NOT NULL,
+                sale_id TEXT NOT NULL,
+                sold_at TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (kind, key, sold_ts, sale_id)
+            ) WITHOUT ROWID
+        """)
+        self._connection().execute("CREATE TABLE IF NOT EXISTS index_state (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add_sales(self, sales: Iterable[Tuple[str, str, Iterable[tuple]]]):
+        """
+        Indexes sales given as (sale ID, sale_date_time, lines), each line a
+        (product_id, batch_id, quantity) tuple. All in one transaction.
+        """
+        rows = []
+        for sale_id, sold_at, lines in sales:
+            quantities = defaultdict(int)
+            for product_id, batch_id, quantity in lines:
+                if product_id:
+                    quantities[(PRODUCT, product_id)] += quantity or 0
+                if batch_id:
+                    quantities[(BATCH, batch_id)] += quantity or 0
+            sold_ts = to_timestamp(sold_at)
+            rows.extend((kind, key, sold_ts, sale_id, sold_at, quantity) for (kind, key), quantity in quantities.items())
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO sale_keys VALUES (?, ?, ?, ?, ?, ?)", rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def lookup(self, kind: str, key: str, limit: int, offset: int) -> Tuple[int, List[dict]]:
+        """(total, page) of the sales containing a product or batch, newest first."""
+        connection = self._connection()
+        total = connection.execute(
+            "SELECT COUNT(*) FROM sale_keys WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()[0]
+        rows = connection.execute(
+            "SELECT sale_id, sold_at, quantity FROM sale_keys WHERE kind = ? AND key = ? "
+            "ORDER BY sold_ts DESC, sale_id DESC LIMIT ? OFFSET ?",
+            (kind, key, limit, offset)
+        ).fetchall()
+        return total, [{"sale_id": sale_id, "sold_at": sold_at, "quantity": quantity} for sale_id, sold_at, quantity in rows]
+
+    @property
+    def backfilled(self) -> bool:
+        """Whether the existing sales have been indexed (by any process)."""
+        return self._connection().execute(
+            "SELECT 1 FROM index_state WHERE name = 'backfilled_at'"
+        ).fetchone() is not None
+
+    def mark_backfilled(self):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO index_state VALUES ('backfilled_at', datetime('now'))"
+        )
+
+
+def _lines(items: Iterable[dict]) -> List[tuple]:
+    return [(item.get("product_id"), item.get("batch_id"), item.get("quantity")) for item in items]
+
+
+def backfill(index: SalesIndex, db) -> int:
+    """Indexes every existing sales order, a page at a time. Returns the number of sales indexed."""
+    indexed = 0
+    cursor = None
+    while True:
+        page_queries = [Query.select(["$id", "sale_date_time", "items_sold"]), Query.limit(PAGE_SIZE)]
+        if cursor:
+            page_queries.append(Query.cursor_after(cursor))
+        sales = db.list_documents(
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
+            queries=page_queries
+        )["documents"]
+        page = []
+        for sale in sales:
+            try:
+                lines = item_codec.decode_columns(sale.get("items_sold"), ("product_id", "batch_id", "quantity"))
+            except ValueError:
+                logger.warning("Skipping sale %s with unreadable items_sold", sale["$id"])
+                continue
+            page.append((sale["$id"], sale["sale_date_time"], lines))
+        index.add_sales(page)
+        indexed += len(page)
+        if len(sales) < PAGE_SIZE:
+            return indexed
+        cursor = sales[-1]["$id"]
+
+
+# Opened by open_index() at startup (main.py's lifespan), so importing the app doesn't create files
+index: Optional[SalesIndex] = None
+
+
+def open_index():
+    """Opens the index at SALES_INDEX_PATH, creating it if needed, when SALES_INDEX_ENABLED."""
+    global index
+    if config.SALES_INDEX_ENABLED and index is None:
+        index = SalesIndex(config.SALES_INDEX_PATH)
+
+
+def record_sale(sale_id: str, sold_at: str, items: List[dict]):
+    """
+    Indexes a just-recorded sale by the product_id, batch_id and quantity of its
+    items. The sale itself is already saved, so a failure here is only logged.
+    """
+    if index is None:
+        return
+    try:
+        index.add_sales([(sale_id, sold_at, _lines(items))])
+    except Exception:
+        logger.exception("Could not add sale %s to the sales index", sale_id)
+
+
+def backfill_if_needed(db):
+    """
+    Startup job: indexes the existing sales until a backfill has completed. Sales
+    recorded before it ran don't mean the history is there; re-indexing them is harmless.
+    """
+    if index is None or index.backfilled:
+        return
+    logger.info("Sales index has not been backfilled, indexing existing sales...")
+    logger.info("Indexed %d sales", backfill(index, db))
+    index.mark_backfilled()
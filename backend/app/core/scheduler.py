@@ -0,0 +1,281 @@
+import asyncio
+import inspect
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+
+from app.core import admission, config, tracing
+from app.core.utils import get_current_ist_time
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are only single-instance within this process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalSchedule:
+    """Every `seconds`, aligned to multiples of the interval since the epoch, so all workers agree on the slots."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_after(self, now: datetime) -> datetime:
+        timestamp = now.timestamp()
+        slot = (int(timestamp // self.seconds) + 1) * self.seconds
+        return datetime.fromtimestamp(slot, tz=now.tzinfo)
+
+    def __str__(self):
+        return f"every {self.seconds:g}s"
+
+
+class CronSchedule:
+    """
+    A 5-field cron expression (minute hour day-of-month month day-of-week), evaluated
+    in shop time (IST). Fields accept *, numbers, lists (1,15), ranges (1-5) and steps
+    (*/15, 0-30/10). Day-of-week 0 (or 7) is Sunday. As in cron, when both day fields
+    are restricted, a day matching either one matches.
+    """
+
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression!r}")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        )
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/")
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-"))
+            else:
+                start = end = int(part)
+            values.update(range(start, end + 1, step))
+        if not values or min(values) < low or max(values) > high:
+            raise ValueError(f"Invalid cron field {field!r}")
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, now: datetime) -> datetime:
+        moment = now.astimezone(get_current_ist_time().tzinfo).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                # Jump to the first minute of next month
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+
+class Job:
+    def __init__(self, name: str, func: Callable, schedule, jitter: float, single_instance: bool,
+                 run_at_startup: bool, lane: str):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        self.single_instance = single_instance
+        self.run_at_startup = run_at_startup
+        self.lane = lane
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.running = False
+        self.last_started_at: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.max_duration_ms = 0.0
+        self.total_duration_ms = 0.0
+        self.last_error: Optional[str] = None
+        self.next_run_at: Optional[str] = None
+
+    def stats(self) -> dict:
+        return {
+            "schedule": str(self.schedule) if self.schedule else "at startup",
+            "single_instance": self.single_instance,
+            "running": self.running,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": self.last_duration_ms,
+            "avg_duration_ms": round(self.total_duration_ms / self.runs, 1) if self.runs else None,
+            "max_duration_ms": self.max_duration_ms,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at,
+        }
+
+
+class Scheduler:
+    """
+    Runs registered jobs as asyncio tasks on interval or cron schedules, with random
+    jitter added to each run.
+
+    Sync job functions run in a worker thread. A single-instance job takes a
+    non-blocking file lock under SCHEDULER_STATE_DIR and records the slot it ran
+    for, so when several workers share the directory each slot runs only once.
+    """
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+        self.jobs: List[Job] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def register(
+        self,
+        name: str,
+        func: Callable,
+        every: Optional[float] = None,
+        cron: Optional[str] = None,
+        jitter: float = 0,
+        single_instance: bool = True,
+        run_at_startup: bool = False,
+        lane: str = admission.LANE_REPORTS
+    ):
+        """
+        Registers `func` (sync or async, no arguments) to run every `every` seconds
+        or on a `cron` schedule. A job with neither runs once, at startup.
+        """
+        if every and cron:
+            raise ValueError("Give either every= or cron=, not both")
+        schedule = IntervalSchedule(every) if every else CronSchedule(cron) if cron else None
+        self.jobs.append(Job(name, func, schedule, jitter, single_instance, run_at_startup or schedule is None, lane))
+
+    def start(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job-{job.name}"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.jobs = []
+
+    def stats(self) -> dict:
+        return {job.name: job.stats() for job in self.jobs}
+
+    async def _loop(self, job: Job):
+        # Jobs are background work: admitted behind interactive traffic unless told otherwise
+        admission.current_lane.set(job.lane)
+        if job.run_at_startup:
+            await self._run(job, slot=None)
+        if job.schedule is None:
+            return
+        while True:
+            slot = job.schedule.next_after(get_current_ist_time())
+            run_at = slot.timestamp() + random.uniform(0, job.jitter)
+            job.next_run_at = datetime.fromtimestamp(run_at, tz=slot.tzinfo).isoformat()
+            await asyncio.sleep(max(run_at - time.time(), 0))
+            await self._run(job, slot=slot.timestamp())
+
+    async def _run(self, job: Job, slot: Optional[float]):
+        lock_file = None
+        if job.single_instance:
+            lock_file = self._try_lock(job, slot)
+            if lock_file is None:
+                job.skipped += 1
+                return
+        job.running = True
+        job.last_started_at = get_current_ist_time().isoformat()
+        started = time.perf_counter()
+        try:
+            with tracing.start_span(f"job.{job.name}"):
+                if inspect.iscoroutinefunction(job.func):
+                    await self._run_admitted(job)
+                else:
+                    await asyncio.to_thread(job.func)
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = str(e)
+            logger.exception("Scheduled job %s failed", job.name)
+        finally:
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            job.runs += 1
+            job.running = False
+            job.last_duration_ms = duration_ms
+            job.total_duration_ms += duration_ms
+            job.max_duration_ms = max(job.max_duration_ms, duration_ms)
+            if lock_file is not None:
+                self._unlock(job, lock_file, slot)
+
+    @staticmethod
+    async def _run_admitted(job: Job):
+        # A coroutine job makes its Appwrite calls on the event loop, where the proxy sheds
+        # rather than waits for a slot; so, like a request, it waits for one up front
+        if not config.ADMISSION_CONTROL_ENABLED:
+            await job.func()
+            return
+        await admission.controller.acquire_async(job.lane)
+        admitted = admission.request_admitted.set(True)
+        try:
+            await job.func()
+        finally:
+            admission.request_admitted.reset(admitted)
+            admission.controller.release(job.lane)
+
+    def _try_lock(self, job: Job, slot: Optional[float]):
+        """Returns the open lock file, or None if another worker is running or has run this slot."""
+        lock_file = open(os.path.join(self.state_dir, f"{job.name}.lock"), "a+")
+        if fcntl:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+        lock_file.seek(0)
+        last_slot = lock_file.read().strip()
+        if slot is not None and last_slot and float(last_slot) >= slot:
+            lock_file.close()
+            return None
+        return lock_file
+
+    @staticmethod
+    def _unlock(job: Job, lock_file, slot: Optional[float]):
+        try:
+            if slot is not None:
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(str(slot))
+                lock_file.flush()
+        finally:
+            lock_file.close()  # also releases the flock
+
+
+scheduler = Scheduler(config.SCHEDULER_STATE_DIR)
@@ -0,0 +1,229 @@
+"""
+In-process search indexes of the customer and supplier directories, so that
+finding a customer by name or phone number doesn't mean loading all of them.
+
+Each index holds every document of its collection, with:
+- the words of each name, sorted, for word-prefix matches ("sit ra" finds
+  "Sita Ram") with a binary search per query word;
+- the trigrams of each contact's digits, for matches anywhere in the number
+  ("4567" finds "+91 98123 45678"), plus the digits sorted for 1-2 digit prefixes;
+- all documents sorted by name, so unfiltered pages are a slice.
+
+Like the unique key indexes, each worker loads its own at startup and every
+SEARCH_INDEX_RELOAD_SECONDS (the search_index_reload job), and the services
+add their writes in between. Other workers' writes (e.g. a balance changed by a
+credit sale) show up after the next reload.
+"""
+import heapq
+import logging
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from app.core import admission, config, queries
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+_NON_DIGIT = re.compile(r"\D")
+_PHONE_NUMBER = re.compile(r"[\d\s+\-()]+")
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return sorted(set(_WORD.findall((text or "").casefold())))
+
+
+def _digits(text: Optional[str]) -> str:
+    return _NON_DIGIT.sub("", text or "")
+
+
+def _trigrams(digits: str) -> Set[str]:
+    return {digits[i:i + 3] for i in range(len(digits) - 2)}
+
+
+class SearchIndex:
+    """Name and contact search over one collection's documents."""
+
+    def __init__(self, collection_id: str, name_attribute: str = "name", contact_attribute: str = "contact"):
+        self.collection_id = collection_id
+        self.name_attribute = name_attribute
+        self.contact_attribute = contact_attribute
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._writes_during_load: Optional[List[dict]] = None
+        self._clear()
+
+    def _clear(self):
+        self._documents: Dict[str, dict] = {}
+        self._order: List[Tuple[str, str]] = []  # (name key, ID), sorted
+        self._words: List[Tuple[str, str]] = []  # (word, ID), sorted
+        self._contacts: List[Tuple[str, str]] = []  # (digits, ID), sorted
+        self._trigram_ids: Dict[str, Set[str]] = defaultdict(set)
+        self._rank: Optional[Dict[str, int]] = None  # ID -> position in _order, rebuilt after writes
+
+    # --- Maintenance ---
+
+    def _keys(self, document: dict):
+        document_id = document["$id"]
+        name = document.get(self.name_attribute) or ""
+        digits = _digits(document.get(self.contact_attribute))
+        return (
+            (name.casefold(), document_id),
+            [(word, document_id) for word in _words(name)],
+            (digits, document_id),
+            _trigrams(digits),
+        )
+
+    def _remove(self, document_id: str):
+        document = self._documents.pop(document_id, None)
+        if document is None:
+            return
+        self._rank = None
+        order_key, word_keys, contact_key, trigrams = self._keys(document)
+        for sorted_list, key in [(self._order, order_key), (self._contacts, contact_key)] + [(self._words, key) for key in word_keys]:
+            position = bisect_left(sorted_list, key)
+            if position < len(sorted_list) and sorted_list[position] == key:
+                del sorted_list[position]
+        for trigram in trigrams:
+            self._trigram_ids[trigram].discard(document_id)
+
+    def _add(self, document: dict):
+        self._remove(document["$id"])
+        self._documents[document["$id"]] = document
+        self._rank = None
+        order_key, word_keys, contact_key, trigrams = self._keys(document)
+        insort(self._order, order_key)
+        insort(self._contacts, contact_key)
+        for key in word_keys:
+            insort(self._words, key)
+        for trigram in trigrams:
+            self._trigram_ids[trigram].add(document["$id"])
+
+    def add(self, document: dict):
+        """Records a created or updated document."""
+        with self._lock:
+            self._add(document)
+            if self._writes_during_load is not None:
+                self._writes_during_load.append(document)
+
+    def begin_load(self):
+        with self._lock:
+            self._writes_during_load = []
+
+    def finish_load(self, documents: List[dict]):
+        """Replaces the contents with a snapshot, keeping writes made while it was read."""
+        with self._lock:
+            writes, self._writes_during_load = self._writes_during_load or [], None
+            self._clear()
+            self._documents = {document["$id"]: document for document in documents}
+            # Bulk-built and sorted once, rather than inserted one by one
+            for document in documents:
+                order_key, word_keys, contact_key, trigrams = self._keys(document)
+                self._order.append(order_key)
+                self._contacts.append(contact_key)
+                self._words.extend(word_keys)
+                for trigram in trigrams:
+                    self._trigram_ids[trigram].add(document["$id"])
+            self._order.sort()
+            self._contacts.sort()
+            self._words.sort()
+            for document in writes:
+                self._add(document)
+            self.loaded = True
+
+    def abort_load(self):
+        with self._lock:
+            self._writes_during_load = None
+
+    # --- Queries ---
+
+    def _prefixed(self, sorted_list: List[Tuple[str, str]], prefix: str) -> Set[str]:
+        start = bisect_left(sorted_list, (prefix,))
+        end = bisect_left(sorted_list, (prefix + "\U0010ffff",), start)
+        return {document_id for _, document_id in sorted_list[start:end]}
+
+    def _ranks(self) -> Dict[str, int]:
+        if self._rank is None:
+            self._rank = {document_id: position for position, (_, document_id) in enumerate(self._order)}
+        return self._rank
+
+    def _matching_ids(self, query: str) -> Set[str]:
+        digits = _digits(query)
+        if digits and _PHONE_NUMBER.fullmatch(query):
+            # A phone number (or part of one)
+            if len(digits) < 3:
+                return self._prefixed(self._contacts, digits)
+            candidates = set.intersection(*(self._trigram_ids.get(trigram, set()) for trigram in _trigrams(digits)))
+            return {document_id for document_id in candidates
+                    if digits in _digits(self._documents[document_id].get(self.contact_attribute))}
+        words = _words(query)
+        if not words:
+            return set(self._documents)
+        return set.intersection(*sorted((self._prefixed(self._words, word) for word in words), key=len))
+
+    def search(self, query: Optional[str], limit: int, offset: int) -> Tuple[int, List[dict]]:
+        """
+        (total, page) of the documents matching `query`, sorted by name: a number
+        matches contacts containing those digits, anything else names with words
+        starting with each query word. No query matches everything.
+        """
+        with self._lock:
+            if not (query or "").strip():
+                page = self._order[offset:offset + limit]
+                return len(self._order), [self._documents[document_id] for _, document_id in page]
+            ids = self._matching_ids(query.strip())
+            if len(ids) * 8 > len(self._order):
+                # Broad query: walking the names in order fills the page after a few steps
+                page = list(islice((document_id for _, document_id in self._order if document_id in ids), offset, offset + limit))
+            else:
+                # Only the matches up to the end of the page need ordering
+                page = heapq.nsmallest(offset + limit, ids, key=self._ranks().__getitem__)[offset:]
+            return len(ids), [self._documents[document_id] for document_id in page]
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+
+customers = SearchIndex(config.APPWRITE_COLLECTION_CUSTOMERS_ID)
+suppliers = SearchIndex(config.APPWRITE_COLLECTION_SUPPLIERS_ID)
+INDEXES = [customers, suppliers]
+
+
+def search_page(index: SearchIndex, query: Optional[str], limit: int, offset: int) -> dict:
+    """A PaginatedResponse of index.search(), or a 503 while the index isn't available."""
+    if not config.SEARCH_INDEX_ENABLED:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Search is disabled.")
+    if not index.loaded:
+        raise admission.service_unavailable("The search index is still loading.", retry_after=5)
+    total, documents = index.search(query, limit, offset)
+    return {"total": total, "limit": limit, "offset": offset, "data": documents}
+
+
+def record(document: dict, collection_id: str):
+    """Adds a document just created or updated to the search index of its collection."""
+    if not config.SEARCH_INDEX_ENABLED:
+        return
+    for index in INDEXES:
+        if index.collection_id == collection_id:
+            index.add(document)
+
+
+def reload(db):
+    """Scheduled job: rebuilds every search index from Appwrite."""
+    for index in INDEXES:
+        index.begin_load()
+        try:
+            documents = queries.list_all(db, index.collection_id)
+        except Exception:
+            index.abort_load()
+            raise
+        index.finish_load(documents)
+    logger.info("Search indexes loaded: %s", ", ".join(f"{index.collection_id}={len(index)}" for index in INDEXES))
+
+
+def stats() -> dict:
+    return {index.collection_id: {"loaded": index.loaded, "documents": len(index)} for index in INDEXES}
@@ -0,0 +1,105 @@
+import copy
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Hashable
+
+from app.core import config
+from app.core.datastore import ServiceProxy
+
+# Only idempotent reads are safe to share between callers.
+COALESCED_OPERATIONS = {"get_document", "list_documents"}
+
+_fresh: ContextVar[bool] = ContextVar("singleflight_fresh", default=False)
+
+
+@contextmanager
+def fresh_reads():
+    """
+    Reads made inside the block are never coalesced. Use it for reads that feed a
+    read-modify-write (e.g. of a stock level): a shared read may have been sent before
+    a concurrent write landed, and writing back a value derived from it loses that write.
+    """
+    token = _fresh.set(True)
+    try:
+        yield
+    finally:
+        _fresh.reset(token)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    The first caller for a key runs the call; callers arriving while it is in flight
+    wait for its result instead of issuing their own. Followers get a deep copy, since
+    services are free to mutate the documents they receive.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = defaultdict(lambda: {"executed": 0, "coalesced": 0})
+
+    def do(self, key: Hashable, group: str, fn: Callable):
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats[group]["executed"] += 1
+            else:
+                self._stats[group]["coalesced"] += 1
+
+        if not is_leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> dict:
+        """Per-group counts of calls executed and calls saved by coalescing."""
+        with self._lock:
+            per_group = {group: dict(counts) for group, counts in self._stats.items()}
+        return {
+            "executed": sum(counts["executed"] for counts in per_group.values()),
+            "coalesced": sum(counts["coalesced"] for counts in per_group.values()),
+            "by_collection": per_group,
+        }
+
+
+reads = SingleFlight()
+
+
+class SingleFlightProxy(ServiceProxy):
+    """Routes document reads through the shared SingleFlight group."""
+
+    def _call(self, operation, method, args, kwargs):
+        if operation not in COALESCED_OPERATIONS or args or _fresh.get():
+            return method(*args, **kwargs)
+
+        key = (
+            self.service_name,
+            operation,
+            kwargs.get("database_id"),
+            kwargs.get("collection_id"),
+            kwargs.get("document_id"),
+            tuple(kwargs.get("queries") or ()),
+        )
+        return reads.do(key, kwargs.get("collection_id"), lambda: method(**kwargs))
+
+
+def instrument(db):
+    """Returns the Databases service wrapped in a SingleFlightProxy when enabled."""
+    return SingleFlightProxy(db) if config.SINGLE_FLIGHT_ENABLED else db
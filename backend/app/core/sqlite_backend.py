@@ -0,0 +1,352 @@
+import json
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+
+from appwrite.exception import AppwriteException
+from appwrite.id import ID
+
+# Attributes that get an expression index, because the services filter or sort on them
+INDEXED_ATTRIBUTES = ("product_id", "sale_date_time", "customer_id", "quantity_in_stock")
+
+# Appwrite's default page size when a query has no limit
+DEFAULT_LIMIT = 25
+
+SYSTEM_COLUMNS = {"$id": "id", "$createdAt": "created_at", "$updatedAt": "updated_at", "$sequence": "seq"}
+
+_ATTRIBUTE_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_DATETIME_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:\d{2})?$")
+
+_COMPARISONS = {
+    "equal": "=", "notEqual": "!=",
+    "lessThan": "<", "lessThanEqual": "<=",
+    "greaterThan": ">", "greaterThanEqual": ">=",
+}
+
+
+def now_iso() -> str:
+    return to_appwrite_datetime(datetime.now(timezone.utc))
+
+
+def to_appwrite_datetime(value: datetime) -> str:
+    """Formats a datetime the way Appwrite returns it: UTC, milliseconds, '+00:00'."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}+00:00"
+
+
+def normalize_value(value: Any) -> Any:
+    """
+    Appwrite stores datetimes in UTC, so ISO datetime strings are normalized to UTC on
+    write and in query values. This keeps string comparison on dates correct.
+    """
+    if isinstance(value, str) and _DATETIME_PATTERN.match(value):
+        try:
+            return to_appwrite_datetime(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        except ValueError:
+            return value
+    return value
+
+
+def column_for(attribute: str) -> str:
+    """Returns the SQL expression for an attribute. Must match the index expressions exactly."""
+    if attribute in SYSTEM_COLUMNS:
+        return SYSTEM_COLUMNS[attribute]
+    if not _ATTRIBUTE_PATTERN.match(attribute):
+        raise AppwriteException(f"Invalid query: Attribute not found in schema: {attribute}", 400, "general_query_invalid")
+    return f"json_extract(data, '$.{attribute}')"
+
+
+class SQLiteDatabases:
+    """
+    Local storage backend implementing the subset of the Appwrite Databases service
+    used by this app, on top of a single SQLite file in WAL mode.
+
+    Documents are stored as JSON, keyed by collection and document ID. Queries built
+    with appwrite.query.Query are translated into SQL, using expression indexes on the
+    attributes the services filter on. Errors are raised as AppwriteException with the
+    same codes Appwrite uses (404, 409, 400), so the services behave identically.
+    """
+
+    def __init__(self, path: str, indexed_attributes: Tuple[str, ...] = INDEXED_ATTRIBUTES):
+        self.path = path
+        self.indexed_attributes = indexed_attributes
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """An IMMEDIATE transaction on this thread's connection. Nested use joins the outer one."""
+        connection = self._connection()
+        depth = getattr(self._local, "transaction_depth", 0)
+        if depth == 0:
+            connection.execute("BEGIN IMMEDIATE")
+        self._local.transaction_depth = depth + 1
+        try:
+            yield connection
+        except BaseException:
+            self._local.transaction_depth = depth
+            if depth == 0:
+                connection.execute("ROLLBACK")
+            raise
+        self._local.transaction_depth = depth
+        if depth == 0:
+            connection.execute("COMMIT")
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                UNIQUE (collection_id, id)
+            )
+        """)
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_updated_at ON documents (collection_id, updated_at)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, watermark TEXT NOT NULL)"
+        )
+        for attribute in self.indexed_attributes:
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_documents_{attribute} "
+                f"ON documents (collection_id, {column_for(attribute)})"
+            )
+
+    # --- Row <-> document conversion ---
+
+    @staticmethod
+    def _to_document(row: tuple, database_id: str, collection_id: str, select: Optional[List[str]] = None) -> dict:
+        seq, document_id, data, created_at, updated_at = row
+        attributes = json.loads(data)
+        if select is not None:
+            attributes = {key: value for key, value in attributes.items() if key in select}
+        return {
+            **attributes,
+            "$id": document_id,
+            "$sequence": seq,
+            "$collectionId": collection_id,
+            "$databaseId": database_id,
+            "$createdAt": created_at,
+            "$updatedAt": updated_at,
+            "$permissions": [],
+        }
+
+    def _fetch_row(self, collection_id: str, document_id: str) -> Optional[tuple]:
+        return self._connection().execute(
+            "SELECT seq, id, data, created_at, updated_at FROM documents WHERE collection_id = ? AND id = ?",
+            (collection_id, document_id)
+        ).fetchone()
+
+    @staticmethod
+    def _not_found(document_id: str) -> AppwriteException:
+        return AppwriteException(
+            f"Document with the requested ID '{document_id}' could not be found.", 404, "document_not_found"
+        )
+
+    # --- Databases API ---
+
+    def get_document(self, database_id: str, collection_id: str, document_id: str, queries: List[str] = None) -> dict:
+        row = self._fetch_row(collection_id, document_id)
+        if row is None:
+            raise self._not_found(document_id)
+        select = None
+        for query in queries or []:
+            parsed = json.loads(query)
+            if parsed["method"] == "select":
+                select = parsed.get("values", [])
+        return self._to_document(row, database_id, collection_id, select)
+
+    def create_document(self, database_id: str, collection_id: str, document_id: str, data: dict, permissions: List[str] = None) -> dict:
+        if document_id == "unique()":
+            document_id = ID.unique()
+        timestamp = now_iso()
+        payload = {key: normalize_value(value) for key, value in data.items() if not key.startswith("$")}
+        try:
+            self._connection().execute(
+                "INSERT INTO documents (collection_id, id, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (collection_id, document_id, json.dumps(payload), timestamp, timestamp)
+            )
+        except sqlite3.IntegrityError:
+            raise AppwriteException(
+                "Document with the requested ID already exists.", 409, "document_already_exists"
+            )
+        return self.get_document(database_id, collection_id, document_id)
+
+    def update_document(self, database_id: str, collection_id: str, document_id: str, data: dict = None, permissions: List[str] = None) -> dict:
+        with self._transaction() as connection:
+            row = self._fetch_row(collection_id, document_id)
+            if row is None:
+                raise self._not_found(document_id)
+            attributes = json.loads(row[2])
+            attributes.update({key: normalize_value(value) for key, value in (data or {}).items() if not key.startswith("$")})
+            connection.execute(
+                "UPDATE documents SET data = ?, updated_at = ? WHERE collection_id = ? AND id = ?",
+                (json.dumps(attributes), now_iso(), collection_id, document_id)
+            )
+        return self.get_document(database_id, collection_id, document_id)
+
+    def delete_document(self, database_id: str, collection_id: str, document_id: str) -> dict:
+        cursor = self._connection().execute(
+            "DELETE FROM documents WHERE collection_id = ? AND id = ?", (collection_id, document_id)
+        )
+        if cursor.rowcount == 0:
+            raise self._not_found(document_id)
+        return {}
+
+    def list_documents(self, database_id: str, collection_id: str, queries: List[str] = None) -> dict:
+        parsed = [json.loads(query) for query in queries or []]
+        conditions, params = ["collection_id = ?"], [collection_id]
+        orders: List[Tuple[str, str]] = []
+        limit, offset, select, cursor = DEFAULT_LIMIT, 0, None, None
+
+        for query in parsed:
+            method = query["method"]
+            if method == "limit":
+                limit = int(query["values"][0])
+            elif method == "offset":
+                offset = int(query["values"][0])
+            elif method == "select":
+                select = query.get("values", [])
+            elif method in ("orderAsc", "orderDesc"):
+                orders.append((column_for(query["attribute"]), "ASC" if method == "orderAsc" else "DESC"))
+            elif method in ("cursorAfter", "cursorBefore"):
+                cursor = (method, query["values"][0])
+            else:
+                condition, condition_params = self._translate_filter(query)
+                conditions.append(condition)
+                params.extend(condition_params)
+
+        connection = self._connection()
+        where = " AND ".join(conditions)
+        total = connection.execute(f"SELECT COUNT(*) FROM documents WHERE {where}", params).fetchone()[0]
+
+        # Appwrite breaks ties in insertion order
+        orders.append(("seq", "ASC"))
+        reverse = cursor is not None and cursor[0] == "cursorBefore"
+        if reverse:
+            orders = [(column, "DESC" if direction == "ASC" else "ASC") for column, direction in orders]
+        if cursor is not None:
+            cursor_condition, cursor_params = self._cursor_condition(collection_id, cursor[1], orders)
+            where += f" AND {cursor_condition}"
+            params = params + cursor_params
+
+        order_by = ", ".join(f"{column} {direction}" for column, direction in orders)
+        rows = connection.execute(
+            f"SELECT seq, id, data, created_at, updated_at FROM documents WHERE {where} "
+            f"ORDER BY {order_by} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        if reverse:
+            rows.reverse()
+
+        return {
+            "total": total,
+            "documents": [self._to_document(row, database_id, collection_id, select) for row in rows]
+        }
+
+    def upsert_document(self, collection_id: str, document: dict):
+        """
+        Stores a copy of a document fetched from another store, keeping its ID and
+        its $createdAt/$updatedAt timestamps. Used to maintain local mirrors.
+        """
+        payload = {key: normalize_value(value) for key, value in document.items() if not key.startswith("$")}
+        self._connection().execute(
+            "INSERT INTO documents (collection_id, id, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (collection_id, id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (collection_id, document["$id"], json.dumps(payload),
+             normalize_value(document.get("$createdAt") or now_iso()), normalize_value(document.get("$updatedAt") or now_iso()))
+        )
+
+    def document_ids(self, collection_id: str) -> set:
+        rows = self._connection().execute("SELECT id FROM documents WHERE collection_id = ?", (collection_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def get_watermark(self, name: str) -> Optional[str]:
+        row = self._connection().execute("SELECT watermark FROM sync_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, name: str, watermark: str):
+        self._connection().execute(
+            "INSERT INTO sync_state (name, watermark) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET watermark = excluded.watermark",
+            (name, watermark)
+        )
+
+    def list_collections(self, database_id: str, queries: List[str] = None, search: str = None) -> dict:
+        rows = self._connection().execute("SELECT DISTINCT collection_id FROM documents").fetchall()
+        collections = [{"$id": row[0], "databaseId": database_id} for row in rows]
+        return {"total": len(collections), "collections": collections}
+
+    # --- Query translation ---
+
+    def _translate_filter(self, query: dict) -> Tuple[str, list]:
+        method = query["method"]
+        values = [normalize_value(value) for value in query.get("values") or []]
+
+        if method in ("and", "or"):
+            parts = [self._translate_filter(sub_query) for sub_query in query["values"]]
+            joiner = " AND " if method == "and" else " OR "
+            return "(" + joiner.join(sql for sql, _ in parts) + ")", [p for _, sub in parts for p in sub]
+
+        column = column_for(query["attribute"])
+        if method == "equal":
+            return f"{column} IN ({', '.join('?' * len(values))})", values
+        if method == "notEqual":
+            return f"{column} NOT IN ({', '.join('?' * len(values))})", values
+        if method in _COMPARISONS:
+            return f"{column} {_COMPARISONS[method]} ?", values[:1]
+        if method == "between":
+            return f"{column} BETWEEN ? AND ?", values[:2]
+        if method == "isNull":
+            return f"{column} IS NULL", []
+        if method == "isNotNull":
+            return f"{column} IS NOT NULL", []
+        if method == "startsWith":
+            return f"substr({column}, 1, length(?)) = ?", [values[0], values[0]]
+        if method == "endsWith":
+            return f"substr({column}, -length(?)) = ?", [values[0], values[0]]
+        if method == "contains":
+            if query["attribute"] == "$id":
+                # Used by the services as "ID is one of these"
+                return f"{column} IN ({', '.join('?' * len(values))})", values
+            return "(" + " OR ".join(f"instr({column}, ?) > 0" for _ in values) + ")", values
+        if method == "search":
+            return f"{column} LIKE ?", [f"%{values[0]}%"]
+        raise AppwriteException(f"Invalid query method: {method}", 400, "general_query_invalid")
+
+    def _cursor_condition(self, collection_id: str, cursor_id: str, orders: List[Tuple[str, str]]) -> Tuple[str, list]:
+        """Builds a keyset condition selecting rows strictly after the cursor document in the given order."""
+        columns = ", ".join(column for column, _ in orders)
+        cursor_row = self._connection().execute(
+            f"SELECT {columns} FROM documents WHERE collection_id = ? AND id = ?", (collection_id, cursor_id)
+        ).fetchone()
+        if cursor_row is None:
+            raise AppwriteException(f"Document '{cursor_id}' for the cursor was not found.", 400, "general_cursor_not_found")
+
+        alternatives, params = [], []
+        for index, (column, direction) in enumerate(orders):
+            equal_prefix = [f"{prefix_column} IS ?" for prefix_column, _ in orders[:index]]
+            operator = ">" if direction == "ASC" else "<"
+            alternatives.append("(" + " AND ".join(equal_prefix + [f"{column} {operator} ?"]) + ")")
+            params.extend(cursor_row[:index])
+            params.append(cursor_row[index])
+        return "(" + " OR ".join(alternatives) + ")", params
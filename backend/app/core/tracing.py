@@ -0,0 +1,198 @@
+import functools
+import inspect
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from app.core import config
+from app.core.datastore import ServiceProxy
+
+SERVICE_NAME = "myshopapp-backend"
+
+# OpenTelemetry span kinds used by this app
+KIND_SERVER = "SPAN_KIND_SERVER"
+KIND_INTERNAL = "SPAN_KIND_INTERNAL"
+KIND_CLIENT = "SPAN_KIND_CLIENT"
+
+
+class Span:
+    """A single timed operation, following the OpenTelemetry span data model."""
+
+    def __init__(self, name: str, kind: str, parent: Optional["Span"]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent.span_id if parent else None
+        self.start_time_unix_nano = time.time_ns()
+        self.end_time_unix_nano: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status_code = "STATUS_CODE_UNSET"
+        self.status_description: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException):
+        self.status_code = "STATUS_CODE_ERROR"
+        self.status_description = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        self.end_time_unix_nano = time.time_ns()
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "context": {"trace_id": self.trace_id, "span_id": self.span_id},
+            "parent_span_id": self.parent_span_id,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_time_unix_nano,
+            "end_time_unix_nano": self.end_time_unix_nano,
+            "duration_ms": round((self.end_time_unix_nano - self.start_time_unix_nano) / 1_000_000, 3),
+            "attributes": self.attributes,
+            "status": {"status_code": self.status_code, "description": self.status_description},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class SpanExporter:
+    """Writes finished spans as JSON lines to stdout or to TRACING_OUTPUT_FILE."""
+
+    def __init__(self, exporter: str, output_file: str):
+        self.exporter = exporter
+        self.output_file = output_file
+        self._lock = threading.Lock()
+        # Opened on the first export and kept open; spans are written many times a request
+        self._file = None
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            if self.exporter == "file":
+                if self._file is None:
+                    self._file = open(self.output_file, "a")
+                self._file.write(line + "\n")
+                # Flushed per span so the file can be tailed, and nothing is lost on a crash
+                self._file.flush()
+            else:
+                sys.stdout.write(line + "\n")
+
+    def close(self):
+        """Closes the trace file, if open. Called on app shutdown."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+exporter = SpanExporter(config.TRACING_EXPORTER, config.TRACING_OUTPUT_FILE)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(attributes: dict):
+    """Adds attributes to the current span, if there is one."""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+@contextmanager
+def start_span(name: str, kind: str = KIND_INTERNAL, attributes: Optional[dict] = None):
+    """
+    Starts a child of the current span and makes it current for the enclosed block.
+    Yields None when tracing is disabled.
+    """
+    if not config.TRACING_ENABLED:
+        yield None
+        return
+
+    span = Span(name, kind, _current_span.get())
+    if attributes:
+        span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        exporter.export(span)
+
+
+def traced(name: Optional[str] = None):
+    """
+    Decorator that wraps a service function (sync or async) in a span.
+    The span name defaults to "<module>.<function>", e.g. "pos_service.simulate_sale_fifo".
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class TracingProxy(ServiceProxy):
+    """Wraps an Appwrite service so that every call is recorded as a client span."""
+
+    def _call(self, operation, method, args, kwargs):
+        attributes = {"appwrite.service": self.service_name, "appwrite.operation": operation}
+        for key in ("collection_id", "document_id"):
+            if kwargs.get(key) is not None:
+                attributes[f"appwrite.{key}"] = kwargs[key]
+        if kwargs.get("queries"):
+            attributes["appwrite.query_count"] = len(kwargs["queries"])
+
+        with start_span(f"appwrite.{self.service_name}.{operation}", KIND_CLIENT, attributes) as span:
+            result = method(*args, **kwargs)
+            if span is not None and isinstance(result, dict) and "documents" in result:
+                span.set_attribute("appwrite.documents_returned", len(result["documents"]))
+            return result
+
+
+def instrument(service):
+    """Returns the service wrapped in a TracingProxy when tracing is enabled."""
+    return TracingProxy(service) if config.TRACING_ENABLED else service
+
+
+async def trace_requests(request: Request, call_next):
+    """HTTP middleware that opens the root server span of each request."""
+    if not config.TRACING_ENABLED:
+        return await call_next(request)
+
+    with start_span(f"{request.method} {request.url.path}", KIND_SERVER) as span:
+        span.set_attribute("http.method", request.method)
+        span.set_attribute("http.target", request.url.path)
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            # Name the span after the route template rather than the concrete path
+            span.name = f"{request.method} {route.path}"
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.status_code = "STATUS_CODE_ERROR"
+        return response
@@ -0,0 +1,171 @@
+"""
+In-process hash indexes of the attributes that must be unique (product code and
+name, customer contact, supplier name), so that create/update can answer "is this
+taken?" without a list_documents query per attribute.
+
+Each worker loads its indexes at startup and reloads them every
+UNIQUE_INDEX_RELOAD_SECONDS (the unique_index_reload job); the services keep them
+up to date on their own writes in between. Once loaded, a value missing from the
+index is free: a duplicate written by another worker since the last reload slips
+through, so keep the reload interval short with several workers. A value found
+in the index is a conflict if this worker wrote its owner; if the owner came from
+the last reload, another worker may have renamed or deleted it since, so it's
+re-read from Appwrite first (unless UNIQUE_INDEX_VERIFY_HITS is off).
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+from appwrite.exception import AppwriteException
+from appwrite.query import Query
+from app.core import config, queries
+
+logger = logging.getLogger(__name__)
+
+
+class UniqueIndex:
+    """value -> document ID for one attribute of one collection."""
+
+    def __init__(self, collection_id: str, attribute: str):
+        self.collection_id = collection_id
+        self.attribute = attribute
+        self.loaded = False
+        self._owners: Dict[str, str] = {}
+        self._values: Dict[str, str] = {}  # document ID -> value, to drop a value when it changes
+        self._written_here: Set[str] = set()  # IDs this worker wrote since the last reload
+        self._lock = threading.Lock()
+        self._writes_during_load: Optional[List[dict]] = None
+
+    def owner(self, value) -> Optional[str]:
+        """The ID of the document known to hold `value`, if any."""
+        return self._owners.get(value)
+
+    def written_here(self, document_id: str) -> bool:
+        return document_id in self._written_here
+
+    def add(self, document: dict, written_here: bool = True):
+        """
+        Records a created or updated document (a no-op if it lacks the attribute).
+        `written_here` is False for documents only read from Appwrite.
+        """
+        if self.attribute not in document:
+            return
+        with self._lock:
+            self._set(document["$id"], document[self.attribute])
+            if written_here:
+                self._written_here.add(document["$id"])
+                if self._writes_during_load is not None:
+                    self._writes_during_load.append(document)
+
+    def discard(self, document_id: str):
+        """Forgets a document found to have been deleted elsewhere."""
+        with self._lock:
+            value = self._values.pop(document_id, None)
+            if value is not None and self._owners.get(value) == document_id:
+                del self._owners[value]
+
+    def _set(self, document_id: str, value):
+        old_value = self._values.get(document_id)
+        if old_value is not None and self._owners.get(old_value) == document_id:
+            del self._owners[old_value]
+        self._values[document_id] = value
+        self._owners[value] = document_id
+
+    def begin_load(self):
+        with self._lock:
+            self._writes_during_load = []
+
+    def finish_load(self, documents: List[dict]):
+        """Replaces the contents with a snapshot, keeping writes made while it was read."""
+        with self._lock:
+            writes, self._writes_during_load = self._writes_during_load or [], None
+            self._owners, self._values = {}, {}
+            self._written_here = {document["$id"] for document in writes}
+            for document in documents + writes:
+                if document.get(self.attribute) is not None:
+                    self._set(document["$id"], document[self.attribute])
+            self.loaded = True
+
+    def abort_load(self):
+        with self._lock:
+            self._writes_during_load = None
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+
+products_by_code = UniqueIndex(config.APPWRITE_COLLECTION_PRODUCTS_ID, "product_code")
+products_by_name = UniqueIndex(config.APPWRITE_COLLECTION_PRODUCTS_ID, "product_name")
+customers_by_contact = UniqueIndex(config.APPWRITE_COLLECTION_CUSTOMERS_ID, "contact")
+suppliers_by_name = UniqueIndex(config.APPWRITE_COLLECTION_SUPPLIERS_ID, "name")
+INDEXES = [products_by_code, products_by_name, customers_by_contact, suppliers_by_name]
+
+
+def is_taken(index: UniqueIndex, value, db, exclude_id: str = None) -> bool:
+    """
+    Whether a document other than `exclude_id` already holds `value`. Answered from
+    the index once it's loaded, re-reading a hit's owner when another worker may have
+    changed it (see the module docstring); with a remote query until then.
+    """
+    if config.UNIQUE_INDEX_ENABLED and index.loaded:
+        owner = index.owner(value)
+        if owner is None or owner == exclude_id:
+            return False
+        if not config.UNIQUE_INDEX_VERIFY_HITS or index.written_here(owner):
+            return True
+        try:
+            document = db.get_document(
+                database_id=config.APPWRITE_DATABASE_ID,
+                collection_id=index.collection_id,
+                document_id=owner
+            )
+        except AppwriteException as e:
+            if e.code != 404:
+                raise
+            index.discard(owner)
+            return False
+        index.add(document, written_here=False)
+        return document.get(index.attribute) == value
+
+    checks = [Query.equal(index.attribute, value), Query.limit(1)]
+    if exclude_id:
+        checks.append(Query.not_equal("$id", exclude_id))
+    found = db.list_documents(
+        database_id=config.APPWRITE_DATABASE_ID,
+        collection_id=index.collection_id,
+        queries=checks
+    )["documents"]
+    if found and config.UNIQUE_INDEX_ENABLED:
+        index.add(found[0], written_here=False)
+    return bool(found)
+
+
+def record(document: dict, collection_id: str):
+    """Adds a document just created or updated to the indexes of its collection."""
+    for index in INDEXES:
+        if index.collection_id == collection_id:
+            index.add(document)
+
+
+def reload(db):
+    """Scheduled job: rebuilds every index from Appwrite, one read per collection."""
+    by_collection = defaultdict(list)
+    for index in INDEXES:
+        by_collection[index.collection_id].append(index)
+    for collection_id, indexes in by_collection.items():
+        for index in indexes:
+            index.begin_load()
+        try:
+            documents = queries.list_all(db, collection_id, [Query.select(["$id"] + [index.attribute for index in indexes])])
+        except Exception:
+            for index in indexes:
+                index.abort_load()
+            raise
+        for index in indexes:
+            index.finish_load(documents)
+    logger.info("Unique key indexes loaded: %s", ", ".join(f"{index.collection_id}.{index.attribute}={len(index)}" for index in INDEXES))
+
+
+def stats() -> dict:
+    return {f"{index.collection_id}.{index.attribute}": {"loaded": index.loaded, "values": len(index)} for index in INDEXES}
@@ -5,7 +5,10 @@ from appwrite.client import Client
 from appwrite.services.databases import Databases
 from appwrite.services.users import Users
 from appwrite.services.account import Account
-from app.core import config
+from app.core import config, tracing, singleflight, retry, admission
+from app.core.sqlite_backend import SQLiteDatabases
+from app.core.offline import OfflineFirstDatabases, OfflineStore
+from app.core import report_mirror
 
 # --- Create a single, reusable Appwrite client ---
 client = Client()
@@ -13,10 +16,46 @@ client.set_endpoint('https://cloud.appwrite.io/v1')
 client.set_project(config.APPWRITE_PROJECT_ID)
 client.set_key(config.APPWRITE_API_KEY)
 
+# --- Choose where documents are stored (see STORAGE_BACKEND) ---
+if config.STORAGE_BACKEND == "sqlite":
+    document_store = SQLiteDatabases(config.SQLITE_DATABASE_PATH)
+else:
+    document_store = Databases(client)
+
 # --- Create service instances from the single client ---
-db_provider = Databases(client)
-users_provider = Users(client)
-account_provider = Account(client)
+# Each service is wrapped, outermost first, in:
+#   tracing      - a client span per call (when TRACING_ENABLED)
+#   singleflight - concurrent identical document reads share one call
+#   retry        - backoff retries and hedged reads for idempotent document calls
+#   admission    - global concurrency limit, priority lanes and circuit breaker
+db_provider = tracing.instrument(singleflight.instrument(retry.instrument(admission.instrument(document_store))))
+users_provider = tracing.instrument(admission.instrument(Users(client)))
+account_provider = tracing.instrument(admission.instrument(Account(client)))
+
+# --- Offline-first POS (see OFFLINE_POS_* settings) ---
+# Checkout and credit sales write to a local store; scheduled jobs (see app/jobs.py)
+# push those writes to Appwrite through the regular db_provider stack.
+pos_db_provider = None
+if config.OFFLINE_POS_ENABLED:
+    pos_db_provider = OfflineFirstDatabases(db_provider, OfflineStore(config.OFFLINE_STORE_PATH))
+
+# --- Report mirror (see REPORT_MIRROR_* settings), refreshed by scheduled jobs ---
+report_db_provider = None
+if config.REPORT_MIRROR_ENABLED:
+    report_db_provider = report_mirror.ReportMirror(
+        db_provider,
+        SQLiteDatabases(config.REPORT_MIRROR_PATH, indexed_attributes=report_mirror.INDEXED_ATTRIBUTES)
+    )
+
+def copy_to_local_mirrors(collection_id: str, documents: list):
+    """
+    Copies documents just written through get_db() or get_pos_db() into the POS and
+    report mirrors, so they don't serve the old versions until their next sync.
+    Call it before invalidating the report cache, or the recompute reads the old ones.
+    """
+    for mirror in (pos_db_provider, report_db_provider):
+        if mirror is not None:
+            mirror.copy_documents(collection_id, documents)
 
 # --- Define Dependency Functions ---
 
@@ -32,6 +71,14 @@ def get_account_service() -> Account:
     """Dependency to get the Appwrite Account service."""
     return account_provider
 
+def get_pos_db() -> Databases:
+    """Dependency for the POS write path: the offline-first store when enabled, else get_db()."""
+    return pos_db_provider or db_provider
+
+def get_report_db() -> Databases:
+    """Dependency for the reports: the local report mirror when enabled, else get_db()."""
+    return report_db_provider or db_provider
+
 # --- Security Dependency ---
 
 security_scheme = HTTPBearer()
@@ -63,5 +110,8 @@ async def get_current_user(
         if user is None:
             raise credentials_exception
         return user
+    except HTTPException:
+        # Includes a 503 from admission control, which must not look like a bad token
+        raise
     except Exception:
         raise credentials_exception
\ No newline at end of file
@@ -0,0 +1,59 @@
+from functools import partial
+
+from app.core import admission, config, sales_facts, sales_index, search_index, unique_index
+from app.core.scheduler import Scheduler
+from app.dependencies import db_provider, pos_db_provider, report_db_provider, get_report_db
+from app.services import reorder_service, report_service
+
+
+def register_jobs(scheduler: Scheduler):
+    """All background work of the app, run by the scheduler started in main.py's lifespan."""
+    jitter = config.SCHEDULER_JITTER_SECONDS
+    report_db = get_report_db()
+
+    # --- Offline-first POS replication (OFFLINE_POS_ENABLED) ---
+    if pos_db_provider is not None:
+        # Pushing queued sales is checkout traffic, so it isn't queued behind reports
+        scheduler.register("pos_outbox_sync", pos_db_provider.sync_outbox,
+                           every=config.REPLICATION_RETRY_SECONDS, lane=admission.LANE_CHECKOUT)
+        scheduler.register("pos_mirror_sync", pos_db_provider.sync_mirror,
+                           every=config.REPLICATION_PULL_INTERVAL_SECONDS, jitter=jitter, run_at_startup=True)
+
+    # --- Report mirror and cache warmup (REPORT_MIRROR_ENABLED) ---
+    if report_db_provider is not None:
+        scheduler.register("report_mirror_refresh", report_db_provider.refresh,
+                           every=config.REPORT_MIRROR_REFRESH_SECONDS, run_at_startup=True)
+        scheduler.register("report_mirror_reconcile", report_db_provider.reconcile,
+                           every=config.REPORT_MIRROR_RECONCILE_SECONDS, jitter=jitter)
+
+    # --- Sales fact store (SALES_FACTS_ENABLED) ---
+    if sales_facts.store is not None:
+        scheduler.register("sales_facts_backfill", partial(sales_facts.backfill_if_needed, db_provider))
+        # The hourly rollup lives in each worker's memory, so every worker compacts its own
+        scheduler.register("sales_rollup_compaction", sales_facts.compact_rollup,
+                           every=config.SALES_ROLLUP_INTERVAL_SECONDS, jitter=jitter, single_instance=False)
+        scheduler.register("reorder_suggestions", partial(reorder_service.refresh_reorder_suggestions, report_db),
+                           every=config.REORDER_REFRESH_SECONDS, jitter=jitter, run_at_startup=True)
+
+    # --- Sales index (SALES_INDEX_ENABLED) ---
+    if sales_index.index is not None:
+        scheduler.register("sales_index_backfill", partial(sales_index.backfill_if_needed, db_provider))
+
+    # --- Unique key indexes (UNIQUE_INDEX_ENABLED) ---
+    if config.UNIQUE_INDEX_ENABLED:
+        # In each worker's memory, so every worker loads its own
+        scheduler.register("unique_index_reload", partial(unique_index.reload, db_provider),
+                           every=config.UNIQUE_INDEX_RELOAD_SECONDS, jitter=jitter, run_at_startup=True,
+                           single_instance=False)
+
+    # --- Directory search (SEARCH_INDEX_ENABLED) ---
+    if config.SEARCH_INDEX_ENABLED:
+        scheduler.register("search_index_reload", partial(search_index.reload, db_provider),
+                           every=config.SEARCH_INDEX_RELOAD_SECONDS, jitter=jitter, run_at_startup=True,
+                           single_instance=False)
+
+    # --- Precomputed reports ---
+    scheduler.register("end_of_day_summary", partial(report_service.run_end_of_day_summary, report_db),
+                       cron=config.END_OF_DAY_SUMMARY_CRON)
+    scheduler.register("inventory_valuation", partial(report_service.run_inventory_valuation, report_db),
+                       every=config.INVENTORY_VALUATION_INTERVAL_SECONDS, jitter=jitter, run_at_startup=True)
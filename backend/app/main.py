@@ -1,5 +1,9 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, status , HTTPException
 from app.core import config
+from app.core import profiling, tracing, admission, cpu_pool, sales_facts, sales_index
+from app.core.scheduler import scheduler
+from app.jobs import register_jobs
 from fastapi.middleware.cors import CORSMiddleware
 from appwrite.client import Client
 from appwrite.services.databases import Databases
@@ -14,10 +18,24 @@ from app.services.auth_service import (
 )
 from datetime import timedelta 
 import logging 
-from .api import inventory_routes ,  supplier_routes , purchase_routes , pos_routes , customer_routes , report_routes , auth_routes
+from .api import inventory_routes ,  supplier_routes , purchase_routes , pos_routes , customer_routes , report_routes , auth_routes , metrics_routes
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Local data files live where the config says, and are only created when the app starts
+    sales_facts.open_store()
+    sales_index.open_index()
+    # Background jobs: replication, mirror refreshes and precomputed reports (see app/jobs.py)
+    if config.SCHEDULER_ENABLED:
+        register_jobs(scheduler)
+        scheduler.start()
+    yield
+    await scheduler.stop()
+    cpu_pool.shutdown()
+    tracing.exporter.close()
 
 # --- Create ONE FastAPI app ---
-app = FastAPI(title="MyShopApp API")
+app = FastAPI(title="MyShopApp API", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000", # The origin for your Next.js app
@@ -32,6 +50,13 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+# Admission control: each request waits for a slot in its lane (checkout, default or reports)
+app.middleware("http")(admission.admit_requests)
+# Opt-in request profiling (see PROFILING_* settings in core/config.py)
+app.middleware("http")(profiling.profile_requests)
+# Opt-in tracing (see TRACING_* settings). Registered last so it wraps the profiler too.
+app.middleware("http")(tracing.trace_requests)
+
 # Register routers
 app.include_router(auth_routes.router)
 app.include_router(inventory_routes.router)
@@ -40,6 +65,7 @@ app.include_router(purchase_routes.router)
 app.include_router(pos_routes.router)
 app.include_router(customer_routes.router)
 app.include_router(report_routes.router)
+app.include_router(metrics_routes.router)
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -1,10 +1,40 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
 class BatchUpdateSP(BaseModel):
     selling_price: float
 
+class BatchRepriceRequest(BaseModel):
+    # Which batches: a list of IDs, or all active batches of a product
+    batch_ids: Optional[List[str]] = None
+    product_id: Optional[str] = None
+    # The new price: a fixed selling price, or a markup on each batch's cost_price
+    selling_price: Optional[float] = Field(None, ge=0)
+    markup_percentage: Optional[float] = Field(None, ge=-100)
+
+    @model_validator(mode='after')
+    def check_one_of_each(self):
+        if (self.batch_ids is None) == (self.product_id is None):
+            raise ValueError("Give either batch_ids or product_id.")
+        if (self.selling_price is None) == (self.markup_percentage is None):
+            raise ValueError("Give either selling_price or markup_percentage.")
+        return self
+
+class BatchRepriceResult(BaseModel):
+    batch_id: str
+    status: Literal["updated", "unchanged", "not_found", "failed"]
+    selling_price: Optional[float] = None # The new price, if there is one
+    detail: Optional[str] = None
+
+class BatchRepriceResponse(BaseModel):
+    requested: int
+    updated: int
+    unchanged: int
+    not_found: int
+    failed: int
+    results: List[BatchRepriceResult]
+
 class BatchResponse(BaseModel):
     id: str = Field(..., alias='$id')
     product_id: str
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, TypeVar, Generic
+from typing import List, Optional, TypeVar, Generic
 
 # This allows us to create a generic model that can contain any type of data
 DataType = TypeVar('DataType')
@@ -8,4 +8,10 @@ class PaginatedResponse(BaseModel, Generic[DataType]):
     total: int # The total number of items available across all pages
     limit: int # The number of items requested per page
     offset: int # The starting position of the items in this response
-    data: List[DataType] # The actual list of data (e.g., list of sales, customers)
\ No newline at end of file
+    data: List[DataType] # The actual list of data (e.g., list of sales, customers)
+
+class CursorPage(BaseModel, Generic[DataType]):
+    total: int # The total number of items matching the filters
+    limit: int
+    next_cursor: Optional[str] = None # Pass as `cursor` to get the next page; None on the last page
+    data: List[DataType]
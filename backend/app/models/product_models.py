@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Literal, Optional
+from datetime import datetime
 
 class ProductBase(BaseModel):
     product_name: str
@@ -34,4 +35,39 @@ class ProductResponse(BaseModel):
 
     class Config:
         # This allows the model to be created from dictionary keys, including aliases
-        populate_by_name = True
\ No newline at end of file
+        populate_by_name = True
+
+
+class ProductImportRow(BaseModel):
+    row: int # Line number in the CSV, the header being line 1
+    status: Literal["created", "duplicate", "invalid", "failed"]
+    product_id: Optional[str] = None
+    detail: Optional[str] = None
+
+class ProductImportResponse(BaseModel):
+    total_rows: int
+    created: int
+    skipped: int # duplicate or invalid rows
+    failed: int
+    rows: List[ProductImportRow]
+
+
+class ReorderItem(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    product_code: Optional[str] = None
+    current_stock: int
+    units_per_day: float
+    days_of_cover: float
+    suggested_quantity: int
+
+class SupplierReorderGroup(BaseModel):
+    supplier_id: Optional[str] = None # Supplier of the product's latest batch
+    supplier_name: Optional[str] = None
+    lead_time_days: float
+    items: List[ReorderItem]
+
+class ReorderSuggestionsResponse(BaseModel):
+    generated_at: datetime
+    velocity_window_days: int
+    suppliers: List[SupplierReorderGroup]
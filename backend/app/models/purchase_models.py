@@ -20,8 +20,8 @@ class PurchaseCreate(BaseModel):
     items: List[ItemReceived] # A list of items received
     purchase_date: Optional[date] = None
 
-# This will be our response model
-class PurchaseResponse(BaseModel):
+# A purchase order without its line items, for lists
+class PurchaseSummary(BaseModel):
     id: str = Field(..., alias='$id')
     supplier_id: str
     purchase_date: datetime
@@ -29,7 +29,14 @@ class PurchaseResponse(BaseModel):
     payment_status: str
     amount_paid: float
     remaining_balance: float
-    items_received: List[ItemReceived]
 
     class Config:
         populate_by_name = True
+
+# This will be our response model
+class PurchaseResponse(PurchaseSummary):
+    items_received: List[ItemReceived]
+
+# A purchase history entry: items_received is only there when asked for
+class PurchaseHistoryItem(PurchaseSummary):
+    items_received: Optional[List[ItemReceived]] = None
@@ -2,9 +2,9 @@ from pydantic import BaseModel , Field
 from datetime import date , datetime
 from typing import Optional
 from app.models.pos_models import CheckoutItem
-from typing import List, Any
+from typing import Dict, List, Any
 from pydantic import model_validator
-import json
+from app.core import item_codec
 
 
 class FinancialSummaryResponse(BaseModel):
@@ -13,6 +13,62 @@ class FinancialSummaryResponse(BaseModel):
     total_tax_collected: float
     current_inventory_value: float
     vendor_dues: float
+    query_timings_ms: Optional[Dict[str, float]] = None # only with DEBUG=true
+
+
+class SalesAggregateRow(BaseModel):
+    key: Optional[str] = None # product ID, batch ID or date, depending on group_by
+    lines: int
+    quantity: int
+    revenue: float
+    cost: float
+    tax: float
+    discount: float
+    profit: float
+
+class SalesAggregateResponse(BaseModel):
+    group_by: Optional[str] = None
+    rows: List[SalesAggregateRow]
+
+
+class ProductPerformanceItem(BaseModel):
+    product_id: str
+    product_name: Optional[str] = None
+    product_code: Optional[str] = None
+    units_sold: int
+    revenue: float # before tax
+    cogs: float
+    gross_profit: float
+    gross_margin_percent: float
+    discount_given: float # (original - actual selling price) * quantity
+    units_per_day: float
+
+
+class SalesSeriesPoint(BaseModel):
+    bucket_start: str # IST hour (ISO datetime), day or week start (date), or month (YYYY-MM)
+    sales: float # including tax
+    tax: float
+    cogs: float
+    bills: int
+
+class SalesSeriesResponse(BaseModel):
+    bucket: str
+    points: List[SalesSeriesPoint]
+
+
+class DailySummaryResponse(FinancialSummaryResponse):
+    date: date
+    computed_at: datetime
+
+class ProductStockValue(BaseModel):
+    product_id: str
+    units: int
+    value: float # at cost
+
+class InventoryValuationResponse(BaseModel):
+    computed_at: datetime
+    total_value: float
+    products: List[ProductStockValue]
 
 
 class OperatingCostCreate(BaseModel):
@@ -42,6 +98,10 @@ class SaleHistoryItem(BaseModel):
     class Config:
         populate_by_name = True
 
+# A sale containing a given product or batch, with the quantity of it sold
+class SaleContainingItem(SaleHistoryItem):
+    quantity: int
+
 # Model for the detailed view (floating window)
 class SaleDetailResponse(SaleHistoryItem):
     total_before_tax: float
@@ -59,5 +119,5 @@ class SaleDetailResponse(SaleHistoryItem):
             items_sold_str = data.get('items_sold')
             if isinstance(items_sold_str, str):
                 # Replace the string with the parsed Python object
-                data['items_sold'] = json.loads(items_sold_str).get('items', [])
+                data['items_sold'] = item_codec.decode_items(items_sold_str)
         return data
\ No newline at end of file
@@ -6,6 +6,7 @@ from fastapi import HTTPException, status
 from appwrite.services.account import Account
 from appwrite.query import Query
 from app.core import config
+from app.core.tracing import traced
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from app.core import config 
@@ -13,6 +14,7 @@ from app.core import config
 # Note: We will pass the Appwrite client to these functions
 # to avoid circular dependencies and make them testable.
 
+@traced()
 async def create_new_user(name: str, email: str, users_service: Users) -> dict:
     """
     Creates a new user in the Appwrite authentication system.
@@ -50,6 +52,7 @@ async def create_new_user(name: str, email: str, users_service: Users) -> dict:
             detail=f"An error occurred with Appwrite: {e.message}"
         )
     
+@traced()
 async def request_login_token(email: str, users_service: Users, account_service: Account) -> dict:
     try:
         users_list = users_service.list(queries=[Query.equal("email", email)])
@@ -89,6 +92,7 @@ async def request_login_token(email: str, users_service: Users, account_service:
         )
     
 
+@traced()
 async def verify_otp_and_create_session(email: str, otp: str, users_service: Users, account_service: Account) -> dict:
     """
     Verifies OTP by looking up user_id from email and creating a session.
@@ -112,6 +116,7 @@ async def verify_otp_and_create_session(email: str, otp: str, users_service: Use
             raise HTTPException(status_code=401, detail="Invalid or expired OTP.")
         raise HTTPException(status_code=500, detail=f"Appwrite error: {e.message}")
 
+@traced()
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """
     Creates a new JWT access token.
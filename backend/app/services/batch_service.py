@@ -1,27 +1,36 @@
+import asyncio
+from typing import Callable, List, Optional
 from appwrite.services.databases import Databases
 from appwrite.query import Query
 from appwrite.exception import AppwriteException
 from fastapi import HTTPException, status
-from app.core import config
+from fastapi.concurrency import run_in_threadpool
+from app.core import config, queries
+from app.core.tracing import traced
 from app.services import product_service
 
-async def get_active_batches_for_product(product_id: str, db: Databases) -> list:
-    """Fetches all batches for a specific product where quantity > 0."""
+@traced()
+async def get_active_batches_for_product(product_id: str, db: Databases, fields: Optional[List[str]] = None) -> list:
+    """Fetches all batches (or just `fields` of them) for a specific product where quantity > 0."""
     await product_service.get_product_by_id(product_id, db)
     
     try:
+        batch_queries = [
+            Query.equal("product_id", product_id),
+            Query.greater_than("quantity_in_stock", 0) # <-- CORRECTED METHOD NAME
+        ]
+        if fields:
+            batch_queries.append(Query.select(fields))
         batch_list = db.list_documents(
             database_id=config.APPWRITE_DATABASE_ID,
             collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
-            queries=[
-                Query.equal("product_id", product_id),
-                Query.greater_than("quantity_in_stock", 0) # <-- CORRECTED METHOD NAME
-            ]
+            queries=batch_queries
         )
         return batch_list['documents']
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@traced()
 async def update_batch_sp(batch_id: str, new_sp: float, db: Databases) -> dict:
     """Updates the selling_price of a specific batch."""
     try:
@@ -35,4 +44,70 @@ async def update_batch_sp(batch_id: str, new_sp: float, db: Databases) -> dict:
     except AppwriteException as e:
         if e.code == 404:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Batch with ID '{batch_id}' not found.")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@traced()
+async def reprice_batches(
+    reprice: dict,
+    db: Databases,
+    on_updated: Optional[Callable[[List[dict]], None]] = None
+) -> dict:
+    """
+    Sets the selling_price of many batches: those in `batch_ids`, or all active batches
+    of `product_id`. The price is either `selling_price`, or `markup_percentage` on top
+    of each batch's cost_price (rounded to 2 decimals).
+
+    The batches are read in one (chunked) query, and only those whose price changes
+    are updated, BATCH_REPRICE_CONCURRENCY at a time. One failed update doesn't stop
+    the others; every batch's outcome is returned. `on_updated` gets the updated
+    batch documents, e.g. to refresh local copies.
+    """
+    try:
+        if reprice.get("product_id"):
+            await product_service.get_product_by_id(reprice["product_id"], db)
+            batches = await run_in_threadpool(queries.list_all, db, config.APPWRITE_COLLECTION_BATCHES_ID, [
+                Query.equal("product_id", reprice["product_id"]),
+                Query.greater_than("quantity_in_stock", 0)
+            ])
+            batch_ids = [batch["$id"] for batch in batches]
+            found = {batch["$id"]: batch for batch in batches}
+        else:
+            batch_ids = list(dict.fromkeys(reprice["batch_ids"]))
+            found = await run_in_threadpool(queries.get_by_ids, db, config.APPWRITE_COLLECTION_BATCHES_ID, batch_ids)
+    except AppwriteException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    slots = asyncio.Semaphore(config.BATCH_REPRICE_CONCURRENCY)
+    updated_batches = []
+
+    async def reprice_one(batch_id: str) -> dict:
+        batch = found.get(batch_id)
+        if batch is None:
+            return {"batch_id": batch_id, "status": "not_found", "detail": f"Batch with ID '{batch_id}' not found."}
+        if reprice.get("markup_percentage") is not None:
+            new_sp = round(batch["cost_price"] * (1 + reprice["markup_percentage"] / 100), 2)
+        else:
+            new_sp = reprice["selling_price"]
+        if batch.get("selling_price") == new_sp:
+            return {"batch_id": batch_id, "status": "unchanged", "selling_price": new_sp}
+        async with slots:
+            try:
+                updated = await run_in_threadpool(
+                    db.update_document,
+                    database_id=config.APPWRITE_DATABASE_ID,
+                    collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
+                    document_id=batch_id,
+                    data={"selling_price": new_sp}
+                )
+            except (AppwriteException, HTTPException) as e:
+                return {"batch_id": batch_id, "status": "failed", "detail": str(e.detail) if isinstance(e, HTTPException) else str(e)}
+        updated_batches.append(updated)
+        return {"batch_id": batch_id, "status": "updated", "selling_price": new_sp}
+
+    results = await asyncio.gather(*(reprice_one(batch_id) for batch_id in batch_ids))
+    if on_updated is not None and updated_batches:
+        on_updated(updated_batches)
+
+    counts = {outcome: sum(1 for result in results if result["status"] == outcome)
+              for outcome in ("updated", "unchanged", "not_found", "failed")}
+    return {"requested": len(batch_ids), **counts, "results": results}
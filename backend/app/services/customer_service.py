@@ -3,24 +3,29 @@ from appwrite.query import Query
 from appwrite.id import ID
 from appwrite.exception import AppwriteException
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from app.core import config
-from typing import List
+from app.core import tracing
+from app.core import sales_facts
+from app.core import sales_index
+from app.core import report_cache
+from app.core import item_codec
+from app.core import unique_index
+from app.core import search_index
+from app.core.tracing import traced
+from app.dependencies import copy_to_local_mirrors
+from typing import List, Optional
 from dateutil import parser
 from app.core.utils import get_current_ist_time
 from app.services import pos_service, product_service
 from app.models.pos_models import CheckoutRequest
-import json 
 
+@traced()
 async def create_customer(customer_data: dict, db: Databases) -> dict:
     """Creates a new customer document, ensuring the contact is unique."""
     try:
         # Check for uniqueness of customer contact number
-        contact_check = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_CUSTOMERS_ID,
-            queries=[Query.equal("contact", customer_data["contact"])]
-        )
-        if contact_check['total'] > 0:
+        if unique_index.is_taken(unique_index.customers_by_contact, customer_data["contact"], db):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A customer with this contact number already exists.")
             
         # Add the default outstanding_balance to the payload
@@ -34,24 +39,40 @@ async def create_customer(customer_data: dict, db: Databases) -> dict:
             document_id=ID.unique(),
             data=final_customer_data
         )
+        unique_index.record(new_customer, config.APPWRITE_COLLECTION_CUSTOMERS_ID)
+        search_index.record(new_customer, config.APPWRITE_COLLECTION_CUSTOMERS_ID)
         return new_customer
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
-async def get_all_customers(db: Databases) -> list:
-    """Fetches all documents from the customers collection."""
+@traced()
+async def get_all_customers(db: Databases, fields: Optional[List[str]] = None) -> list:
+    """Fetches all documents from the customers collection, or just `fields` of each."""
     try:
         # We can add sorting here, for example, by name
+        queries = [Query.order_asc("name")] # Sorting alphabetically by name
+        if fields:
+            queries.append(Query.select(fields))
         customer_list = db.list_documents(
             database_id=config.APPWRITE_DATABASE_ID,
             collection_id=config.APPWRITE_COLLECTION_CUSTOMERS_ID,
-            queries=[Query.order_asc("name")] # Sorting alphabetically by name
+            queries=queries
         )
         return customer_list['documents']
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@traced()
+async def search_customers(query: Optional[str], limit: int, offset: int) -> dict:
+    """
+    A page of the customers whose name has words starting with those of `query`, or
+    whose contact contains its digits, sorted by name. All customers without a query.
+    Served from the in-process search index, without Appwrite reads.
+    """
+    return search_index.search_page(search_index.customers, query, limit, offset)
+
+@traced()
 async def get_customer_by_id(customer_id: str, db: Databases) -> dict:
     """Fetches a single customer document by its Appwrite Document ID."""
     try:
@@ -71,6 +92,7 @@ async def get_customer_by_id(customer_id: str, db: Databases) -> dict:
     
 
 
+@traced()
 async def get_customer_ledger(customer_id: str, db: Databases) -> List[dict]:
     """
     Fetches the transaction history for a customer's current outstanding balance.
@@ -115,6 +137,7 @@ async def get_customer_ledger(customer_id: str, db: Databases) -> List[dict]:
     return ledger_transactions
 
 
+@traced()
 async def add_items_to_customer_credit(customer_id: str, credit_data: CheckoutRequest, db: Databases) -> dict:
     """
     Processes a credit sale safely. Calculates tax on top of the provided price.
@@ -124,6 +147,7 @@ async def add_items_to_customer_credit(customer_id: str, credit_data: CheckoutRe
     customer = await get_customer_by_id(customer_id, db)
     if not credit_data.items:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot add an empty bill to credit.")
+    tracing.set_attributes({"cart.size": len(credit_data.items), "customer.id": customer_id})
 
     # --- Step 2: CORRECTED FINANCIAL CALCULATIONS (Read-only operation) ---
     
@@ -159,9 +183,6 @@ async def add_items_to_customer_credit(customer_id: str, credit_data: CheckoutRe
         current_time = get_current_ist_time()
         unique_bill_id = ID.unique()
         
-        # Prepare the items payload for storage, using the enriched data
-        items_to_store = {"items": items_with_full_details}
-        
         sales_order_payload = {
             "bill_number": unique_bill_id,
             "is_printed": False,
@@ -170,7 +191,7 @@ async def add_items_to_customer_credit(customer_id: str, credit_data: CheckoutRe
             "total_tax_amount": round(total_tax_amount, 2),
             "grand_total": round(grand_total, 2),
             "payment_method": "customer_tab",
-            "items_sold": json.dumps(items_to_store) # Use the enriched items list
+            "items_sold": item_codec.encode_items(items_with_full_details) # Use the enriched items list
         }
         new_sale_order = db.create_document(
             database_id=config.APPWRITE_DATABASE_ID,
@@ -204,7 +225,13 @@ async def add_items_to_customer_credit(customer_id: str, credit_data: CheckoutRe
         )
         
         # Step 6: ONLY if all sales records are created successfully, execute the inventory deduction.
-        await pos_service.execute_fifo_deduction(credit_data.items, db)
+        deduction = await pos_service.execute_fifo_deduction(credit_data.items, db)
+        await run_in_threadpool(sales_facts.record_sale, new_sale_order['$id'], sales_order_payload["sale_date_time"], deduction["details"])
+        await run_in_threadpool(sales_index.record_sale, new_sale_order['$id'], sales_order_payload["sale_date_time"], items_with_full_details)
+        await run_in_threadpool(copy_to_local_mirrors, config.APPWRITE_COLLECTION_SALES_ORDERS_ID, [new_sale_order])
+        await run_in_threadpool(copy_to_local_mirrors, config.APPWRITE_COLLECTION_BATCHES_ID, deduction["updated_batches"])
+        report_cache.invalidate(sales_order_payload["sale_date_time"])
+        search_index.record(updated_customer, config.APPWRITE_COLLECTION_CUSTOMERS_ID)
 
         return updated_customer
 
@@ -223,6 +250,7 @@ async def add_items_to_customer_credit(customer_id: str, credit_data: CheckoutRe
     
 
 
+@traced()
 async def settle_customer_dues(customer_id: str, payment_method: str, db: Databases) -> dict:
     """
     Clears a customer's outstanding balance and records a payment transaction.
@@ -260,11 +288,13 @@ async def settle_customer_dues(customer_id: str, payment_method: str, db: Databa
         document_id=customer_id,
         data={"outstanding_balance": 0.0}
     )
+    search_index.record(updated_customer, config.APPWRITE_COLLECTION_CUSTOMERS_ID)
 
     return updated_customer
 
 
 
+@traced()
 async def get_customer_transaction_history(
     customer_id: str, db: Databases, limit: int, offset: int
 ) -> dict:
@@ -1,7 +1,11 @@
 from appwrite.services.databases import Databases
 from appwrite.query import Query
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from app.core import config
+from app.core import singleflight
+from app.core import tracing
+from app.core.tracing import traced
 from typing import List, Dict, Any
 from appwrite.exception import AppwriteException
 import logging
@@ -39,16 +43,20 @@ class FifoCalculationResult(BaseModel):
     is_sufficient_stock: bool
     stock_shortage: int
 
+@traced()
 async def simulate_sale_fifo(product_id: str, quantity_to_sell: int, db: Databases) -> SaleSimulationResult:
     """
     Simulates a sale using FIFO, returning a detailed breakdown for a rich frontend UI.
     This is a read-only operation.
     """
+    tracing.set_attributes({"product.id": product_id, "sale.quantity": quantity_to_sell})
     try:
         product_doc = await product_service.get_product_by_id(product_id, db)
         global_sp = product_doc.get('global_selling_price', 0.0)
-        # 1. Fetch all active, oldest-first batches for the product
-        active_batches = db.list_documents(
+        # 1. Fetch all active, oldest-first batches for the product.
+        # Off the event loop, so identical listings from concurrent tills are coalesced.
+        batch_list = await run_in_threadpool(
+            db.list_documents,
             database_id=config.APPWRITE_DATABASE_ID,
             collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
             queries=[
@@ -56,7 +64,9 @@ async def simulate_sale_fifo(product_id: str, quantity_to_sell: int, db: Databas
                 Query.greater_than("quantity_in_stock", 0),
                 Query.order_asc("date_received")
             ]
-        )['documents']
+        )
+        active_batches = batch_list['documents']
+        tracing.set_attributes({"batch.count": len(active_batches)})
 
         # 2. Check for sufficient total stock
         total_available_stock = sum(batch['quantity_in_stock'] for batch in active_batches)
@@ -101,10 +111,13 @@ async def simulate_sale_fifo(product_id: str, quantity_to_sell: int, db: Databas
             line_items=line_items
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error during sale simulation: {str(e)}")
     
 
+@traced()
 async def execute_fifo_deduction(items_to_sell: List[CheckoutItem], db: Databases) -> dict:
     """
     Executes stock deduction and returns rich details for historical records.
@@ -113,95 +126,118 @@ async def execute_fifo_deduction(items_to_sell: List[CheckoutItem], db: Database
     Returns:
         A dictionary containing total COGS and a detailed breakdown for record-keeping.
     """
+    # In the threadpool, so a transient Appwrite failure is retried (see core/retry.py)
+    # rather than failing the whole checkout
+    return await run_in_threadpool(_deduct_stock, items_to_sell, db)
+
+
+def _deduct_stock(items_to_sell: List[CheckoutItem], db: Databases) -> dict:
+    # Stock levels are read, changed and written back; the lock keeps this worker's
+    # checkouts and deliveries from interleaving and losing each other's updates
+    with product_service.stock_lock:
+        return _deduct_stock_locked(items_to_sell, db)
+
+
+def _deduct_stock_locked(items_to_sell: List[CheckoutItem], db: Databases) -> dict:
     total_cost_of_sale = 0.0
     detailed_results = []
+    updated_batches = []
     
     # Group quantities by product_id to perform a single stock update per product
     product_stock_updates: Dict[str, int] = {}
 
+    tracing.set_attributes({"cart.size": len(items_to_sell)})
+
     # --- We will perform all validations BEFORE making any database changes ---
     validated_data_list = []
-    for item in items_to_sell:
-        try:
-            # Fetch both the batch and its parent product in the validation phase
-            batch_doc = db.get_document(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
-                document_id=item.batch_id
-            )
+    with tracing.start_span("fifo.validation"):
+        for item in items_to_sell:
+            try:
+                # Fetch both the batch and its parent product in the validation phase.
+                # The batch's stock is written back below, so its read isn't shared.
+                with singleflight.fresh_reads():
+                    batch_doc = db.get_document(
+                        database_id=config.APPWRITE_DATABASE_ID,
+                        collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
+                        document_id=item.batch_id
+                    )
             
-            # Since product_id is the same for the item and batch, we use it to fetch the product
-            product_doc = db.get_document(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-                document_id=item.product_id
-            )
-
-            if batch_doc['quantity_in_stock'] < item.quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail=f"Insufficient stock for batch {item.batch_id}. "
-                           f"Requested: {item.quantity}, Available: {batch_doc['quantity_in_stock']}."
+                # Since product_id is the same for the item and batch, we use it to fetch the product
+                product_doc = db.get_document(
+                    database_id=config.APPWRITE_DATABASE_ID,
+                    collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
+                    document_id=item.product_id
                 )
 
-            # Store all necessary data for later processing
-            validated_data_list.append({
-                'item_from_request': item,
-                'batch_doc': batch_doc,
-                'product_doc': product_doc
-            })
+                if batch_doc['quantity_in_stock'] < item.quantity:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Insufficient stock for batch {item.batch_id}. "
+                               f"Requested: {item.quantity}, Available: {batch_doc['quantity_in_stock']}."
+                    )
+
+                # Store all necessary data for later processing
+                validated_data_list.append({
+                    'item_from_request': item,
+                    'batch_doc': batch_doc,
+                    'product_doc': product_doc
+                })
             
-            # Aggregate the total quantity to deduct for each product
-            product_stock_updates[item.product_id] = product_stock_updates.get(item.product_id, 0) + item.quantity
+                # Aggregate the total quantity to deduct for each product
+                product_stock_updates[item.product_id] = product_stock_updates.get(item.product_id, 0) + item.quantity
 
-        except AppwriteException as e:
-            if e.code == 404:
-                # This could be a missing batch OR a missing product
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Could not find batch or product for item with batch ID {item.batch_id}.")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Validation failed: {str(e)}")
+            except AppwriteException as e:
+                if e.code == 404:
+                    # This could be a missing batch OR a missing product
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Could not find batch or product for item with batch ID {item.batch_id}.")
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Validation failed: {str(e)}")
 
     # --- If all validations passed, now we can safely perform all WRITE operations ---
-    try:
-        # Update batch documents
-        for valid_data in validated_data_list:
-            item = valid_data['item_from_request']
-            batch_doc = valid_data['batch_doc']
-            
-            item_cost = item.quantity * batch_doc['cost_price']
-            total_cost_of_sale += item_cost
+    with tracing.start_span("fifo.deduction", attributes={"product.count": len(product_stock_updates)}):
+        try:
+            # Update batch documents
+            for valid_data in validated_data_list:
+                item = valid_data['item_from_request']
+                batch_doc = valid_data['batch_doc']
             
-            new_batch_stock = batch_doc['quantity_in_stock'] - item.quantity
-            db.update_document(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
-                document_id=item.batch_id,
-                data={"quantity_in_stock": new_batch_stock}
-            )
-            # Add the validated data to our results list for the return value
-            detailed_results.append(valid_data)
-
-        # Update master product documents
-        for product_id, total_deduction in product_stock_updates.items():
-            # We already fetched the product_doc during validation, but fetching again
-            # is safer in case of high concurrency. Let's stick with the safe approach.
-            product_doc = db.get_document(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-                document_id=product_id
-            )
-            new_stock_total = product_doc['current_total_stock'] - total_deduction
-            if new_stock_total < 0:
-                new_stock_total = 0
-
-            db.update_document(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-                document_id=product_id,
-                data={"current_total_stock": new_stock_total}
-            )
+                item_cost = item.quantity * batch_doc['cost_price']
+                total_cost_of_sale += item_cost
             
-    except AppwriteException as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"A critical error occurred during stock update: {str(e)}")
+                new_batch_stock = batch_doc['quantity_in_stock'] - item.quantity
+                updated_batch = db.update_document(
+                    database_id=config.APPWRITE_DATABASE_ID,
+                    collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
+                    document_id=item.batch_id,
+                    data={"quantity_in_stock": new_batch_stock}
+                )
+                # Add the validated data to our results list for the return value
+                detailed_results.append(valid_data)
+                updated_batches.append(updated_batch)
+
+            # Update master product documents
+            for product_id, total_deduction in product_stock_updates.items():
+                # We already fetched the product_doc during validation, but fetching again
+                # is safer in case of high concurrency. Let's stick with the safe approach.
+                # (Not coalesced: a shared read could predate another sale's decrement.)
+                with singleflight.fresh_reads():
+                    product_doc = db.get_document(
+                        database_id=config.APPWRITE_DATABASE_ID,
+                        collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
+                        document_id=product_id
+                    )
+                new_stock_total = product_doc['current_total_stock'] - total_deduction
+                if new_stock_total < 0:
+                    new_stock_total = 0
+
+                db.update_document(
+                    database_id=config.APPWRITE_DATABASE_ID,
+                    collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
+                    document_id=product_id,
+                    data={"current_total_stock": new_stock_total}
+                )
             
+        except AppwriteException as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"A critical error occurred during stock update: {str(e)}")
+
     # Return the rich dictionary object
-    return {"total_cogs": total_cost_of_sale, "details": detailed_results}
\ No newline at end of file
+    return {"total_cogs": total_cost_of_sale, "details": detailed_results, "updated_batches": updated_batches}
\ No newline at end of file
@@ -1,34 +1,38 @@
+import asyncio
+import csv
+import io
+import threading
+from itertools import islice
 from appwrite.services.databases import Databases
 from appwrite.id import ID
 from appwrite.exception import AppwriteException
 from fastapi import HTTPException, status
-from app.core import config
+from fastapi.concurrency import run_in_threadpool
+from app.core import config, queries, unique_index
+from app.core.tracing import traced
 from app.core.utils import get_current_ist_time
-from app.models import purchase_models
+from app.models import product_models, purchase_models
 from appwrite.query import Query
+from pydantic import ValidationError
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
 # --- Import the services we need for validation ---
 from app.services import supplier_service, product_service
 
+# Held around every read-modify-write of a stock level (checkout deductions, purchase
+# receipts). They run in the threadpool, so without it two of this worker's updates
+# of the same product could interleave and one would be lost.
+stock_lock = threading.Lock()
+
+@traced()
 async def create_product(product_data: dict, db: Databases) -> dict:
     """Creates a new product document in the products collection."""
     try:
-        # First, check for uniqueness of product_code and product_name
-        # ... (uniqueness check code remains exactly the same)
-        code_check = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-            queries=[Query.equal("product_code", product_data["product_code"])]
-        )
-        if code_check['total'] > 0:
+        # First, check for uniqueness of product_code and product_name (see app/core/unique_index.py)
+        if unique_index.is_taken(unique_index.products_by_code, product_data["product_code"], db):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Item Code already exists.")
 
-        name_check = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-            queries=[Query.equal("product_name", product_data["product_name"])]
-        )
-        if name_check['total'] > 0:
+        if unique_index.is_taken(unique_index.products_by_name, product_data["product_name"], db):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Product Name already exists.")
         
         # --- THIS IS THE KEY CHANGE ---
@@ -45,14 +49,128 @@ async def create_product(product_data: dict, db: Databases) -> dict:
             document_id=ID.unique(),
             data=final_product_data # <-- Use the modified data dictionary
         )
+        unique_index.record(new_product, config.APPWRITE_COLLECTION_PRODUCTS_ID)
         return new_product
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+IMPORT_COLUMNS = ("product_name", "product_code", "tax_percentage", "global_selling_price")
+
+def _numbered_rows(reader: csv.DictReader) -> Iterator[Tuple[int, dict]]:
+    # line_num after reading a row is its last line, so quoted line breaks don't skew the numbers
+    for row in reader:
+        yield reader.line_num, row
+
+def _parse_import_row(row: dict) -> dict:
+    """The product payload of a CSV row. Raises ValueError with a readable message."""
+    values = {column: (row.get(column) or "").strip() for column in IMPORT_COLUMNS}
+    for column in ("product_name", "product_code"):
+        if not values[column]:
+            raise ValueError(f"{column} is empty.")
+    try:
+        # Blank optional columns take the model's defaults
+        product = product_models.ProductCreate(**{column: value for column, value in values.items() if value})
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{error['loc'][0]}: {error['msg']}" for error in e.errors())) from e
+    return {**product.model_dump(), "current_total_stock": 0}
+
+@traced()
+async def import_products(csv_file: BinaryIO, db: Databases) -> dict:
+    """
+    Creates products from an uploaded CSV with product_name and product_code columns
+    (tax_percentage and global_selling_price are optional), reporting the outcome of
+    every row.
+
+    The file is read a batch of rows at a time rather than all at once. Uniqueness is
+    checked against the codes and names of all products, read once up front, plus those
+    earlier in the file, instead of two queries per row as in create_product(). Each
+    batch's products are then created concurrently.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(csv_file, encoding="utf-8-sig", newline=""))
+    try:
+        header = await run_in_threadpool(lambda: reader.fieldnames) or []
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not read the CSV: {e}")
+    missing = [column for column in ("product_name", "product_code") if column not in header]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"The CSV is missing the columns: {', '.join(missing)}")
+
+    try:
+        existing = await run_in_threadpool(
+            queries.list_all, db, config.APPWRITE_COLLECTION_PRODUCTS_ID, [Query.select(["product_code", "product_name"])]
+        )
+    except AppwriteException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    codes = {product["product_code"] for product in existing}
+    names = {product["product_name"] for product in existing}
+
+    slots = asyncio.Semaphore(config.PRODUCT_IMPORT_CONCURRENCY)
+
+    async def create(line: int, payload: dict) -> dict:
+        async with slots:
+            try:
+                product = await run_in_threadpool(
+                    db.create_document,
+                    database_id=config.APPWRITE_DATABASE_ID,
+                    collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
+                    document_id=ID.unique(),
+                    data=payload
+                )
+            except (AppwriteException, HTTPException) as e:
+                # Not created, so a later row may use the code and name after all
+                codes.discard(payload["product_code"])
+                names.discard(payload["product_name"])
+                return {"row": line, "status": "failed", "detail": str(e.detail) if isinstance(e, HTTPException) else str(e)}
+            unique_index.record(product, config.APPWRITE_COLLECTION_PRODUCTS_ID)
+            return {"row": line, "status": "created", "product_id": product["$id"]}
+
+    results = []
+    rows = _numbered_rows(reader)
+    while True:
+        try:
+            batch = await run_in_threadpool(lambda: list(islice(rows, config.PRODUCT_IMPORT_BATCH_SIZE)))
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Keep what was imported so far and report where reading stopped
+            results.append({"row": reader.line_num + 1, "status": "invalid", "detail": f"Could not read the rest of the CSV: {e}"})
+            break
+        if not batch:
+            break
+        writes = []
+        for line, row in batch:
+            try:
+                payload = _parse_import_row(row)
+            except ValueError as e:
+                results.append({"row": line, "status": "invalid", "detail": str(e)})
+                continue
+            if payload["product_code"] in codes:
+                results.append({"row": line, "status": "duplicate", "detail": "Item Code already exists."})
+            elif payload["product_name"] in names:
+                results.append({"row": line, "status": "duplicate", "detail": "Product Name already exists."})
+            else:
+                codes.add(payload["product_code"])
+                names.add(payload["product_name"])
+                writes.append(create(line, payload))
+        results.extend(await asyncio.gather(*writes))
+
+    results.sort(key=lambda result: result["row"])
+    counts = {outcome: sum(1 for result in results if result["status"] == outcome)
+              for outcome in ("created", "duplicate", "invalid", "failed")}
+    return {
+        "total_rows": len(results),
+        "created": counts["created"],
+        "skipped": counts["duplicate"] + counts["invalid"],
+        "failed": counts["failed"],
+        "rows": results
+    }
+
+@traced()
 async def get_product_by_id(product_id: str, db: Databases) -> dict:
     """Fetches a single product document by its Appwrite Document ID."""
     try:
-        product = db.get_document(
+        # Run off the event loop so that concurrent lookups of the same product
+        # overlap and can be coalesced by the single-flight layer.
+        product = await run_in_threadpool(
+            db.get_document,
             database_id=config.APPWRITE_DATABASE_ID,
             collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
             document_id=product_id
@@ -69,18 +187,34 @@ async def get_product_by_id(product_id: str, db: Databases) -> dict:
             detail=str(e)
         )
 
-async def get_all_products(db: Databases) -> list:
-    """Fetches all documents from the products collection."""
+@traced()
+async def get_products_by_ids(product_ids: List[str], db: Databases) -> Dict[str, dict]:
+    """
+    Fetches many products at once: product ID -> document. IDs that don't exist are
+    left out. Long ID lists are split into concurrent chunked queries.
+    """
+    try:
+        return await run_in_threadpool(queries.get_by_ids, db, config.APPWRITE_COLLECTION_PRODUCTS_ID, product_ids)
+    except AppwriteException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+@traced()
+async def get_all_products(db: Databases, fields: Optional[List[str]] = None) -> list:
+    """Fetches all documents from the products collection, or just `fields` of each."""
     try:
+        product_queries = [Query.order_asc("product_name")] # Sort alphabetically by name
+        if fields:
+            product_queries.append(Query.select(fields))
         product_list = db.list_documents(
             database_id=config.APPWRITE_DATABASE_ID,
             collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-            queries=[Query.order_asc("product_name")] # Sort alphabetically by name
+            queries=product_queries
         )
         return product_list['documents']
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@traced()
 async def search_products(query: str, db: Databases) -> list:
     """
     Searches for products by substring in both product_code and product_name,
@@ -128,33 +262,18 @@ async def search_products(query: str, db: Databases) -> list:
             )
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
+@traced()
 async def update_product_by_id(product_id: str, product_data: dict, db: Databases) -> dict:
     """Updates an existing product document after checking for uniqueness of new code/name."""
     try:
         # Check if the user is trying to update the product_code
         if "product_code" in product_data:
-            code_check = db.list_documents(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-                queries=[
-                    Query.equal("product_code", product_data["product_code"]),
-                    Query.not_equal("$id", product_id) # <--- CORRECTED METHOD NAME
-                ]
-            )
-            if code_check['total'] > 0:
+            if unique_index.is_taken(unique_index.products_by_code, product_data["product_code"], db, exclude_id=product_id):
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Item Code already exists in another product.")
 
         # Check if the user is trying to update the product_name
         if "product_name" in product_data:
-            name_check = db.list_documents(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-                queries=[
-                    Query.equal("product_name", product_data["product_name"]),
-                    Query.not_equal("$id", product_id) # <--- CORRECTED METHOD NAME
-                ]
-            )
-            if name_check['total'] > 0:
+            if unique_index.is_taken(unique_index.products_by_name, product_data["product_name"], db, exclude_id=product_id):
                 raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Product Name already exists in another product.")
 
         # If all checks pass, proceed with the update
@@ -164,6 +283,7 @@ async def update_product_by_id(product_id: str, product_data: dict, db: Database
             document_id=product_id,
             data=product_data
         )
+        unique_index.record(updated_product, config.APPWRITE_COLLECTION_PRODUCTS_ID)
         return updated_product
     except AppwriteException as e:
         if e.code == 404:
@@ -2,17 +2,49 @@ from appwrite.services.databases import Databases
 from appwrite.id import ID
 from appwrite.exception import AppwriteException
 from fastapi import HTTPException, status
-from app.core import config
+from fastapi.concurrency import run_in_threadpool
+from app.core import config, item_codec, report_cache, singleflight
+from app.core.tracing import traced
+from app.dependencies import copy_to_local_mirrors
 from app.core.utils import get_current_ist_time
 from app.models import purchase_models
 from appwrite.query import Query
 from typing import Optional
-import json
 from app.services import supplier_service, product_service
 
 
 
 
+def _decode_items_received(purchase_order: dict):
+    """Replaces the stored items_received with the list of items, or [] if it can't be read."""
+    try:
+        purchase_order['items_received'] = item_codec.decode_items(purchase_order.get('items_received'))
+    except ValueError:
+        # Unreadable items shouldn't make the whole purchase order unreadable
+        purchase_order['items_received'] = []
+
+
+def _add_to_stock(product_id: str, quantity: int, db: Databases):
+    # Re-read the stock rather than using the validation read: that one may be shared with
+    # a concurrent request or predate a sale, and writing back from it would lose the sale
+    with product_service.stock_lock:
+        with singleflight.fresh_reads():
+            product_doc = db.get_document(
+                database_id=config.APPWRITE_DATABASE_ID,
+                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
+                document_id=product_id
+            )
+        new_stock_total = int(product_doc.get('current_total_stock', 0)) + quantity
+
+        db.update_document(
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
+            document_id=product_id,
+            data={"current_total_stock": new_stock_total}  # ✅ always int
+        )
+
+
+@traced()
 async def process_new_purchase(purchase_data: purchase_models.PurchaseCreate, db: Databases) -> dict:
     """
     Main service to process a new stock purchase.
@@ -22,10 +54,13 @@ async def process_new_purchase(purchase_data: purchase_models.PurchaseCreate, db
     # --- Validation Step (Remains the same) ---
     await supplier_service.get_supplier_by_id(purchase_data.supplier_id, db)
     # Storing products in a dictionary for efficient stock update later
-    validated_products = {}
+    validated_products = await product_service.get_products_by_ids([item.product_id for item in purchase_data.items], db)
     for item in purchase_data.items:
-        product_doc = await product_service.get_product_by_id(item.product_id, db)
-        validated_products[item.product_id] = product_doc
+        if item.product_id not in validated_products:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product with ID '{item.product_id}' not found."
+            )
 
     # --- Step 1: Create the Purchase Order (Remains the same) ---
     # ... (code for calculating balances and creating po_data_payload) ...
@@ -46,9 +81,7 @@ async def process_new_purchase(purchase_data: purchase_models.PurchaseCreate, db
         "payment_status": purchase_data.payment_status,
         "amount_paid": amount_paid,
         "remaining_balance": remaining_balance,
-         "items_received": json.dumps({
-    "items": [item.model_dump() for item in purchase_data.items]
-})
+        "items_received": item_codec.encode_items([item.model_dump() for item in purchase_data.items])
     }
     
     try:
@@ -59,17 +92,9 @@ async def process_new_purchase(purchase_data: purchase_models.PurchaseCreate, db
             data=po_data_payload
         )
 
-        items_str = purchase_order_document.get("items_received")
-        if isinstance(items_str, str):
-            try:
-                purchase_order_document["items_received"] = json.loads(items_str).get("items", [])
-            except json.JSONDecodeError:
-                purchase_order_document["items_received"] = []
-        else:
-            purchase_order_document["items_received"] = []
-
         # --- NEW LOGIC: Step 2: Create Batches and Update Product Stock ---
         
+        new_batches = []
         for item in purchase_data.items:
             # Prepare the data payload for the new batch document
             batch_data = {
@@ -85,24 +110,24 @@ async def process_new_purchase(purchase_data: purchase_models.PurchaseCreate, db
             }
             
             # Create the batch document in Appwrite
-            db.create_document(
+            new_batch = db.create_document(
                 database_id=config.APPWRITE_DATABASE_ID,
                 collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
                 document_id=ID.unique(),
                 data=batch_data
             )
             
+            new_batches.append(new_batch)
+
             # Update the product's total stock
-            old_stock = int(validated_products[item.product_id].get('current_total_stock', 0))
-            new_stock_total = old_stock + int(item.quantity)
+            await run_in_threadpool(_add_to_stock, item.product_id, int(item.quantity), db)
 
-            db.update_document(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_PRODUCTS_ID,
-                document_id=item.product_id,
-                data={"current_total_stock": new_stock_total}  # ✅ always int
-            )
+        # Purchases only change current state (stock value, vendor dues), not dated totals
+        await run_in_threadpool(copy_to_local_mirrors, config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID, [purchase_order_document])
+        await run_in_threadpool(copy_to_local_mirrors, config.APPWRITE_COLLECTION_BATCHES_ID, new_batches)
+        report_cache.invalidate()
 
+        _decode_items_received(purchase_order_document)
         return purchase_order_document
         
     except AppwriteException as e:
@@ -116,6 +141,7 @@ async def process_new_purchase(purchase_data: purchase_models.PurchaseCreate, db
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to process purchase: {str(e)}")
 
 
+@traced()
 async def get_purchase_history(supplier_id: Optional[str], db: Databases) -> list:
     """Fetches a list of all purchase orders, newest first. Can be filtered by supplier."""
     try:
@@ -131,17 +157,7 @@ async def get_purchase_history(supplier_id: Optional[str], db: Databases) -> lis
         )
         documents = purchase_list['documents']
         for doc in documents:
-            items_str = doc.get('items_received')
-            if isinstance(items_str, str) and items_str:
-                try:
-                    # Parse the string and replace the original string with the list of items
-                    doc['items_received'] = json.loads(items_str).get('items', [])
-                except json.JSONDecodeError:
-                    # If the string is not valid JSON, default to an empty list to prevent crashes
-                    doc['items_received'] = []
-            else:
-                 # If the field is missing or not a string, ensure it's a list
-                doc['items_received'] = []
+            _decode_items_received(doc)
 
         return documents
 
@@ -150,6 +166,82 @@ async def get_purchase_history(supplier_id: Optional[str], db: Databases) -> lis
     
 
 
+SUMMARY_ATTRIBUTES = ["$id", "supplier_id", "purchase_date", "total_amount_owed", "payment_status",
+                      "amount_paid", "remaining_balance"]
+
+@traced()
+async def get_purchase_history_page(
+    db: Databases,
+    limit: int,
+    cursor: Optional[str] = None,
+    supplier_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    summary: bool = True
+) -> dict:
+    """
+    A page of purchase orders, newest first, optionally for one supplier and/or a
+    purchase_date range. Pages are chained by cursor (the last order's ID) rather than
+    offset, so deep pages cost the same as the first.
+
+    In summary mode (the default) items_received isn't even read, let alone decoded;
+    get_purchase_order() returns one order with its items.
+    """
+    page_queries = [Query.order_desc("purchase_date"), Query.limit(limit + 1)]
+    if supplier_id:
+        page_queries.append(Query.equal("supplier_id", supplier_id))
+    if start_date:
+        page_queries.append(Query.greater_than_equal("purchase_date", start_date))
+    if end_date:
+        page_queries.append(Query.less_than_equal("purchase_date", end_date))
+    if summary:
+        page_queries.append(Query.select(SUMMARY_ATTRIBUTES))
+    if cursor:
+        page_queries.append(Query.cursor_after(cursor))
+    try:
+        purchase_list = await run_in_threadpool(
+            db.list_documents,
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID,
+            queries=page_queries
+        )
+    except AppwriteException as e:
+        if e.code == 400 and cursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor '{cursor}'.")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+    # One extra order was fetched to tell whether there's a next page
+    documents = purchase_list['documents'][:limit]
+    has_more = len(purchase_list['documents']) > limit
+    if not summary:
+        for doc in documents:
+            _decode_items_received(doc)
+    return {
+        "total": purchase_list['total'],
+        "limit": limit,
+        "next_cursor": documents[-1]['$id'] if has_more else None,
+        "data": documents
+    }
+
+@traced()
+async def get_purchase_order(purchase_id: str, db: Databases) -> dict:
+    """Fetches one purchase order with its decoded line items."""
+    try:
+        purchase_order = await run_in_threadpool(
+            db.get_document,
+            database_id=config.APPWRITE_DATABASE_ID,
+            collection_id=config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID,
+            document_id=purchase_id
+        )
+    except AppwriteException as e:
+        if e.code == 404:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Purchase order with ID '{purchase_id}' not found.")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    _decode_items_received(purchase_order)
+    return purchase_order
+
+
+@traced()
 async def mark_purchase_order_as_paid(purchase_id: str, db: Databases) -> dict:
     """Updates a purchase order's status from 'Unpaid' to 'Paid'."""
     try:
@@ -179,16 +271,10 @@ async def mark_purchase_order_as_paid(purchase_id: str, db: Databases) -> dict:
     document_id=purchase_id,
     data=update_data
         )
+        copy_to_local_mirrors(config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID, [updated_po])
+        report_cache.invalidate()
 
-        # normalize items_received
-        items_str = updated_po.get('items_received')
-        if isinstance(items_str, str):
-            try:
-                updated_po['items_received'] = json.loads(items_str).get('items', [])
-            except json.JSONDecodeError:
-                updated_po['items_received'] = []
-        else:
-            updated_po['items_received'] = []
+        _decode_items_received(updated_po)
 
         return updated_po
         
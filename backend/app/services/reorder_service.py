@@ -0,0 +1,174 @@
+import logging
+import math
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from appwrite.exception import AppwriteException
+from appwrite.query import Query
+from appwrite.services.databases import Databases
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from app.core import config, precomputed, queries, sales_facts
+from app.core.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+
+class ReorderPlanner:
+    """
+    Keeps per-product daily sales and each product's latest supplier up to date
+    incrementally, and derives reorder suggestions from them.
+
+    Each refresh only reads sale lines appended to the sales fact store since the
+    last refresh, and batches created since the last refresh. Current stock is read
+    only for products that sold within the velocity window.
+    """
+
+    def __init__(self, store: sales_facts.SalesFactStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._rows_seen = 0
+        self._daily: Dict[int, Counter] = defaultdict(Counter)  # shop-time day -> product_id -> units
+        self._batches_seen_until: Optional[str] = None  # $createdAt of the newest batch seen
+        self._latest_supplier: Dict[str, Tuple[str, Optional[str]]] = {}  # product_id -> (date_received, supplier_id)
+        self.snapshot: Optional[dict] = None
+
+    def _fold_new_sales(self, today: int):
+        columns, rows = self.store.read_rows(self._rows_seen)
+        if len(columns["sold_at"]):
+            days = (columns["sold_at"] + sales_facts.SHOP_UTC_OFFSET_SECONDS) // 86400
+            recent = days > today - config.REORDER_VELOCITY_WINDOW_DAYS
+            # Sum units per (day, product) in one pass
+            pairs, inverse = np.unique(np.stack([days[recent], columns["product"][recent]]), axis=1, return_inverse=True)
+            units = np.bincount(inverse.ravel(), weights=columns["quantity"][recent], minlength=pairs.shape[1])
+            product_ids = self.store.decode("product", pairs[1])
+            for day, product_id, quantity in zip(pairs[0], product_ids, units):
+                self._daily[int(day)][product_id] += int(quantity)
+        self._rows_seen = rows
+        for day in [day for day in self._daily if day <= today - config.REORDER_VELOCITY_WINDOW_DAYS]:
+            del self._daily[day]
+
+    def _fold_new_batches(self, db: Databases):
+        cursor = None
+        while True:
+            queries = [Query.order_asc("$createdAt"), Query.limit(PAGE_SIZE)]
+            if self._batches_seen_until:
+                # Re-reading the boundary instant is harmless; updates below are idempotent
+                queries.append(Query.greater_than_equal("$createdAt", self._batches_seen_until))
+            if cursor:
+                queries.append(Query.cursor_after(cursor))
+            batches = db.list_documents(
+                database_id=config.APPWRITE_DATABASE_ID,
+                collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
+                queries=queries
+            )["documents"]
+            for batch in batches:
+                latest = self._latest_supplier.get(batch["product_id"])
+                if latest is None or batch["date_received"] >= latest[0]:
+                    self._latest_supplier[batch["product_id"]] = (batch["date_received"], batch.get("supplier_id"))
+            if len(batches) < PAGE_SIZE:
+                if batches:
+                    self._batches_seen_until = batches[-1]["$createdAt"]
+                return
+            cursor = batches[-1]["$id"]
+
+    def refresh(self, db: Databases) -> dict:
+        with self._lock:
+            now = datetime.now(timezone.utc)
+            today = (int(now.timestamp()) + sales_facts.SHOP_UTC_OFFSET_SECONDS) // 86400
+            self._fold_new_sales(today)
+            self._fold_new_batches(db)
+
+            units_in_window = Counter()
+            for counts in self._daily.values():
+                units_in_window.update(counts)
+            products = queries.get_by_ids(db, config.APPWRITE_COLLECTION_PRODUCTS_ID, list(units_in_window))
+
+            items_by_supplier = defaultdict(list)
+            for product_id, units in units_in_window.items():
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                velocity = units / config.REORDER_VELOCITY_WINDOW_DAYS
+                supplier_id = self._latest_supplier.get(product_id, (None, None))[1]
+                lead_time = lead_time_days(supplier_id)
+                stock = product.get("current_total_stock", 0)
+                days_of_cover = stock / velocity
+                if days_of_cover > lead_time + config.REORDER_SAFETY_DAYS:
+                    continue
+                items_by_supplier[supplier_id].append({
+                    "product_id": product_id,
+                    "product_name": product.get("product_name"),
+                    "product_code": product.get("product_code"),
+                    "current_stock": stock,
+                    "units_per_day": round(velocity, 2),
+                    "days_of_cover": round(days_of_cover, 1),
+                    "suggested_quantity": max(math.ceil(velocity * (lead_time + config.REORDER_COVER_DAYS) - stock), 0),
+                })
+
+            suppliers = queries.get_by_ids(db, config.APPWRITE_COLLECTION_SUPPLIERS_ID, [s for s in items_by_supplier if s])
+            groups = []
+            for supplier_id, items in items_by_supplier.items():
+                items.sort(key=lambda item: item["days_of_cover"])
+                groups.append({
+                    "supplier_id": supplier_id,
+                    "supplier_name": suppliers.get(supplier_id, {}).get("name"),
+                    "lead_time_days": lead_time_days(supplier_id),
+                    "items": items,
+                })
+            # Most urgent supplier first
+            groups.sort(key=lambda group: group["items"][0]["days_of_cover"])
+
+            self.snapshot = {
+                "generated_at": now.isoformat(),
+                "velocity_window_days": config.REORDER_VELOCITY_WINDOW_DAYS,
+                "suppliers": groups,
+            }
+            return self.snapshot
+
+
+def lead_time_days(supplier_id: Optional[str]) -> float:
+    return config.REORDER_LEAD_TIME_OVERRIDES.get(supplier_id, config.REORDER_DEFAULT_LEAD_TIME_DAYS)
+
+
+_planner: Optional[ReorderPlanner] = None
+_planner_lock = threading.Lock()
+
+
+def get_planner() -> Optional[ReorderPlanner]:
+    """The planner over the sales fact store, or None while the store is disabled or not open yet."""
+    global _planner
+    with _planner_lock:
+        if _planner is None and sales_facts.store is not None:
+            _planner = ReorderPlanner(sales_facts.store)
+        return _planner
+
+
+def refresh_reorder_suggestions(db: Databases):
+    """Scheduled job: recomputes the suggestions and publishes them to all workers."""
+    planner = get_planner()
+    if planner is not None:
+        precomputed.save("reorder_suggestions", planner.refresh(db))
+
+
+@traced()
+async def get_reorder_suggestions(db: Databases) -> dict:
+    """The latest precomputed suggestions, computing them now if the job hasn't run yet."""
+    planner = get_planner()
+    if planner is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Reorder suggestions need the sales fact store, which is disabled."
+        )
+    result = precomputed.load("reorder_suggestions")
+    if result is not None:
+        return result["value"]
+    try:
+        return await run_in_threadpool(planner.refresh, db)
+    except AppwriteException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
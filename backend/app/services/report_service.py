@@ -1,110 +1,181 @@
-import json
+import asyncio
+from functools import partial
 from appwrite.services.databases import Databases
 from appwrite.query import Query
 from fastapi import HTTPException, status
 from app.core import config
-from typing import Optional
+from app.core import tracing
+from app.core import sales_facts
+from app.core import sales_index
+from app.core import precomputed
+from app.core import report_cache
+from app.core import queries
+from app.core import aggregation, cpu_pool
+from app.services import product_service
+from app.core.utils import get_current_ist_time
+from app.core.tracing import traced
+from typing import List, Optional, Sequence
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
 from appwrite.exception import AppwriteException
 from appwrite.id import ID
+from fastapi.concurrency import run_in_threadpool
 
 
-async def get_financial_summary(start_date: str, end_date: str, db: Databases) -> dict:
-    """
-    Calculates key financial metrics for a given date range and overall values.
-    Optimized to avoid N+1 queries for batch lookups.
-    """
-    try:
-        # --- 1. Fetch all sales in the given range ---
-        sales_in_range = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
-            queries=[
-                Query.greater_than_equal("sale_date_time", start_date),
-                Query.less_than_equal("sale_date_time", end_date)
-            ]
-        )['documents']
+class _FanOut:
+    """Runs sync sub-queries in the threadpool, at most `limit` at a time, timing each one."""
 
-        total_sales = sum(sale['grand_total'] for sale in sales_in_range)
-        total_tax_collected = sum(sale['total_tax_amount'] for sale in sales_in_range)
+    def __init__(self, limit: int):
+        self._slots = asyncio.Semaphore(limit)
+        self.timings_ms = {}
 
-        # --- 2. Collect all batch_ids from sales items ---
-        batch_ids = set()
-        sale_items_map = {}  # sale_id -> list of items
-        for sale in sales_in_range:
+    async def run(self, name: str, func, *args):
+        async with self._slots:
+            started = perf_counter()
             try:
-                items_data = json.loads(sale['items_sold'])
-                items_list = items_data.get("items", [])
-                sale_items_map[sale['$id']] = items_list
-
-                for item in items_list:
-                    if "batch_id" in item:
-                        batch_ids.add(item["batch_id"])
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"WARNING: Could not parse items_sold for sale '{sale['$id']}'. Error: {e}")
-                sale_items_map[sale['$id']] = []
-
-        # --- 3. Fetch all needed batches in one query ---
-        batch_map = {}
-        if batch_ids:
-            batches = db.list_documents(
-                database_id=config.APPWRITE_DATABASE_ID,
-                collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
-                queries=[Query.contains("$id", list(batch_ids))]
-            )['documents']
-            batch_map = {b["$id"]: b["cost_price"] for b in batches}
+                return await run_in_threadpool(func, *args)
+            finally:
+                self.timings_ms[name] = round((perf_counter() - started) * 1000, 1)
+
+
+def _fetch_sales_in_range(start_date: str, end_date: str, db: Databases) -> List[aggregation.SaleRow]:
+    """Every sale in a date range, reduced to the fields the summary needs."""
+    sales_in_range = queries.list_all(db, config.APPWRITE_COLLECTION_SALES_ORDERS_ID, [
+        Query.greater_than_equal("sale_date_time", start_date),
+        Query.less_than_equal("sale_date_time", end_date),
+        Query.select(["$id", "grand_total", "total_tax_amount", "items_sold"])
+    ])
+    tracing.set_attributes({"sales.count": len(sales_in_range)})
+    return [(sale['$id'], sale['grand_total'], sale['total_tax_amount'], sale['items_sold']) for sale in sales_in_range]
+
+
+def _fetch_batch_costs(batch_ids: List[str], db: Databases) -> dict:
+    """batch_id -> cost_price, in as few queries as Appwrite's value limit allows."""
+    batches = queries.get_by_ids(db, config.APPWRITE_COLLECTION_BATCHES_ID, batch_ids)
+    tracing.set_attributes({"batch.count": len(batch_ids)})
+    return {batch_id: batch["cost_price"] for batch_id, batch in batches.items()}
+
+
+def _sum_operating_costs(start_date: str, end_date: str, db: Databases) -> float:
+    costs_in_range = queries.list_all(db, config.APPWRITE_COLLECTION_OPERATING_COSTS_ID, [
+        Query.greater_than_equal("expense_date", start_date),
+        Query.less_than_equal("expense_date", end_date),
+        Query.select(["$id", "amount"])
+    ])
+    return sum(cost['amount'] for cost in costs_in_range)
+
+
+def _list_stocked_batches(db: Databases, fields: Sequence[str] = ()) -> List[dict]:
+    """Batches with stock on hand, with their quantity, cost price and `fields`."""
+    return queries.list_all(db, config.APPWRITE_COLLECTION_BATCHES_ID, [
+        Query.greater_than("quantity_in_stock", 0),
+        Query.select(["$id", "quantity_in_stock", "cost_price", *fields])
+    ])
+
+
+def _stock_value(batches: List[dict]) -> float:
+    return sum(batch['quantity_in_stock'] * batch['cost_price'] for batch in batches)
+
+
+def _sum_inventory_value(db: Databases) -> float:
+    return _stock_value(_list_stocked_batches(db))
+
 
+def _sum_vendor_dues(db: Databases) -> float:
+    unpaid_pos = queries.list_all(db, config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID, [
+        Query.equal("payment_status", "Unpaid"),
+        Query.select(["$id", "remaining_balance"])
+    ])
+    return sum(po['remaining_balance'] for po in unpaid_pos)
+
+
+async def _compute_period_totals(start_date: str, end_date: str, db: Databases, fan_out: _FanOut) -> dict:
+    """Sales, tax, COGS and operating costs within a date range."""
+
+    async def sales_and_cogs():
+        # --- 1. Fetch all sales in the given range ---
+        rows = await fan_out.run("sales", _fetch_sales_in_range, start_date, end_date, db)
+        # --- 2. Parse items_sold and total quantities per batch, on all cores ---
+        started = perf_counter()
+        sales = aggregation.merge_sales_summaries(await cpu_pool.run_chunked(aggregation.summarize_sales, rows))
+        fan_out.timings_ms["sales_aggregation"] = round((perf_counter() - started) * 1000, 1)
+        # --- 3. Fetch the batches of all sold items ---
+        quantity_by_batch = sales.pop("quantity_by_batch")
+        batch_map = await fan_out.run("batch_costs", _fetch_batch_costs, list(quantity_by_batch), db) if quantity_by_batch else {}
         # --- 4. Compute COGS ---
-        total_cogs = 0.0
-        for sale_id, items_list in sale_items_map.items():
-            for item in items_list:
-                if "batch_id" in item:
-                    cost_price = batch_map.get(item["batch_id"], 0)
-                    total_cogs += item.get("quantity", 0) * cost_price
-
-        # --- 5. Operating Costs in date range ---
-        costs_in_range = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_OPERATING_COSTS_ID,
-            queries=[
-                Query.greater_than_equal("expense_date", start_date),
-                Query.less_than_equal("expense_date", end_date)
-            ]
-        )['documents']
-        total_operating_costs = sum(cost['amount'] for cost in costs_in_range)
+        sales["total_cogs"] = sum(quantity * batch_map.get(batch_id, 0) for batch_id, quantity in quantity_by_batch.items())
+        return sales
 
-        # --- 6. Total Profit ---
-        total_profit = total_sales - total_cogs - total_operating_costs
+    # --- 5. Operating Costs in date range, fetched alongside ---
+    sales, total_operating_costs = await asyncio.gather(
+        sales_and_cogs(),
+        fan_out.run("operating_costs", _sum_operating_costs, start_date, end_date, db)
+    )
+    return {**sales, "total_operating_costs": total_operating_costs}
 
-        # --- 7. Current Inventory Value (not date-filtered) ---
-        all_active_batches = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_BATCHES_ID,
-            queries=[Query.greater_than("quantity_in_stock", 0)]
-        )['documents']
-        current_inventory_value = sum(
-            batch['quantity_in_stock'] * batch['cost_price'] for batch in all_active_batches
-        )
 
-        # --- 8. Vendor Dues (not date-filtered) ---
-        unpaid_pos = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_PURCHASE_ORDERS_ID,
-            queries=[Query.equal("payment_status", "Unpaid")]
-        )['documents']
-        vendor_dues = sum(po['remaining_balance'] for po in unpaid_pos)
+async def _compute_current_position(db: Databases, fan_out: _FanOut) -> dict:
+    """Inventory value and vendor dues as of now (not date-filtered)."""
+    # --- 7-8. Current Inventory Value and Vendor Dues ---
+    current_inventory_value, vendor_dues = await asyncio.gather(
+        fan_out.run("inventory_value", _sum_inventory_value, db),
+        fan_out.run("vendor_dues", _sum_vendor_dues, db)
+    )
+    return {"current_inventory_value": current_inventory_value, "vendor_dues": vendor_dues}
 
-        return {
+
+@traced()
+async def get_financial_summary(
+    start_date: str,
+    end_date: str,
+    db: Databases,
+    cached: bool = True,
+    with_timings: bool = False
+) -> dict:
+    """
+    Calculates key financial metrics for a given date range and overall values.
+    Optimized to avoid N+1 queries for batch lookups.
+
+    Independent queries run concurrently (at most REPORT_QUERY_CONCURRENCY at a
+    time), so the latency is about that of the slowest chain. The date-range totals
+    and the current position are cached separately (see app/core/report_cache.py):
+    a sale invalidates only the ranges it falls in, plus the current position.
+    With `with_timings`, the duration of each query run for this call is included.
+    """
+    fan_out = _FanOut(config.REPORT_QUERY_CONCURRENCY)
+    period_totals = partial(_compute_period_totals, start_date, end_date, db, fan_out)
+    current_position = partial(_compute_current_position, db, fan_out)
+    try:
+        if cached:
+            period, position = await asyncio.gather(
+                report_cache.cache.get("financial-summary", start_date, end_date, period_totals),
+                report_cache.cache.get("financial-position", None, None, current_position)
+            )
+        else:
+            period, position = await asyncio.gather(period_totals(), current_position())
+
+        # --- 6. Total Profit ---
+        total_profit = period["total_sales"] - period["total_cogs"] - period["total_operating_costs"]
+
+        summary = {
             "total_profit": round(total_profit, 2),
-            "total_sales": round(total_sales, 2),
-            "total_tax_collected": round(total_tax_collected, 2),
-            "current_inventory_value": round(current_inventory_value, 2),
-            "vendor_dues": round(vendor_dues, 2)
+            "total_sales": round(period["total_sales"], 2),
+            "total_tax_collected": round(period["total_tax_collected"], 2),
+            "current_inventory_value": round(position["current_inventory_value"], 2),
+            "vendor_dues": round(position["vendor_dues"], 2)
         }
+        if with_timings:
+            # Queries answered from the cache don't show up
+            summary["query_timings_ms"] = dict(fan_out.timings_ms)
+        return summary
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@traced()
 async def create_operating_cost(cost_data: dict, db: Databases) -> dict:
     """Creates a new operating cost document."""
     try:
@@ -116,22 +187,27 @@ async def create_operating_cost(cost_data: dict, db: Databases) -> dict:
             document_id=ID.unique(),
             data=cost_data
         )
+        report_cache.invalidate(cost_data.get("expense_date"))
         return new_cost_document
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
-async def get_sales_history(db: Databases, limit: int, offset: int) -> list:
-    """Fetches a paginated list of all sales orders, newest first."""
+@traced()
+async def get_sales_history(db: Databases, limit: int, offset: int, fields: Optional[List[str]] = None) -> list:
+    """Fetches a paginated list of all sales orders (or just `fields` of them), newest first."""
     try:
+        sales_queries = [
+            Query.order_desc("sale_date_time"),
+            Query.limit(limit),   # <-- Appwrite's limit query
+            Query.offset(offset)  # <-- Appwrite's offset query
+        ]
+        if fields:
+            sales_queries.append(Query.select(fields))
         sales_list = db.list_documents(
             database_id=config.APPWRITE_DATABASE_ID,
             collection_id=config.APPWRITE_COLLECTION_SALES_ORDERS_ID,
-            queries=[
-                Query.order_desc("sale_date_time"),
-                Query.limit(limit),   # <-- Appwrite's limit query
-                Query.offset(offset)  # <-- Appwrite's offset query
-            ]
+            queries=sales_queries
         )
         return {
             "total": sales_list['total'],
@@ -144,6 +220,29 @@ async def get_sales_history(db: Databases, limit: int, offset: int) -> list:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
+@traced()
+async def get_sales_containing(kind: str, key: str, limit: int, offset: int, db: Databases) -> dict:
+    """
+    A page of the sales that contain a product or batch (`kind` is "product" or
+    "batch"), newest first, with the quantity of it each one sold. The sale IDs come
+    from the sales index; only that page's sales orders are read from Appwrite.
+    """
+    if sales_index.index is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The sales index is disabled.")
+    total, hits = await run_in_threadpool(sales_index.index.lookup, kind, key, limit, offset)
+    try:
+        sales = await run_in_threadpool(
+            queries.get_by_ids, db, config.APPWRITE_COLLECTION_SALES_ORDERS_ID, [hit["sale_id"] for hit in hits],
+            [Query.select(["$id", "bill_number", "sale_date_time", "grand_total", "payment_method"])]
+        )
+    except AppwriteException as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    # A sale missing from Appwrite (deleted since it was indexed) is left out of the page
+    data = [{**sales[hit["sale_id"]], "quantity": hit["quantity"]} for hit in hits if hit["sale_id"] in sales]
+    return {"total": total, "limit": limit, "offset": offset, "data": data}
+
+
+@traced()
 async def get_sale_details_by_id(sale_id: str, db: Databases) -> dict:
     """Fetches a single sales order document by its Appwrite Document ID."""
     try:
@@ -162,6 +261,7 @@ async def get_sale_details_by_id(sale_id: str, db: Databases) -> dict:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
+@traced()
 async def get_operating_costs(start_date: str, end_date: str, db: Databases) -> list:
     """Fetches all operating costs within a given date range."""
     try:
@@ -176,4 +276,157 @@ async def get_operating_costs(start_date: str, end_date: str, db: Databases) ->
         )
         return costs_list['documents']
     except AppwriteException as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@traced()
+async def get_sales_aggregates(start_date: Optional[str], end_date: Optional[str], group_by: Optional[str]) -> dict:
+    """
+    Sums sale lines from the columnar sales fact store, optionally grouped by
+    product, batch or day. Answers without any Appwrite reads.
+    """
+    if sales_facts.store is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The sales fact store is disabled.")
+    try:
+        rows = await run_in_threadpool(sales_facts.store.aggregate, start_date, end_date, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    tracing.set_attributes({"facts.groups": len(rows)})
+    return {"group_by": group_by, "rows": rows}
+
+
+PRODUCT_SORT_FIELDS = ("units_sold", "revenue", "cogs", "gross_profit", "gross_margin_percent", "discount_given", "units_per_day")
+
+
+@traced()
+async def get_product_performance(
+    start_date: str,
+    end_date: str,
+    days_in_range: int,
+    sort_by: str,
+    descending: bool,
+    limit: int,
+    db: Databases
+) -> List[dict]:
+    """
+    Per-product units sold, revenue, COGS, gross margin, discount given and sales
+    velocity over a date range. The totals come from one grouped pass over the sales
+    fact store; only the names of the returned products are read from Appwrite.
+    """
+    if sales_facts.store is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The sales fact store is disabled.")
+    if sort_by not in PRODUCT_SORT_FIELDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"sort_by must be one of {PRODUCT_SORT_FIELDS}")
+
+    groups = await run_in_threadpool(sales_facts.store.aggregate, start_date, end_date, "product")
+    rows = []
+    for group in groups:
+        gross_profit = group["revenue"] - group["cost"]
+        rows.append({
+            "product_id": group["key"],
+            "units_sold": group["quantity"],
+            "revenue": group["revenue"],
+            "cogs": group["cost"],
+            "gross_profit": round(gross_profit, 2),
+            "gross_margin_percent": round(gross_profit / group["revenue"] * 100, 2) if group["revenue"] else 0.0,
+            "discount_given": group["discount"],
+            "units_per_day": round(group["quantity"] / max(days_in_range, 1), 2),
+        })
+    rows.sort(key=lambda row: row[sort_by], reverse=descending)
+    rows = rows[:limit]
+    tracing.set_attributes({"products.count": len(groups)})
+
+    products = await product_service.get_products_by_ids([row["product_id"] for row in rows], db)
+    for row in rows:
+        product = products.get(row["product_id"], {})
+        # Products deleted since the sale still show up, without a name
+        row["product_name"] = product.get("product_name")
+        row["product_code"] = product.get("product_code")
+    return rows
+
+
+@traced()
+async def get_sales_series(start_date: date, end_date: date, bucket: str) -> dict:
+    """
+    Sales, tax, COGS and bill count per hour/day/week/month (IST) for a date range,
+    from the sales fact store's hourly rollup. Empty buckets are included as zeros.
+    """
+    if sales_facts.store is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The sales fact store is disabled.")
+    if end_date < start_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end_date must not be before start_date.")
+    try:
+        points = await run_in_threadpool(sales_facts.store.series, start_date, end_date, bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    tracing.set_attributes({"series.points": len(points)})
+    return {"bucket": bucket, "points": points}
+
+
+# --- Precomputed reports (run by the scheduler, see app/jobs.py) ---
+
+def _daily_summary_name(day: date) -> str:
+    return f"daily_summary_{day.isoformat()}"
+
+
+async def run_end_of_day_summary(db: Databases):
+    """Scheduled job: stores today's (IST) financial summary."""
+    today = get_current_ist_time().date()
+    summary = await get_financial_summary(
+        datetime.combine(today, time.min).isoformat(),
+        datetime.combine(today, time.max).isoformat(),
+        db,
+        cached=False  # other workers' writes don't invalidate this worker's cache
+    )
+    precomputed.save(_daily_summary_name(today), summary)
+
+
+@traced()
+async def get_daily_summaries(start_date: date, end_date: date) -> List[dict]:
+    """The stored end-of-day summaries between two dates. Days without one are left out."""
+    summaries = []
+    day = start_date
+    while day <= end_date:
+        result = precomputed.load(_daily_summary_name(day))
+        if result is not None:
+            summaries.append({"date": day, "computed_at": result["computed_at"], **result["value"]})
+        day += timedelta(days=1)
+    return summaries
+
+
+def compute_inventory_valuation(db: Databases) -> dict:
+    """Cost value of all stock on hand, in total and per product."""
+    batches = _list_stocked_batches(db, ["product_id"])
+    batches_by_product = {}
+    for batch in batches:
+        batches_by_product.setdefault(batch['product_id'], []).append(batch)
+
+    products = sorted(
+        ({
+            "product_id": product_id,
+            "units": sum(batch['quantity_in_stock'] for batch in product_batches),
+            "value": round(_stock_value(product_batches), 2)
+        } for product_id, product_batches in batches_by_product.items()),
+        key=lambda row: row["value"],
+        reverse=True
+    )
+    return {"total_value": round(_stock_value(batches), 2), "products": products}
+
+
+def run_inventory_valuation(db: Databases):
+    """Scheduled job: stores the current inventory valuation."""
+    precomputed.save("inventory_valuation", compute_inventory_valuation(db))
+
+
+@traced()
+async def get_inventory_valuation(db: Databases) -> dict:
+    """The latest precomputed inventory valuation, computing it now if the job hasn't run yet."""
+    result = precomputed.load("inventory_valuation")
+    if result is None:
+        try:
+            value = await run_in_threadpool(compute_inventory_valuation, db)
+        except AppwriteException as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        precomputed.save("inventory_valuation", value)
+        result = precomputed.load("inventory_valuation")
+    return {"computed_at": result["computed_at"], **result["value"]}
@@ -1,20 +1,17 @@
 from appwrite.services.databases import Databases
-from appwrite.query import Query
 from appwrite.id import ID
 from appwrite.exception import AppwriteException
 from fastapi import HTTPException, status
-from app.core import config
+from app.core import config, search_index, unique_index
+from app.core.tracing import traced
+from typing import Optional
 
+@traced()
 async def create_supplier(supplier_data: dict, db: Databases) -> dict:
     """Creates a new supplier document in the suppliers collection."""
     try:
         # Check for uniqueness of supplier name
-        name_check = db.list_documents(
-            database_id=config.APPWRITE_DATABASE_ID,
-            collection_id=config.APPWRITE_COLLECTION_SUPPLIERS_ID,
-            queries=[Query.equal("name", supplier_data["name"])]
-        )
-        if name_check['total'] > 0:
+        if unique_index.is_taken(unique_index.suppliers_by_name, supplier_data["name"], db):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A supplier with this name already exists.")
             
         # If the check passes, create the document
@@ -24,10 +21,13 @@ async def create_supplier(supplier_data: dict, db: Databases) -> dict:
             document_id=ID.unique(),
             data=supplier_data
         )
+        unique_index.record(new_supplier, config.APPWRITE_COLLECTION_SUPPLIERS_ID)
+        search_index.record(new_supplier, config.APPWRITE_COLLECTION_SUPPLIERS_ID)
         return new_supplier
     except AppwriteException as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
+@traced()
 async def get_all_suppliers(db: Databases) -> list:
     """Fetches all documents from the suppliers collection."""
     try:
@@ -40,6 +40,16 @@ async def get_all_suppliers(db: Databases) -> list:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     
 
+@traced()
+async def search_suppliers(query: Optional[str], limit: int, offset: int) -> dict:
+    """
+    A page of the suppliers whose name has words starting with those of `query`, or
+    whose contact contains its digits, sorted by name. All suppliers without a query.
+    Served from the in-process search index, without Appwrite reads.
+    """
+    return search_index.search_page(search_index.suppliers, query, limit, offset)
+
+@traced()
 async def get_supplier_by_id(supplier_id: str, db: Databases) -> dict:
     """Fetches a single supplier document by its Appwrite Document ID."""
     try:
@@ -0,0 +1,91 @@
+"""
+Compares the stored size and decode speed of line items in the legacy JSON
+format and the compact format (app/core/item_codec.py), on generated carts
+shaped like the ones checkout writes.
+
+    cd backend && python -m benchmarks.item_codec_benchmark [--carts 5000] [--seed 1]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+
+from app.core import item_codec
+
+
+def _appwrite_id() -> str:
+    return uuid.uuid4().hex[:20]
+
+
+def make_carts(count: int, rng: random.Random) -> list:
+    catalogue = [
+        {
+            "product_id": _appwrite_id(),
+            "product_name": f"{rng.choice(['Milk', 'Bread', 'Rice', 'Soap', 'Tea', 'Oil', 'Sugar'])} {rng.choice(['500g', '1kg', '1L', 'Pack of 4'])}",
+            "product_code": f"SKU{rng.randrange(10000, 99999)}",
+            "batches": [_appwrite_id() for _ in range(rng.randint(1, 3))],
+            "price": round(rng.uniform(10, 500), 2),
+            "tax": rng.choice([0.0, 5.0, 12.0, 18.0]),
+        }
+        for _ in range(300)
+    ]
+    carts = []
+    for _ in range(count):
+        items = []
+        # Mostly small baskets, with the occasional large one
+        for product in rng.sample(catalogue, min(int(rng.expovariate(1 / 6)) + 1, 60)):
+            price = product["price"]
+            items.append({
+                "product_id": product["product_id"],
+                "product_name": product["product_name"],
+                "product_code": product["product_code"],
+                "batch_id": rng.choice(product["batches"]),
+                "quantity": rng.randint(1, 5),
+                "cost_price_per_unit": round(price * 0.8, 2),
+                "original_selling_price_per_unit": price,
+                "actual_selling_price_per_unit": price if rng.random() < 0.9 else round(price * 0.95, 2),
+                "tax_percentage_at_sale": product["tax"],
+            })
+        carts.append(items)
+    return carts
+
+
+def _time_decode(stored: list, decode) -> float:
+    started = time.perf_counter()
+    for value in stored:
+        decode(value)
+    return (time.perf_counter() - started) / len(stored) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--carts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    carts = make_carts(args.carts, random.Random(args.seed))
+    legacy = [json.dumps({"items": items}) for items in carts]
+    compact = [item_codec.encode_items(items) for items in carts]
+    assert all(value.startswith(item_codec.PREFIX) for value in compact), "run with ITEM_ENCODING=compact"
+    assert all(item_codec.decode_items(value) == items for value, items in zip(compact, carts))
+
+    lines = [len(items) for items in carts]
+    print(f"{len(carts)} carts, {statistics.mean(lines):.1f} lines on average (max {max(lines)})\n")
+    print(f"{'format':<18}{'avg bytes':>12}{'p95 bytes':>12}{'decode us/cart':>16}")
+    results = [
+        ("json", legacy, lambda value: json.loads(value)["items"]),
+        ("json+", legacy, item_codec.decode_items),  # orjson when installed
+        ("compact", compact, item_codec.decode_items),
+        # What the financial summary reads: two fields per line
+        ("json+ 2 fields", legacy, lambda value: item_codec.decode_columns(value, ("batch_id", "quantity"))),
+        ("compact 2 fields", compact, lambda value: item_codec.decode_columns(value, ("batch_id", "quantity"))),
+    ]
+    for name, stored, decode in results:
+        sizes = sorted(len(value) for value in stored)
+        print(f"{name:<18}{statistics.mean(sizes):>12.0f}{sizes[int(len(sizes) * 0.95)]:>12}{_time_decode(stored, decode):>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
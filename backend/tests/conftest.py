@@ -0,0 +1,97 @@
+"""
+Tests run the app against the SQLite document store (STORAGE_BACKEND=sqlite) in a
+temporary directory, so they need no Appwrite project. Settings are read when
+app.core.config is imported, so they're set here, before any app import.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_data_dir = tempfile.mkdtemp(prefix="myshopapp-tests-")
+os.environ.update({
+    "APPWRITE_PROJECT_ID": "test",
+    "APPWRITE_API_KEY": "test",
+    "APPWRITE_DATABASE_ID": "db",
+    "APPWRITE_COLLECTION_PRODUCTS_ID": "products",
+    "APPWRITE_COLLECTION_BATCHES_ID": "batches",
+    "APPWRITE_COLLECTION_SUPPLIERS_ID": "suppliers",
+    "APPWRITE_COLLECTION_PURCHASE_ORDERS_ID": "purchase_orders",
+    "APPWRITE_COLLECTION_SALES_ORDERS_ID": "sales_orders",
+    "APPWRITE_COLLECTION_CUSTOMERS_ID": "customers",
+    "APPWRITE_COLLECTION_CUSTOMER_TRANSACTIONS_ID": "customer_transactions",
+    "APPWRITE_COLLECTION_OPERATING_COSTS_ID": "operating_costs",
+    "STORAGE_BACKEND": "sqlite",
+    "SQLITE_DATABASE_PATH": os.path.join(_data_dir, "documents.db"),
+    "SALES_FACTS_DIR": os.path.join(_data_dir, "sales_facts"),
+    "SALES_INDEX_PATH": os.path.join(_data_dir, "sales_index.db"),
+    "SCHEDULER_STATE_DIR": os.path.join(_data_dir, "scheduler"),
+    "SCHEDULER_ENABLED": "false",
+    "OFFLINE_POS_ENABLED": "false",
+    "REPORT_MIRROR_ENABLED": "false",
+    "TRACING_ENABLED": "false",
+    "PROFILING_ENABLED": "false",
+    "RETRY_BASE_DELAY_MS": "1",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app import dependencies  # noqa: E402
+from app.core import config  # noqa: E402
+from app.core.datastore import ServiceProxy  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+class FailOnce(ServiceProxy):
+    """Fails the first call of `operation` with the given Appwrite error, then passes calls through."""
+
+    def __init__(self, inner, operation: str, code: int = 503):
+        super().__init__(inner)
+        self.operation = operation
+        self.code = code
+        self.failures = 0
+
+    def _call(self, operation, method, args, kwargs):
+        from appwrite.exception import AppwriteException
+        if operation == self.operation and not self.failures:
+            self.failures += 1
+            raise AppwriteException("Injected failure", self.code)
+        return method(*args, **kwargs)
+
+
+@pytest.fixture
+def store():
+    """The SQLite document store behind the app's providers."""
+    return dependencies.document_store
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[dependencies.get_current_user] = lambda: {"$id": "test-user"}
+    with TestClient(app) as test_client:
+        yield test_client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def make_product(store):
+    """Creates a product with one batch holding its whole stock. Returns (product, batch)."""
+    def make(product_id: str, stock: int, cost_price: float = 10.0, selling_price: float = 15.0):
+        product = store.create_document(config.APPWRITE_DATABASE_ID, config.APPWRITE_COLLECTION_PRODUCTS_ID, product_id, {
+            "product_name": f"Product {product_id}",
+            "product_code": f"CODE-{product_id}",
+            "current_total_stock": stock,
+            "tax_percentage": 0.0,
+            "global_selling_price": selling_price,
+        })
+        batch = store.create_document(config.APPWRITE_DATABASE_ID, config.APPWRITE_COLLECTION_BATCHES_ID, f"{product_id}-b1", {
+            "product_id": product_id,
+            "quantity_in_stock": stock,
+            "cost_price": cost_price,
+            "selling_price": selling_price,
+            "date_received": "2026-01-01T00:00:00",
+            "is_active": True,
+        })
+        return product, batch
+    return make
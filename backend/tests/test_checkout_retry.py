@@ -0,0 +1,31 @@
+import pytest
+
+from app import dependencies
+from app.core import config, retry
+from conftest import FailOnce
+
+
+@pytest.mark.parametrize("operation", ["get_document", "update_document", "create_document"])
+def test_checkout_succeeds_after_one_503(client, store, make_product, operation):
+    product, batch = make_product(f"retry-{operation}", stock=10)
+    flaky_db = FailOnce(store, operation)
+    client.app.dependency_overrides[dependencies.get_pos_db] = lambda: retry.RetryProxy(flaky_db)
+
+    response = client.post("/pos/checkout", json={
+        "payment_method": "cash",
+        "items": [{
+            "product_id": product["$id"],
+            "batch_id": batch["$id"],
+            "quantity": 3,
+            "actual_selling_price_per_unit": 15.0,
+        }],
+    })
+
+    assert response.status_code == 201, response.text
+    assert flaky_db.failures == 1
+    # The retried call must not apply the sale twice
+    db_id = config.APPWRITE_DATABASE_ID
+    assert store.get_document(db_id, config.APPWRITE_COLLECTION_PRODUCTS_ID, product["$id"])["current_total_stock"] == 7
+    assert store.get_document(db_id, config.APPWRITE_COLLECTION_BATCHES_ID, batch["$id"])["quantity_in_stock"] == 7
+    bill_id = response.json()["sale_id"]
+    assert store.get_document(db_id, config.APPWRITE_COLLECTION_SALES_ORDERS_ID, bill_id)["$id"] == bill_id
@@ -0,0 +1,24 @@
+from app.core import config, queries
+from app.core.sqlite_backend import SQLiteDatabases
+from app.services import report_service
+
+
+def test_valuation_pages_through_every_stocked_batch(tmp_path):
+    db = SQLiteDatabases(str(tmp_path / "valuation.db"))
+    # More than one page of batches, including some that are sold out
+    for i in range(queries.PAGE_SIZE + 5):
+        db.create_document(config.APPWRITE_DATABASE_ID, config.APPWRITE_COLLECTION_BATCHES_ID, f"batch-{i:04d}", {
+            "product_id": "a" if i % 2 else "b",
+            "quantity_in_stock": 0 if i % 10 == 0 else 2,
+            "cost_price": 1.5,
+        })
+
+    valuation = report_service.compute_inventory_valuation(db)
+
+    by_product = {row["product_id"]: row for row in valuation["products"]}
+    stocked = [i for i in range(queries.PAGE_SIZE + 5) if i % 10]
+    units_a = 2 * sum(1 for i in stocked if i % 2)
+    units_b = 2 * sum(1 for i in stocked if not i % 2)
+    assert by_product["a"]["units"] == units_a and by_product["a"]["value"] == units_a * 1.5
+    assert by_product["b"]["units"] == units_b and by_product["b"]["value"] == units_b * 1.5
+    assert valuation["total_value"] == report_service._sum_inventory_value(db) == (units_a + units_b) * 1.5
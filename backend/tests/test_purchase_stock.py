@@ -0,0 +1,33 @@
+from app.core import config
+from app.services import product_service
+
+
+def test_purchase_adds_to_current_stock_not_a_stale_read(client, store, make_product, monkeypatch):
+    product, batch = make_product("stale-purchase", stock=10)
+    store.create_document(config.APPWRITE_DATABASE_ID, config.APPWRITE_COLLECTION_SUPPLIERS_ID, "stale-supplier",
+                          {"name": "Supplier", "total_due": 0.0})
+    # The purchase's validation read returns the product as it was before this sale,
+    # like a read shared with a request that started earlier
+    stale_products = {product["$id"]: dict(product)}
+
+    async def get_stale_products(product_ids, db):
+        return stale_products
+    monkeypatch.setattr(product_service, "get_products_by_ids", get_stale_products)
+
+    sale = client.post("/pos/checkout", json={
+        "payment_method": "cash",
+        "items": [{"product_id": product["$id"], "batch_id": batch["$id"], "quantity": 3,
+                   "actual_selling_price_per_unit": 15.0}],
+    })
+    assert sale.status_code == 201, sale.text
+
+    purchase = client.post("/purchases/", json={
+        "supplier_id": "stale-supplier",
+        "total_amount_owed": 50.0,
+        "payment_status": "Paid",
+        "items": [{"product_id": product["$id"], "quantity": 5, "cost_price": 10.0}],
+    })
+    assert purchase.status_code == 201, purchase.text
+
+    stock = store.get_document(config.APPWRITE_DATABASE_ID, config.APPWRITE_COLLECTION_PRODUCTS_ID, product["$id"])
+    assert stock["current_total_stock"] == 10 - 3 + 5
@@ -0,0 +1,28 @@
+from app import dependencies
+from app.core import config, report_mirror
+from app.core.sqlite_backend import SQLiteDatabases
+
+
+def test_checkout_copies_the_sale_into_the_report_mirror(client, store, make_product, monkeypatch, tmp_path):
+    product, batch = make_product("mirrored-sale", stock=10)
+    mirror = report_mirror.ReportMirror(
+        dependencies.db_provider,
+        SQLiteDatabases(str(tmp_path / "mirror.db"), indexed_attributes=report_mirror.INDEXED_ATTRIBUTES)
+    )
+    mirror.refresh()
+    monkeypatch.setattr(dependencies, "report_db_provider", mirror)
+
+    response = client.post("/pos/checkout", json={
+        "payment_method": "cash",
+        "items": [{"product_id": product["$id"], "batch_id": batch["$id"], "quantity": 4,
+                   "actual_selling_price_per_unit": 15.0}],
+    })
+    assert response.status_code == 201, response.text
+
+    # Reports recomputed after the cache is invalidated must see the sale straight away,
+    # not after the mirror's next refresh
+    db_id = config.APPWRITE_DATABASE_ID
+    sale = mirror.store.get_document(db_id, config.APPWRITE_COLLECTION_SALES_ORDERS_ID, response.json()["sale_id"])
+    assert sale["grand_total"] == 60.0
+    mirrored_batch = mirror.store.get_document(db_id, config.APPWRITE_COLLECTION_BATCHES_ID, batch["$id"])
+    assert mirrored_batch["quantity_in_stock"] == 6
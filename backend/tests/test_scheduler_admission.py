@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+from app.core import admission, config
+from app.core.scheduler import Job, Scheduler
+
+
+def test_coroutine_job_waits_for_a_slot_instead_of_being_shed(store, make_product, monkeypatch, tmp_path):
+    product, _ = make_product("job-admission", stock=1)
+    controller = admission.AdmissionController(
+        max_concurrency=1,
+        queue_limits={lane: 10 for lane in admission.LANES},
+        lane_limits={lane: 1 for lane in admission.LANES},
+        wait_timeout=5.0,
+    )
+    monkeypatch.setattr(admission, "controller", controller)
+    db = admission.AdmissionProxy(store)
+
+    async def read_product():
+        # A sync call on the event loop, as the coroutine jobs in app/jobs.py make
+        db.get_document(config.APPWRITE_DATABASE_ID, config.APPWRITE_COLLECTION_PRODUCTS_ID, product["$id"])
+
+    job = Job("read_product", read_product, schedule=None, jitter=0, single_instance=False,
+              run_at_startup=True, lane=admission.LANE_REPORTS)
+
+    # The only slot is busy for a moment when the job starts
+    controller.acquire(admission.LANE_DEFAULT)
+    threading.Timer(0.1, controller.release, args=(admission.LANE_DEFAULT,)).start()
+    asyncio.run(Scheduler(str(tmp_path))._run(job, slot=None))
+
+    assert job.failures == 0, job.last_error
+    stats = controller.stats()
+    assert stats["shed"][admission.LANE_REPORTS] == 0
+    assert stats["in_flight"][admission.LANE_REPORTS] == 0